@@ -31,25 +31,9 @@ class Branch(models.Model):
 
     def get_statistics(self):
         """Получить статистику по филиалу"""
-        from schedule.models import Schedule
-        from employees.models import Employee
-        from students.models import Student
-        from payroll.models import Expense, Salary
-        from django.db.models import Q, Sum
-
-        return {
-            "schedule_count": Schedule.objects.filter(branch=self).count(),
-            "employee_count": Employee.objects.filter(branch=self).count(),
-            "student_count": Student.objects.filter(branch=self).count(),
-            "total_expenses": Expense.objects.filter(
-                Q(schedule__branch=self) | Q(employee__branch=self)
-            ).aggregate(Sum("amount"))["amount__sum"]
-            or 0,
-            "total_salaries": Salary.objects.filter(employee__branch=self).aggregate(
-                Sum("total_payment")
-            )["total_payment__sum"]
-            or 0,
-        }
+        from core.stats import get_branch_statistics
+
+        return get_branch_statistics([self.pk])[self.pk]
 
     class Meta:
         verbose_name = "Филиал"
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
-from .models import CustomUser, Ticket
+from .models import CustomUser, TelegramOutbox, Ticket
 
 
 class CustomUserAdmin(UserAdmin):
@@ -52,4 +52,11 @@ class TicketAdmin(admin.ModelAdmin):
     list_editable = ["status"]
 
 
+@admin.register(TelegramOutbox)
+class TelegramOutboxAdmin(admin.ModelAdmin):
+    list_display = ["id", "chat_id", "status", "attempts", "next_attempt_at", "sent_at"]
+    list_filter = ["status"]
+    readonly_fields = ["created_at", "sent_at", "last_error"]
+
+
 admin.site.register(CustomUser, CustomUserAdmin)
@@ -1,8 +1,11 @@
 from ninja import Router
 from django.contrib.auth import authenticate, login, logout
-from .schemas import AuthSchema
+from django.core.exceptions import PermissionDenied
+from .rollup import monthly_stats_for
+from .schemas import AuthSchema, MonthlyStatsSchema
 
 router = Router(tags=["Auth"])
+analytics_router = Router(tags=["Analytics"])
 
 @router.post("/login/", response={200: dict, 401: dict})
 def user_login(request, data: AuthSchema):
@@ -23,3 +26,12 @@ def user_login(request, data: AuthSchema):
 def user_logout(request):
     logout(request)
     return {"success": True}
+
+
+@analytics_router.get("/monthly/", response=list[MonthlyStatsSchema])
+def monthly_stats(request, months: int = 24):
+    """Помесячные итоги по филиалам из предагрегированной таблицы"""
+    user = request.user
+    if not user.is_authenticated or user.role not in ["manager", "admin"]:
+        raise PermissionDenied
+    return monthly_stats_for(user, min(max(months, 1), 120))
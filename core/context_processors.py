@@ -1,11 +1,58 @@
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
 from .models import Ticket
 
+# Счётчики сбрасываются сигналами Ticket (core/signals.py); срок жизни —
+# страховка для изменений в обход сигналов
+COUNTS_TTL = 600
+
+OPEN_TICKETS_KEY = "tickets-open-count"
+
+
+def _unread_key(user_id):
+    return f"tickets-unread-count-{user_id}"
+
+
+def invalidate_ticket_counts(user_id):
+    """Сбрасывает общий счётчик открытых тикетов и счётчик ответов пользователя."""
+    cache.delete_many([OPEN_TICKETS_KEY, _unread_key(user_id)])
+
 
-def unread_tickets_count(request):
-    """Контекстный процессор для отображения количества тикетов с непросмотренными ответами"""
+def _cached_count(key, queryset):
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNTS_TTL)
+    return count
+
+
+def _open_tickets_count(request):
+    if request.user.is_authenticated and request.user.role == "manager":
+        return _cached_count(OPEN_TICKETS_KEY, Ticket.objects.filter(status="open"))
+    return 0
+
+
+def _unread_tickets_count(request):
     if request.user.is_authenticated:
-        unread_count = Ticket.objects.filter(
-            user=request.user, has_unread_admin_response=True
-        ).count()
-        return {"unread_tickets_count": unread_count}
-    return {"unread_tickets_count": 0}
+        return _cached_count(
+            _unread_key(request.user.pk),
+            Ticket.objects.filter(user=request.user, has_unread_admin_response=True),
+        )
+    return 0
+
+
+def ticket_counts(request):
+    """
+    Контекстный процессор счётчиков тикетов: открытые тикеты (для менеджера)
+    и непросмотренные ответы администратора (для текущего пользователя).
+
+    Значения ленивые — кэш и БД запрашиваются, только если шаблон выводит
+    счётчик.
+    """
+    return {
+        "open_tickets_count": SimpleLazyObject(lambda: _open_tickets_count(request)),
+        "unread_tickets_count": SimpleLazyObject(
+            lambda: _unread_tickets_count(request)
+        ),
+    }
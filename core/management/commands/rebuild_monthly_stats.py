@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.rollup import rebuild_monthly_stats
+
+
+class Command(BaseCommand):
+    help = "Пересобирает помесячные итоги по филиалам из платежей, расходов, зарплат и записей"
+
+    def handle(self, *args, **options):
+        rows = rebuild_monthly_stats()
+        self.stdout.write(self.style.SUCCESS(f"Пересобрано строк итогов: {rows}"))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.telegram import DEFAULT_BATCH_SIZE, deliver_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Отправляет уведомления из очереди Telegram: в цикле (воркер) "
+        "или один раз (--once, для cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Пауза в секундах, когда очередь пуста",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total_sent = total_retried = 0
+        while True:
+            sent, retried = deliver_pending(batch_size=batch_size)
+            total_sent += sent
+            total_retried += retried
+            if options["once"]:
+                if sent + retried < batch_size:
+                    break
+            elif sent + retried < batch_size:
+                time.sleep(options["interval"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Отправлено: {total_sent}, отложено до повтора: {total_retried}"
+            )
+        )
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.rollup import rebuild_monthly_stats
+
+
+def fill_monthly_stats(apps, schema_editor):
+    """Заполняет итоги по уже накопленным данным."""
+    rebuild_monthly_stats(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("branches", "0004_city_branch_city"),
+        ("core", "0011_ticket_has_unread_admin_response"),
+        ("payroll", "0005_salary_needs_recalc"),
+        ("students", "0014_attendance_bitmaps"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BranchMonthlyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="Месяц")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="Выручка",
+                    ),
+                ),
+                (
+                    "expenses",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="Расходы",
+                    ),
+                ),
+                (
+                    "salaries",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="Зарплаты",
+                    ),
+                ),
+                (
+                    "enrollments",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Записи учеников"
+                    ),
+                ),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="monthly_stats",
+                        to="branches.branch",
+                        verbose_name="Филиал",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Итоги филиала за месяц",
+                "verbose_name_plural": "Итоги филиалов по месяцам",
+                "ordering": ["month", "branch"],
+                "unique_together": {("branch", "month")},
+            },
+        ),
+        migrations.RunPython(fill_monthly_stats, migrations.RunPython.noop),
+    ]
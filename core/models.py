@@ -70,3 +70,76 @@ class Ticket(models.Model):
         verbose_name = "Тикет"
         verbose_name_plural = "Тикеты"
         ordering = ["-created_at"]
+
+
+class BranchMonthlyStats(models.Model):
+    """
+    Помесячные итоги по филиалу — предагрегированная таблица для аналитики.
+
+    Выручка относится к месяцу даты платежа, расходы, зарплаты и записи
+    учеников — к месяцу начала смены. Строки поддерживаются сигналами
+    (core/rollup.py) и пересобираются командой rebuild_monthly_stats.
+    """
+
+    branch = models.ForeignKey(
+        "branches.Branch",
+        on_delete=models.CASCADE,
+        related_name="monthly_stats",
+        verbose_name="Филиал",
+    )
+    month = models.DateField(verbose_name="Месяц")
+    revenue = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, verbose_name="Выручка"
+    )
+    expenses = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, verbose_name="Расходы"
+    )
+    salaries = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, verbose_name="Зарплаты"
+    )
+    enrollments = models.PositiveIntegerField(default=0, verbose_name="Записи учеников")
+
+    class Meta:
+        unique_together = ("branch", "month")
+        ordering = ["month", "branch"]
+        verbose_name = "Итоги филиала за месяц"
+        verbose_name_plural = "Итоги филиалов по месяцам"
+
+    def __str__(self):
+        return f"{self.branch} — {self.month:%m.%Y}"
+
+
+class TelegramOutbox(models.Model):
+    """
+    Очередь исходящих уведомлений в Telegram: одна строка — одно сообщение
+    в один чат. Сигналы только добавляют строки, доставляет их команда
+    send_telegram_notifications (core/telegram.py).
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Ожидает отправки"),
+        ("sent", "Отправлено"),
+        ("failed", "Не доставлено"),
+    ]
+
+    chat_id = models.CharField(max_length=64, verbose_name="Чат")
+    text = models.TextField(verbose_name="Текст")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="Статус"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Следующая попытка"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+        ordering = ["id"]
+        verbose_name = "Уведомление Telegram"
+        verbose_name_plural = "Очередь уведомлений Telegram"
+
+    def __str__(self):
+        return f"#{self.pk} → {self.chat_id} ({self.get_status_display()})"
@@ -0,0 +1,155 @@
+# core/pdf.py
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию; переопределяются в settings.py
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 60
+
+
+class PdfRenderError(Exception):
+    """PDF не сформирован: истёк таймаут, очередь занята или упал воркер."""
+
+
+# --- Состояние процесса-рендерера -------------------------------------------
+# Живёт в каждом воркере пула (или в текущем процессе при PDF_RENDER_WORKERS=0)
+# между заданиями: шрифты загружаются один раз.
+
+_font_config = None
+
+
+def _get_font_config():
+    global _font_config
+    if _font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def _init_worker():
+    """Прогрев воркера: импорт WeasyPrint и загрузка шрифтов до первого задания."""
+    _get_font_config()
+
+
+def _render(html_string, base_url=None):
+    from weasyprint import HTML
+
+    return HTML(string=html_string, base_url=base_url).write_pdf(
+        font_config=_get_font_config()
+    )
+
+
+# --- Пул воркеров -------------------------------------------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+
+def _settings():
+    workers = getattr(settings, "PDF_RENDER_WORKERS", DEFAULT_WORKERS)
+    timeout = getattr(settings, "PDF_RENDER_TIMEOUT", DEFAULT_TIMEOUT)
+    max_jobs = getattr(settings, "PDF_RENDER_MAX_JOBS", max(workers, 1) * 2)
+    return workers, timeout, max_jobs
+
+
+def _get_pool(workers, max_jobs):
+    global _pool, _slots
+    with _pool_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max_jobs)
+        if _pool is None and workers > 0:
+            # spawn: воркеры не наследуют соединения с БД и потоки процесса Django
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool, _slots
+
+
+def _reset_pool(broken_pool, terminate=False):
+    """
+    Отцепляет пул, чтобы следующий запрос создал новый. С terminate=True
+    воркеры убиваются: зависшее задание иначе держало бы процесс вечно.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+    if terminate:
+        # shutdown() не останавливает уже запущенные задания
+        for process in list((broken_pool._processes or {}).values()):
+            process.terminate()
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_pdf(html_string, base_url=None):
+    """
+    Рендерит HTML в PDF и возвращает байты.
+
+    Задание выполняется в пуле процессов, которые держат FontConfiguration
+    между вызовами, поэтому поток запроса не занят вёрсткой. Одновременно
+    в работе не больше PDF_RENDER_MAX_JOBS заданий; если за
+    PDF_RENDER_TIMEOUT секунд (ожидание слота и рендер вместе) PDF не готов,
+    выбрасывается PdfRenderError, а пул с зависшим воркером пересоздаётся.
+    При PDF_RENDER_WORKERS = 0 рендер идёт в текущем процессе.
+    """
+    workers, timeout, max_jobs = _settings()
+    pool, slots = _get_pool(workers, max_jobs)
+    deadline = time.monotonic() + timeout
+
+    if not slots.acquire(timeout=timeout):
+        raise PdfRenderError("Все слоты рендера PDF заняты")
+
+    if pool is None:
+        try:
+            return _render(html_string, base_url)
+        finally:
+            slots.release()
+
+    try:
+        future = pool.submit(_render, html_string, base_url)
+    except BrokenProcessPool:
+        slots.release()
+        _reset_pool(pool)
+        raise PdfRenderError("Пул рендера PDF недоступен")
+
+    # Слот освобождается, когда воркер действительно закончил, а не когда
+    # запрос перестал ждать: так ограничение держится и при таймаутах
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        if not future.cancel():
+            # Задание уже выполняется и не отменится: убиваем воркеры
+            _reset_pool(pool, terminate=True)
+        raise PdfRenderError(f"Рендер PDF не уложился в {timeout} с")
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise PdfRenderError("Воркер рендера PDF аварийно завершился")
+
+
+def pdf_response(html_string, filename):
+    """HttpResponse с PDF для просмотра в браузере; 503, если рендер не удался."""
+    try:
+        pdf = render_pdf(html_string)
+    except PdfRenderError as exc:
+        logger.warning(f"PDF {filename} не сформирован: {exc}")
+        return HttpResponse("Не удалось сформировать PDF, попробуйте позже", status=503)
+
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response["Content-Disposition"] = f"inline; filename={filename}"
+    return response
@@ -0,0 +1,145 @@
+# core/rollup.py
+"""
+Помесячные итоги по филиалам (BranchMonthlyStats).
+
+Ячейка таблицы — пара (филиал, первое число месяца). При изменении
+платежа, расхода, зарплаты или записи на смену пересчитываются только
+затронутые ячейки; rebuild_monthly_stats пересобирает таблицу целиком.
+"""
+
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+# Модель-источник -> (поле итога, агрегат, путь к дате месяца)
+SOURCES = {
+    ("students", "Payment"): ("revenue", Sum("amount"), "date"),
+    ("payroll", "Expense"): ("expenses", Sum("amount"), "schedule__start_date"),
+    ("payroll", "Salary"): ("salaries", Sum("total_payment"), "schedule__start_date"),
+    ("students", "StudentSchedule"): (
+        "enrollments",
+        Count("id"),
+        "schedule__start_date",
+    ),
+}
+
+ROLLUP_FIELDS = tuple(field for field, _, _ in SOURCES.values())
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def source_field(model):
+    """Поле итога, которое считается по строкам model."""
+    return SOURCES[(model._meta.app_label, model.__name__)][0]
+
+
+def refresh_monthly_stats(cells, fields=ROLLUP_FIELDS):
+    """
+    Пересчитывает ячейки [(branch_id, month), ...] по исходным таблицам:
+    по одному агрегату на каждое поле из fields в границах филиала и месяца.
+    Ячейка, в которой все итоги нулевые, удаляется.
+    """
+    Stats = global_apps.get_model("core", "BranchMonthlyStats")
+    for branch_id, month in {(b, month_start(m)) for b, m in cells if b and m}:
+        values = {}
+        for (app_label, model_name), (field, aggregate, date_path) in SOURCES.items():
+            if field not in fields:
+                continue
+            model = global_apps.get_model(app_label, model_name)
+            values[field] = (
+                model.objects.filter(
+                    schedule__branch_id=branch_id,
+                    **{
+                        f"{date_path}__gte": month,
+                        f"{date_path}__lt": _next_month(month),
+                    },
+                ).aggregate(total=aggregate)["total"]
+                or 0
+            )
+
+        row, _ = Stats.objects.update_or_create(
+            branch_id=branch_id, month=month, defaults=values
+        )
+        if not any(getattr(row, field) for field in ROLLUP_FIELDS):
+            row.delete()
+
+
+def rollup_cells(model, **filters):
+    """Ячейки, которые затрагивают строки model, отобранные filters."""
+    _, _, date_path = SOURCES[(model._meta.app_label, model.__name__)]
+    return set(
+        model.objects.filter(**filters)
+        .order_by()
+        .annotate(month=TruncMonth(date_path))
+        .values_list("schedule__branch_id", "month")
+        .distinct()
+    )
+
+
+def schedule_cells(schedule_ids):
+    """Все ячейки, к которым относятся данные смен (для переноса смены)."""
+    cells = set()
+    for app_label, model_name in SOURCES:
+        model = global_apps.get_model(app_label, model_name)
+        cells |= rollup_cells(model, schedule__in=schedule_ids)
+    return cells
+
+
+def rebuild_monthly_stats(apps=global_apps):
+    """
+    Пересобирает таблицу целиком: по одному GROUP BY (филиал, месяц) на
+    источник. apps — реестр моделей (исторический при вызове из миграции).
+    """
+    Stats = apps.get_model("core", "BranchMonthlyStats")
+    rows = {}
+    for (app_label, model_name), (field, aggregate, date_path) in SOURCES.items():
+        model = apps.get_model(app_label, model_name)
+        grouped = (
+            model.objects.order_by()
+            .annotate(month=TruncMonth(date_path))
+            .values("schedule__branch_id", "month")
+            .annotate(total=aggregate)
+            .values_list("schedule__branch_id", "month", "total")
+        )
+        for branch_id, month, total in grouped:
+            rows.setdefault((branch_id, month), {})[field] = total or 0
+
+    with transaction.atomic():
+        Stats.objects.all().delete()
+        Stats.objects.bulk_create(
+            [
+                Stats(branch_id=branch_id, month=month, **values)
+                for (branch_id, month), values in rows.items()
+            ],
+            batch_size=500,
+        )
+    return len(rows)
+
+
+def monthly_stats_for(user, months=24):
+    """
+    Итоги за последние months месяцев в области видимости пользователя
+    (администратор с городом — только свой город). Читает только
+    BranchMonthlyStats.
+    """
+    Stats = global_apps.get_model("core", "BranchMonthlyStats")
+    since = month_start(timezone.localdate())
+    for _ in range(months - 1):
+        since = month_start(since - timedelta(days=1))
+
+    stats = Stats.objects.filter(month__gte=since).select_related("branch")
+    if user.role == "admin" and user.city:
+        stats = stats.filter(branch__city=user.city)
+    return stats
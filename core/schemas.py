@@ -1,3 +1,5 @@
+from datetime import date
+
 from ninja import Schema
 
 class AuthSchema(Schema):
@@ -7,4 +9,18 @@ class AuthSchema(Schema):
 class UserSchema(Schema):
     id: int
     username: str
-    role: str
\ No newline at end of file
+    role: str
+
+
+class MonthlyStatsSchema(Schema):
+    branch_id: int
+    branch_name: str
+    month: date
+    revenue: float
+    expenses: float
+    salaries: float
+    enrollments: int
+
+    @staticmethod
+    def resolve_branch_name(obj):
+        return obj.branch.name
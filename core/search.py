@@ -0,0 +1,401 @@
+# core/search.py
+"""
+Глобальный поиск по ученикам, сотрудникам, лидам и сменам.
+
+Индекс — обратный, в памяти процесса: слово → документы. Слова имён
+нормализуются как в students/search.py, телефоны хранятся цифрами в
+обратном порядке, поэтому поиск по началу слова и по окончанию номера —
+бинарный поиск по отсортированному списку слов.
+
+Индекс строится при первом поиске и обновляется сигналами
+(core/signals.py). Процессов Passenger несколько, а сигнал срабатывает
+только в одном: каждое изменение увеличивает общий номер версии в кэше и
+записывает под этим номером, какие документы изменились. Процесс, у
+которого номер отстал, перечитывает только эти документы; целиком индекс
+пересобирается, лишь если часть журнала уже вытеснена из кэша.
+
+Документы читаются из БД вне _lock; под ним только меняются словари
+индекса и идёт поиск по ним.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from branches.models import Branch
+from employees.models import Employee
+from leads.models import Lead
+from schedule.models import Schedule
+from students.models import Student, StudentSchedule
+from students.search import name_tokens, phone_digits
+
+INDEX_VERSION_KEY = "global-search-version"
+# Запись журнала: какие документы изменились в версии N
+CHANGE_KEY = "global-search-change-{}"
+CHANGE_LOG_TTL = 24 * 60 * 60
+# Отставание больше этого числа версий дешевле догнать пересборкой
+MAX_REPLAY = 500
+SEARCH_LIMIT = 20
+
+# Слова телефонов отличаются от слов имён префиксом
+PHONE_PREFIX = "#"
+
+KIND_LABELS = {
+    "student": "Ученик",
+    "employee": "Сотрудник",
+    "lead": "Лид",
+    "schedule": "Смена",
+}
+KIND_URLS = {
+    "student": "student_edit",
+    "employee": "employee_edit",
+    "lead": "lead_edit",
+    "schedule": "schedule_detail",
+}
+
+
+@dataclass
+class Document:
+    kind: str
+    pk: int
+    title: str
+    subtitle: str
+    # Филиалы документа: смен ученика, сотрудника, смены; у лида — пусто
+    branches: frozenset
+    tokens: frozenset = field(default_factory=frozenset)
+
+
+def _tokens(names=(), phones=()):
+    tokens = set()
+    for name in names:
+        tokens.update(name_tokens(name))
+    for phone in phones:
+        digits = phone_digits(phone)
+        if digits:
+            tokens.add(PHONE_PREFIX + digits[::-1])
+    return frozenset(tokens)
+
+
+def _student_doc(pk, full_name, phone, parent_name, branches):
+    return Document(
+        "student",
+        pk,
+        full_name,
+        " · ".join(part for part in (parent_name, phone) if part),
+        frozenset(branches),
+        _tokens([full_name, parent_name], [phone]),
+    )
+
+
+def _employee_doc(pk, full_name, position, branch_id):
+    return Document(
+        "employee",
+        pk,
+        full_name,
+        position or "",
+        frozenset([branch_id] if branch_id else []),
+        _tokens([full_name]),
+    )
+
+
+def _lead_doc(pk, phone, parent_name, interest):
+    return Document(
+        "lead",
+        pk,
+        parent_name or phone,
+        " · ".join(part for part in (phone if parent_name else "", interest) if part),
+        frozenset(),
+        _tokens([parent_name], [phone]),
+    )
+
+
+def _schedule_doc(pk, name, start_date, branch_id):
+    return Document(
+        "schedule",
+        pk,
+        name,
+        f"с {start_date:%d.%m.%Y}",
+        frozenset([branch_id]),
+        _tokens([name]),
+    )
+
+
+def load_documents(kind, pks=None):
+    """Документы kind из БД (все или с pks) — один-два запроса на тип."""
+    if kind == "student":
+        students = Student.objects.all()
+        enrollments = StudentSchedule.objects.all()
+        if pks is not None:
+            students = students.filter(pk__in=pks)
+            enrollments = enrollments.filter(student__in=pks)
+        branches = defaultdict(set)
+        for student_id, branch_id in enrollments.values_list(
+            "student_id", "schedule__branch_id"
+        ):
+            branches[student_id].add(branch_id)
+        return [
+            _student_doc(pk, full_name, phone, parent_name, branches[pk])
+            for pk, full_name, phone, parent_name in students.values_list(
+                "pk", "full_name", "phone", "parent_name"
+            )
+        ]
+
+    querysets = {
+        "employee": (
+            _employee_doc,
+            Employee.objects.values_list(
+                "pk", "full_name", "position__name", "branch_id"
+            ),
+        ),
+        "lead": (
+            _lead_doc,
+            Lead.objects.values_list("pk", "phone", "parent_name", "interest"),
+        ),
+        "schedule": (
+            _schedule_doc,
+            Schedule.objects.values_list("pk", "name", "start_date", "branch_id"),
+        ),
+    }
+    make, rows = querysets[kind]
+    if pks is not None:
+        rows = rows.filter(pk__in=pks)
+    return [make(*row) for row in rows]
+
+
+class SearchIndex:
+    def __init__(self, version=None):
+        self.version = version
+        self.documents = {}
+        self.postings = defaultdict(set)
+        # Отсортированные слова для поиска по префиксу
+        self.words = []
+
+    @classmethod
+    def build(cls, version):
+        index = cls(version)
+        for kind in KIND_LABELS:
+            for document in load_documents(kind):
+                index.add(document)
+        return index
+
+    def add(self, document):
+        key = (document.kind, document.pk)
+        self.remove(*key)
+        self.documents[key] = document
+        for token in document.tokens:
+            if not self.postings[token]:
+                insort(self.words, token)
+            self.postings[token].add(key)
+
+    def apply(self, changes):
+        """
+        Заменяет документы из changes — {kind: (pks, документы из БД)};
+        pks без документа (удалённые) исчезают из индекса.
+        """
+        for kind, (pks, documents) in changes.items():
+            for pk in pks:
+                self.remove(kind, pk)
+            for document in documents:
+                self.add(document)
+
+    def remove(self, kind, pk):
+        document = self.documents.pop((kind, pk), None)
+        if document is None:
+            return
+        for token in document.tokens:
+            keys = self.postings[token]
+            keys.discard((kind, pk))
+            if not keys:
+                del self.postings[token]
+                position = bisect_left(self.words, token)
+                del self.words[position]
+
+    def _prefix_matches(self, prefix):
+        keys = set()
+        position = bisect_left(self.words, prefix)
+        while position < len(self.words) and self.words[position].startswith(prefix):
+            keys |= self.postings[self.words[position]]
+            position += 1
+        return keys
+
+    def search(self, query, visible=lambda document: True, limit=SEARCH_LIMIT):
+        """
+        Документы, в которых каждое слово запроса — начало какого-либо
+        слова имени, а цифры запроса вместе — окончание телефона. Лучшие
+        первыми: с точным совпадением слов, затем по алфавиту.
+        """
+        words = name_tokens(query)
+        prefixes = [word for word in words if not word.isdigit()]
+        digits = "".join(word for word in words if word.isdigit())
+        if digits:
+            prefixes.append(PHONE_PREFIX + digits[::-1])
+        if not prefixes:
+            return []
+
+        # Длинные префиксы обычно самые редкие — с них и начинаем
+        matches = None
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            found = self._prefix_matches(prefix)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+
+        documents = [
+            self.documents[key] for key in matches if visible(self.documents[key])
+        ]
+        documents.sort(
+            key=lambda document: (
+                -sum(prefix in document.tokens for prefix in prefixes),
+                document.title.lower(),
+            )
+        )
+        return documents[:limit]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _shared_version():
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(INDEX_VERSION_KEY, version, None)
+        version = cache.get(INDEX_VERSION_KEY, version)
+    return version
+
+
+def _publish(kind, pks):
+    """Новый номер версии и запись журнала под ним; None, если версии нет в кэше."""
+    try:
+        version = cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        return None
+    cache.set(CHANGE_KEY.format(version), (kind, sorted(pks)), CHANGE_LOG_TTL)
+    return version
+
+
+def _logged_changes(first, last):
+    """
+    Изменения версий first..last из журнала: {kind: pks}. None, если
+    отставание слишком большое или часть записей уже вытеснена.
+    """
+    if last - first >= MAX_REPLAY:
+        return None
+    keys = [CHANGE_KEY.format(version) for version in range(first, last + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    changes = defaultdict(set)
+    for kind, pks in entries.values():
+        changes[kind].update(pks)
+    return changes
+
+
+def _load_changes(changes):
+    return {kind: (pks, load_documents(kind, pks)) for kind, pks in changes.items()}
+
+
+def get_index():
+    """
+    Индекс процесса. Если другие процессы что-то изменили, перечитывает
+    изменённые документы по журналу, а без журнала строит индекс заново.
+    """
+    global _index
+    version = _shared_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    changes = None
+    if index is not None and index.version < version:
+        changes = _logged_changes(index.version + 1, version)
+    if changes is None:
+        fresh = SearchIndex.build(version)
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = fresh
+            return _index
+
+    loaded = _load_changes(changes)
+    with _lock:
+        # Другой поток мог успеть догнать или заменить индекс
+        if _index is index and index.version < version:
+            index.apply(loaded)
+            index.version = version
+        return _index
+
+
+def update_index(kind, pks):
+    """
+    Перечитывает документы kind с pks (удалённые исчезают из индекса) и
+    записывает изменение в журнал для других процессов.
+    """
+    pks = set(pks)
+    if not pks:
+        return
+    version = _publish(kind, pks)
+    index = _index
+    if index is None:
+        return
+    loaded = _load_changes({kind: pks})
+    with _lock:
+        if _index is not index:
+            return
+        if version is not None and index.version >= version:
+            # Изменение уже применено при догонке по журналу
+            return
+        index.apply(loaded)
+        # Индекс был актуален до этого изменения — он актуален и после
+        if version is not None and index.version == version - 1:
+            index.version = version
+
+
+def _visibility(user):
+    """
+    Правила видимости списков: менеджер видит всё; администратор —
+    свой город, начальник лагеря/лаборатории — свой филиал (ученики без
+    смен и сотрудники без филиала видны всем, как в списках); лиды —
+    менеджер и администратор.
+    """
+    branches = None
+    if user.role == "admin" and user.city:
+        branches = set(
+            Branch.objects.filter(city=user.city).values_list("pk", flat=True)
+        )
+    elif user.role in ["camp_head", "lab_head"] and user.branch_id:
+        branches = {user.branch_id}
+
+    def visible(document):
+        if document.kind == "lead":
+            return user.role in ["manager", "admin"]
+        if branches is None or not document.branches:
+            return True
+        return bool(document.branches & branches)
+
+    return visible
+
+
+def global_search(user, query, limit=SEARCH_LIMIT):
+    """Результаты поиска для пользователя в виде словарей для JSON."""
+    visible = _visibility(user)
+    index = get_index()
+    # update_index меняет индекс на месте — не читаем его посреди изменения
+    with _lock:
+        documents = index.search(query, visible, limit)
+    return [
+        {
+            "type": document.kind,
+            "type_label": KIND_LABELS[document.kind],
+            "id": document.pk,
+            "title": document.title,
+            "subtitle": document.subtitle,
+            "url": reverse(KIND_URLS[document.kind], args=[document.pk]),
+        }
+        for document in documents
+    ]
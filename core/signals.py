@@ -1,8 +1,31 @@
 # core/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.db import transaction
 from django.dispatch import receiver
+from branches.models import Branch
+from core.context_processors import invalidate_ticket_counts
 from core.models import Ticket
-from core.telegram import send_telegram_message
+from core.rollup import (
+    month_start,
+    refresh_monthly_stats,
+    rollup_cells,
+    schedule_cells,
+    source_field,
+)
+from core.search import update_index
+from core.stats import invalidate_dashboard_stats
+from core.telegram import enqueue_telegram_message
+from employees.models import Employee
+from leads.models import Lead
+from payroll.models import Expense, Salary
+from schedule.models import Schedule
+from students.models import Payment, Student, StudentSchedule
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,7 +34,8 @@ logger = logging.getLogger(__name__)
 @receiver(post_save, sender=Ticket)
 def send_telegram_notification(sender, instance, created, **kwargs):
     """
-    Отправляет уведомление в Telegram при создании нового тикета
+    Ставит уведомление о новом тикете в очередь Telegram; отправляет его
+    команда send_telegram_notifications, а не запрос пользователя
     """
     if created:
         message = (
@@ -21,4 +45,200 @@ def send_telegram_notification(sender, instance, created, **kwargs):
             f"📄 <b>Описание:</b>\n{instance.description[:500]}"
         )
 
-        send_telegram_message(message)
+        enqueue_telegram_message(message)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def reset_ticket_counts(sender, instance, **kwargs):
+    """Счётчики тикетов в шапке (core/context_processors.py)."""
+    invalidate_ticket_counts(instance.user_id)
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_save, sender=StudentSchedule)
+@receiver(post_delete, sender=StudentSchedule)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+@receiver(post_save, sender=Salary)
+@receiver(post_delete, sender=Salary)
+def reset_dashboard_stats(sender, **kwargs):
+    """Статистика дашборда (core/stats.py) зависит от этих таблиц."""
+    invalidate_dashboard_stats()
+
+
+@receiver(m2m_changed, sender=Student.schedules.through)
+def reset_dashboard_stats_on_enrollment(sender, action, **kwargs):
+    """student.schedules.add()/remove() идут мимо post_save у StudentSchedule."""
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_dashboard_stats()
+
+
+# Помесячные итоги по филиалам (core/rollup.py): при изменении строки
+# пересчитываются ячейки (филиал, месяц) до и после изменения.
+
+
+def _cascaded_from(origin, *models):
+    return origin is not None and getattr(origin, "model", type(origin)) in models
+
+
+def _instance_cell(sender, instance):
+    branch_id, start_date = (
+        Schedule.objects.filter(pk=instance.schedule_id)
+        .values_list("branch_id", "start_date")
+        .first()
+    ) or (None, None)
+    month = instance.date if sender is Payment else start_date
+    return branch_id, month
+
+
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Salary)
+@receiver(pre_save, sender=StudentSchedule)
+def remember_rollup_cells(sender, instance, **kwargs):
+    if instance.pk:
+        instance._rollup_cells = rollup_cells(sender, pk=instance.pk)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Salary)
+@receiver(post_save, sender=StudentSchedule)
+def update_rollup_on_save(sender, instance, **kwargs):
+    cells = getattr(instance, "_rollup_cells", set())
+    refresh_monthly_stats(
+        cells | {_instance_cell(sender, instance)}, fields=[source_field(sender)]
+    )
+
+
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Salary)
+@receiver(post_delete, sender=StudentSchedule)
+def update_rollup_on_delete(sender, instance, origin=None, **kwargs):
+    if _cascaded_from(origin, Schedule, Branch):
+        # Смену пересчитывает её собственный обработчик, филиал удаляет итоги каскадом
+        return
+    refresh_monthly_stats(
+        [_instance_cell(sender, instance)], fields=[source_field(sender)]
+    )
+
+
+@receiver(pre_save, sender=Schedule)
+def remember_schedule_cells(sender, instance, **kwargs):
+    """Смену перенесли в другой филиал или месяц — её данные переезжают."""
+    if not instance.pk:
+        return
+    old = (
+        Schedule.objects.filter(pk=instance.pk)
+        .values_list("branch_id", "start_date")
+        .first()
+    )
+    if old and (old[0], month_start(old[1])) != (
+        instance.branch_id,
+        month_start(instance.start_date),
+    ):
+        instance._rollup_cells = schedule_cells([instance.pk])
+
+
+@receiver(post_save, sender=Schedule)
+def move_schedule_rollup(sender, instance, **kwargs):
+    if hasattr(instance, "_rollup_cells"):
+        refresh_monthly_stats(instance._rollup_cells | schedule_cells([instance.pk]))
+
+
+@receiver(pre_delete, sender=Schedule)
+def remember_deleted_schedule_cells(sender, instance, origin=None, **kwargs):
+    if not _cascaded_from(origin, Branch):
+        instance._rollup_cells = schedule_cells([instance.pk])
+
+
+@receiver(post_delete, sender=Schedule)
+def update_rollup_on_schedule_delete(sender, instance, **kwargs):
+    if hasattr(instance, "_rollup_cells"):
+        refresh_monthly_stats(instance._rollup_cells)
+
+
+@receiver(m2m_changed, sender=Student.schedules.through)
+def update_rollup_on_enrollment(sender, instance, action, reverse, pk_set, **kwargs):
+    """student.schedules.add()/remove()/clear() идут мимо сигналов StudentSchedule."""
+    if action == "pre_clear":
+        instance._rollup_cells = rollup_cells(
+            StudentSchedule, **{"schedule" if reverse else "student": instance.pk}
+        )
+    elif action == "post_clear":
+        refresh_monthly_stats(
+            getattr(instance, "_rollup_cells", set()), fields=["enrollments"]
+        )
+    elif action in ("post_add", "post_remove"):
+        schedules = [instance.pk] if reverse else pk_set
+        refresh_monthly_stats(
+            Schedule.objects.filter(pk__in=schedules).values_list(
+                "branch_id", "start_date"
+            ),
+            fields=["enrollments"],
+        )
+
+
+# Глобальный поиск (core/search.py): документы перечитываются после
+# коммита, чтобы откат транзакции не оставил в индексе лишнего.
+
+
+def _reindex(kind, pks):
+    transaction.on_commit(lambda: update_index(kind, pks))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=Lead)
+@receiver(post_delete, sender=Lead)
+def reindex_document(sender, instance, **kwargs):
+    _reindex(sender._meta.model_name, [instance.pk])
+
+
+@receiver(post_save, sender=StudentSchedule)
+@receiver(post_delete, sender=StudentSchedule)
+def reindex_enrolled_student(sender, instance, origin=None, **kwargs):
+    """Филиалы ученика (для прав на результаты) — по его сменам."""
+    if not _cascaded_from(origin, Student):
+        _reindex("student", [instance.student_id])
+
+
+@receiver(m2m_changed, sender=Student.schedules.through)
+def reindex_on_enrollment(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        instance._search_students = list(
+            StudentSchedule.objects.filter(schedule=instance).values_list(
+                "student_id", flat=True
+            )
+        )
+    elif action == "post_clear":
+        _reindex("student", getattr(instance, "_search_students", [instance.pk]))
+    elif action in ("post_add", "post_remove"):
+        _reindex("student", pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def reindex_schedule(sender, instance, **kwargs):
+    _reindex("schedule", [instance.pk])
+
+
+@receiver(post_save, sender=Schedule)
+def reindex_schedule_students(sender, instance, created, **kwargs):
+    """Смену могли перенести в другой филиал — меняются права на её учеников."""
+    if not created:
+        _reindex(
+            "student",
+            list(
+                StudentSchedule.objects.filter(schedule=instance).values_list(
+                    "student_id", flat=True
+                )
+            ),
+        )
@@ -0,0 +1,161 @@
+# core/stats.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from branches.models import Branch
+from employees.models import Employee
+from payroll.models import Expense, Salary
+from schedule.models import Schedule
+from students.models import StudentSchedule
+
+# Значение по умолчанию; переопределяется в settings.py
+DEFAULT_TTL = 300
+
+STATS_VERSION_KEY = "dashboard-stats-version"
+
+STAT_FIELDS = (
+    "schedule_count",
+    "employee_count",
+    "student_count",
+    "total_expenses",
+    "total_salaries",
+)
+
+
+def _stats_version():
+    version = cache.get(STATS_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(STATS_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_dashboard_stats():
+    """
+    Сбрасывает кэш статистики дашборда для всех городов сразу: ключи
+    содержат номер версии, который здесь увеличивается.
+    """
+    try:
+        cache.incr(STATS_VERSION_KEY)
+    except ValueError:
+        # Ключ версии вытеснен: новая версия больше любой прежней
+        cache.set(STATS_VERSION_KEY, time.time_ns(), None)
+
+
+def _grouped(queryset, branch_field, **aggregates):
+    """{branch_id: {имя: значение}} по GROUP BY branch_field."""
+    rows = (
+        queryset.order_by()
+        .values(branch_field)
+        .annotate(**aggregates)
+        .values_list(branch_field, *aggregates)
+    )
+    return {row[0]: dict(zip(aggregates, row[1:])) for row in rows}
+
+
+def get_branch_statistics(branch_ids):
+    """
+    Статистика по филиалам набором сгруппированных запросов, без цикла по
+    филиалам: {branch_id: {schedule_count, employee_count, student_count,
+    total_expenses, total_salaries}}.
+
+    Сотрудник и его зарплаты относятся к филиалу своей текущей смены,
+    ученик — ко всем филиалам смен, на которые записан.
+    """
+    grouped = [
+        _grouped(
+            Schedule.objects.filter(branch__in=branch_ids),
+            "branch",
+            schedule_count=Count("id"),
+        ),
+        _grouped(
+            Employee.objects.filter(schedule__branch__in=branch_ids),
+            "schedule__branch",
+            employee_count=Count("id", distinct=True),
+        ),
+        _grouped(
+            StudentSchedule.objects.filter(schedule__branch__in=branch_ids),
+            "schedule__branch",
+            student_count=Count("student", distinct=True),
+        ),
+        _grouped(
+            Expense.objects.filter(schedule__branch__in=branch_ids),
+            "schedule__branch",
+            total_expenses=Sum("amount"),
+        ),
+        _grouped(
+            Salary.objects.filter(employee__schedule__branch__in=branch_ids),
+            "employee__schedule__branch",
+            total_salaries=Sum("total_payment"),
+        ),
+    ]
+
+    stats = {}
+    for branch_id in branch_ids:
+        row = dict.fromkeys(STAT_FIELDS, 0)
+        for values in grouped:
+            row.update(
+                (name, value or 0) for name, value in values.get(branch_id, {}).items()
+            )
+        stats[branch_id] = row
+    return stats
+
+
+def build_dashboard_stats(city=None):
+    """
+    Общая статистика и статистика по филиалам (всех или одного города).
+    Возвращает (stats, branches_stats).
+    """
+    branches = Branch.objects.select_related("city")
+    if city is not None:
+        branches = branches.filter(city=city)
+    branches = list(branches)
+    branch_ids = [branch.pk for branch in branches]
+    per_branch = get_branch_statistics(branch_ids)
+
+    # Сотрудник и зарплата относятся к одному филиалу, поэтому итоги
+    # складываются; ученик может учиться в нескольких — считаем отдельно
+    stats = {
+        name: sum(row[name] for row in per_branch.values()) for name in STAT_FIELDS
+    }
+    stats["student_count"] = (
+        StudentSchedule.objects.filter(schedule__branch__in=branch_ids)
+        .values("student")
+        .distinct()
+        .count()
+    )
+
+    branches_stats = [
+        {
+            "name": branch.name,
+            "city": branch.city.name if branch.city else "Не указан",
+            "address": branch.address,
+            **per_branch[branch.pk],
+        }
+        for branch in branches
+    ]
+    return stats, branches_stats
+
+
+def get_dashboard_stats(user):
+    """
+    Статистика дашборда в области видимости пользователя (администратор с
+    городом видит только свой город, остальные — всю сеть) из кэша.
+
+    Кэш сбрасывается сигналами (core/signals.py) при изменении смен,
+    записей на смены, сотрудников, расходов и зарплат; DASHBOARD_STATS_TTL —
+    страховка для изменений в обход сигналов.
+    """
+    city = user.city if user.role == "admin" and user.city else None
+    scope = f"city{city.pk}" if city is not None else "all"
+    key = f"dashboard-stats-{scope}-v{_stats_version()}"
+
+    result = cache.get(key)
+    if result is None:
+        result = build_dashboard_stats(city)
+        ttl = getattr(settings, "DASHBOARD_STATS_TTL", DEFAULT_TTL)
+        cache.set(key, result, ttl)
+    return result
@@ -1,49 +1,273 @@
 # core/telegram.py
+"""
+Уведомления в Telegram через очередь TelegramOutbox.
+
+Запрос пользователя только добавляет строки в очередь
+(enqueue_telegram_message), отправкой занимается команда
+send_telegram_notifications: одна HTTP-сессия на процесс, повтор с
+экспоненциальной задержкой, не чаще TELEGRAM_CHAT_INTERVAL секунд на чат,
+накопившиеся сообщения одному чату склеиваются в одно.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
 import requests
 from django.conf import settings
-import logging
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from core.models import TelegramOutbox
 
 logger = logging.getLogger(__name__)
 
+# Значения по умолчанию; переопределяются в settings.py
+DEFAULT_API_URL = "https://api.telegram.org"
+DEFAULT_CHAT_INTERVAL = 1.0
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BATCH_SIZE = 50
 
-def send_telegram_message(message: str, chat_ids=None):
+REQUEST_TIMEOUT = 10
+# Строки пачки откладываются на это время, пока воркер их отправляет; если
+# воркер упал, по истечении срока их заберёт другой
+CLAIM_LEASE = timedelta(minutes=15)
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+# Предел длины сообщения в Bot API
+MAX_MESSAGE_LENGTH = 4096
+SEPARATOR = "\n\n"
+
+
+class TelegramError(Exception):
     """
-    Отправка сообщения в Telegram одному или нескольким пользователям
+    Сообщение не отправлено. retry_after — пауза, которую просит Telegram
+    (ответ 429); permanent — повторять бесполезно (чат не найден, бот
+    заблокирован).
     """
-    token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
 
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+class TelegramClient:
+    """HTTP-клиент Bot API: пул соединений и пауза между сообщениями в чат."""
+
+    def __init__(self, token, api_url=None, chat_interval=None):
+        self.token = token
+        self.api_url = (api_url or DEFAULT_API_URL).rstrip("/")
+        self.chat_interval = (
+            DEFAULT_CHAT_INTERVAL if chat_interval is None else chat_interval
+        )
+        self.session = requests.Session()
+        self.session.mount(self.api_url, HTTPAdapter(pool_maxsize=4))
+        self._last_sent = {}
+
+    def _wait_for_chat(self, chat_id):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.chat_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def send(self, chat_id, text):
+        self._wait_for_chat(chat_id)
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+        try:
+            response = self.session.post(url, json=payload, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            # В тексте ошибки requests есть URL, а в нём токен бота
+            raise TelegramError(str(e).replace(self.token, "<token>")) from e
+        finally:
+            self._last_sent[chat_id] = time.monotonic()
+
+        if response.status_code == 200:
+            return
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        description = data.get("description") or f"HTTP {response.status_code}"
+        raise TelegramError(
+            description,
+            retry_after=data.get("parameters", {}).get("retry_after"),
+            permanent=response.status_code in (400, 403, 404),
+        )
+
+
+_client = None
+
+
+def get_client():
+    """Клиент процесса (None без токена); пересоздаётся при смене настроек."""
+    global _client
+    token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
     if not token:
-        logger.warning("TELEGRAM_BOT_TOKEN not configured")
-        return False
+        return None
+    api_url = getattr(settings, "TELEGRAM_API_URL", DEFAULT_API_URL)
+    chat_interval = getattr(settings, "TELEGRAM_CHAT_INTERVAL", DEFAULT_CHAT_INTERVAL)
+    if (
+        _client is None
+        or _client.token != token
+        or _client.api_url != api_url.rstrip("/")
+        or _client.chat_interval != chat_interval
+    ):
+        _client = TelegramClient(token, api_url, chat_interval)
+    return _client
+
 
+def _chat_ids(chat_ids):
     # Если chat_ids не указан, используем настройки из settings.py
     if chat_ids is None:
         chat_ids = getattr(settings, "TELEGRAM_CHAT_ID", None)
+    if not chat_ids:
+        return []
+    # Преобразуем в список, если передан одиночный chat_id
+    if not isinstance(chat_ids, (list, tuple)):
+        chat_ids = [chat_ids]
+    return [str(chat_id) for chat_id in chat_ids]
+
 
+def enqueue_telegram_message(message: str, chat_ids=None):
+    """
+    Ставит сообщение в очередь отправки одному или нескольким чатам.
+    Возвращает число добавленных строк.
+    """
+    chat_ids = _chat_ids(chat_ids)
     if not chat_ids:
         logger.warning("TELEGRAM_CHAT_ID not configured")
-        return False
+        return 0
+    TelegramOutbox.objects.bulk_create(
+        [TelegramOutbox(chat_id=chat_id, text=message) for chat_id in chat_ids]
+    )
+    return len(chat_ids)
 
-    # Преобразуем в список, если передан одиночный chat_id
-    if not isinstance(chat_ids, list):
-        chat_ids = [chat_ids]
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+def send_telegram_message(message: str, chat_ids=None):
+    """
+    Отправка сообщения в Telegram одному или нескольким пользователям сразу,
+    в обход очереди (для скриптов и консоли).
+    """
+    client = get_client()
+    if client is None:
+        logger.warning("TELEGRAM_BOT_TOKEN not configured")
+        return False
+
+    chat_ids = _chat_ids(chat_ids)
+    if not chat_ids:
+        logger.warning("TELEGRAM_CHAT_ID not configured")
+        return False
 
     success_count = 0
     for chat_id in chat_ids:
-        payload = {"chat_id": chat_id, "text": message, "parse_mode": "HTML"}
-
         try:
-            response = requests.post(url, json=payload, timeout=10)
-            if response.status_code == 200:
-                logger.info(f"Telegram message sent to chat {chat_id}")
-                success_count += 1
-            else:
-                logger.error(
-                    f"Telegram API error for chat {chat_id}: {response.json()}"
-                )
-        except Exception as e:
+            client.send(chat_id, message)
+            logger.info(f"Telegram message sent to chat {chat_id}")
+            success_count += 1
+        except TelegramError as e:
             logger.error(f"Error sending Telegram message to chat {chat_id}: {e}")
 
     return success_count > 0
+
+
+def _pack(rows):
+    """
+    Склеивает сообщения одному чату по порядку в тексты не длиннее
+    MAX_MESSAGE_LENGTH: [(chat_id, text, [строки очереди]), ...].
+    """
+    packs = {}
+    for row in rows:
+        chat_packs = packs.setdefault(row.chat_id, [])
+        if chat_packs:
+            _, text, group = chat_packs[-1]
+            joined = text + SEPARATOR + row.text
+            if len(joined) <= MAX_MESSAGE_LENGTH:
+                chat_packs[-1] = (row.chat_id, joined, group + [row])
+                continue
+        chat_packs.append((row.chat_id, row.text, [row]))
+    return [pack for chat_packs in packs.values() for pack in chat_packs]
+
+
+def _backoff(attempt):
+    return min(BACKOFF_BASE * 2 ** (attempt - 1), BACKOFF_MAX)
+
+
+def _reschedule(group, error, max_attempts):
+    """Неудачная попытка: следующая через паузу или статус failed."""
+    now = timezone.now()
+    attempt = max(row.attempts for row in group) + 1
+    pks = [row.pk for row in group]
+    if error.permanent or attempt >= max_attempts:
+        TelegramOutbox.objects.filter(pk__in=pks).update(
+            status="failed", attempts=F("attempts") + 1, last_error=str(error)
+        )
+        logger.error(f"Telegram message to chat {group[0].chat_id} dropped: {error}")
+        return
+    delay = error.retry_after or _backoff(attempt)
+    TelegramOutbox.objects.filter(pk__in=pks).update(
+        attempts=F("attempts") + 1,
+        next_attempt_at=now + timedelta(seconds=delay),
+        last_error=str(error),
+    )
+    logger.warning(
+        f"Telegram message to chat {group[0].chat_id} failed, retry in {delay}s: {error}"
+    )
+
+
+def _claim(batch_size):
+    """
+    Забирает пачку строк, срок которых подошёл: короткая транзакция с
+    SKIP LOCKED переносит их next_attempt_at на CLAIM_LEASE вперёд, и другие
+    воркеры их уже не выбирают. HTTP-запросы идут после коммита.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            TelegramOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("id")[:batch_size]
+        )
+        TelegramOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+            next_attempt_at=now + CLAIM_LEASE
+        )
+    return rows
+
+
+def deliver_pending(batch_size=None, client=None):
+    """
+    Отправляет пачку из batch_size сообщений очереди, срок которых подошёл.
+    Строки пачки сначала забираются (_claim), поэтому несколько воркеров не
+    отправят одно сообщение дважды, а блокировки не держатся на время
+    HTTP-запросов. Результат записывается после каждого отправленного
+    текста. Возвращает (отправлено, отложено).
+    """
+    client = client or get_client()
+    if client is None:
+        logger.warning("TELEGRAM_BOT_TOKEN not configured")
+        return 0, 0
+    batch_size = batch_size or getattr(
+        settings, "TELEGRAM_BATCH_SIZE", DEFAULT_BATCH_SIZE
+    )
+    max_attempts = getattr(settings, "TELEGRAM_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+
+    sent = retried = 0
+    for chat_id, text, group in _pack(_claim(batch_size)):
+        try:
+            client.send(chat_id, text)
+        except TelegramError as e:
+            _reschedule(group, e, max_attempts)
+            retried += len(group)
+        else:
+            TelegramOutbox.objects.filter(pk__in=[row.pk for row in group]).update(
+                status="sent",
+                attempts=F("attempts") + 1,
+                sent_at=timezone.now(),
+                last_error="",
+            )
+            sent += len(group)
+    return sent, retried
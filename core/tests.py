@@ -1,7 +1,29 @@
-from django.test import TestCase, Client
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 import json
 
+from branches.models import Branch, City
+from core import search as search_module
+from core.context_processors import ticket_counts
+from core.models import BranchMonthlyStats, TelegramOutbox, Ticket
+from core.pdf import PdfRenderError, pdf_response, render_pdf
+from core.rollup import rebuild_monthly_stats
+from core.search import global_search
+from core.stats import build_dashboard_stats, get_dashboard_stats
+from core.telegram import deliver_pending, enqueue_telegram_message
+from employees.models import Employee, Position
+from leads.models import Lead
+from payroll.models import Expense, ExpenseCategory, Salary
+from schedule.models import Schedule
+from students.models import Payment, Student, StudentSchedule
+
 
 class AuthApiTests(TestCase):
     """
@@ -53,3 +75,475 @@ class AuthApiTests(TestCase):
         response = self.client.post("/api/auth/logout/")
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.json().get("success"))
+
+
+@override_settings(PDF_RENDER_WORKERS=0)
+class PdfRenderTests(TestCase):
+    """
+    Тесты сервиса рендера PDF (core/pdf.py).
+    """
+
+    def test_render_in_process(self):
+        pdf = render_pdf("<html><body>Тест</body></html>", ["body { margin: 0 }"])
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+    def test_response_headers(self):
+        response = pdf_response("<html><body>Тест</body></html>", "test.pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Content-Disposition"], "inline; filename=test.pdf")
+
+    def test_render_error_returns_503(self):
+        with mock.patch(
+            "core.pdf.render_pdf", side_effect=PdfRenderError("timeout")
+        ):
+            response = pdf_response("<html></html>", "test.pdf")
+        self.assertEqual(response.status_code, 503)
+
+
+class DashboardStatsCacheTests(TestCase):
+    """
+    Кэш статистики дашборда и его сброс сигналами.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+        self.branch = Branch.objects.create(name="Тестовый филиал")
+        self.schedule = Schedule.objects.create(
+            name="Тестовая смена",
+            branch=self.branch,
+            start_date=date(2025, 7, 1),
+            end_date=date(2025, 7, 5),
+        )
+
+    def test_cached_and_invalidated(self):
+        stats, _ = get_dashboard_stats(self.user)
+        self.assertEqual(stats["schedule_count"], 1)
+
+        with self.assertNumQueries(0):
+            get_dashboard_stats(self.user)
+
+        Schedule.objects.create(
+            name="Вторая смена",
+            branch=self.branch,
+            start_date=date(2025, 8, 1),
+            end_date=date(2025, 8, 5),
+        )
+        stats, branches_stats = get_dashboard_stats(self.user)
+        self.assertEqual(stats["schedule_count"], 2)
+        self.assertEqual(branches_stats[0]["schedule_count"], 2)
+
+    def test_dashboard_view(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/analytics/").status_code, 200)
+        self.assertEqual(self.client.get("/").status_code, 200)
+
+
+class BranchStatisticsTests(TestCase):
+    """
+    Статистика по филиалам считается сгруппированными запросами.
+    """
+
+    def setUp(self):
+        cache.clear()
+        position = Position.objects.create(name="Вожатый")
+        category = ExpenseCategory.objects.create(name="Материалы")
+        student = Student.objects.create(full_name="Общий ученик")
+        self.branches = []
+        for i in range(3):
+            branch = Branch.objects.create(name=f"Филиал {i}")
+            schedule = Schedule.objects.create(
+                name=f"Смена {i}",
+                branch=branch,
+                start_date=date(2025, 7, 1),
+                end_date=date(2025, 7, 5),
+            )
+            StudentSchedule.objects.create(student=student, schedule=schedule)
+            employee = Employee.objects.create(
+                full_name=f"Сотрудник {i}", position=position, schedule=schedule
+            )
+            Expense.objects.create(schedule=schedule, category=category, amount=100)
+            Salary.objects.create(
+                employee=employee, schedule=schedule, total_payment=500, is_paid=True
+            )
+            self.branches.append(branch)
+
+    def test_dashboard_stats(self):
+        with self.assertNumQueries(7):
+            stats, branches_stats = build_dashboard_stats()
+
+        self.assertEqual(stats["schedule_count"], 3)
+        self.assertEqual(stats["employee_count"], 3)
+        # Один ученик в трёх филиалах
+        self.assertEqual(stats["student_count"], 1)
+        self.assertEqual(stats["total_expenses"], 300)
+        self.assertEqual(stats["total_salaries"], 1500)
+        self.assertEqual([row["student_count"] for row in branches_stats], [1, 1, 1])
+
+    def test_branch_get_statistics(self):
+        self.assertEqual(
+            self.branches[0].get_statistics(),
+            {
+                "schedule_count": 1,
+                "employee_count": 1,
+                "student_count": 1,
+                "total_expenses": 100,
+                "total_salaries": 500,
+            },
+        )
+
+
+class MonthlyStatsTests(TestCase):
+    """
+    Помесячные итоги поддерживаются сигналами и совпадают с полной пересборкой.
+    """
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Тестовый филиал")
+        self.schedule = Schedule.objects.create(
+            name="Тестовая смена",
+            branch=self.branch,
+            start_date=date(2025, 7, 1),
+            end_date=date(2025, 7, 5),
+        )
+        category = ExpenseCategory.objects.create(name="Материалы")
+        position = Position.objects.create(name="Вожатый")
+        employee = Employee.objects.create(full_name="Сотрудник", position=position)
+        self.student = Student.objects.create(full_name="Ученик")
+        StudentSchedule.objects.create(student=self.student, schedule=self.schedule)
+        Expense.objects.create(schedule=self.schedule, category=category, amount=100)
+        Salary.objects.create(
+            employee=employee, schedule=self.schedule, total_payment=500, is_paid=True
+        )
+        self.payment = Payment.objects.create(
+            student=self.student,
+            schedule=self.schedule,
+            amount=1000,
+            date=date(2025, 6, 20),
+        )
+
+    def cells(self):
+        return {
+            row.month: (row.revenue, row.expenses, row.salaries, row.enrollments)
+            for row in BranchMonthlyStats.objects.all()
+        }
+
+    def test_signals_maintain_cells(self):
+        self.assertEqual(
+            self.cells(),
+            {date(2025, 6, 1): (1000, 0, 0, 0), date(2025, 7, 1): (0, 100, 500, 1)},
+        )
+
+        self.payment.date = date(2025, 7, 2)
+        self.payment.save()
+        self.assertEqual(self.cells(), {date(2025, 7, 1): (1000, 100, 500, 1)})
+
+        # Перенос смены переносит расходы, зарплаты и записи
+        self.schedule.start_date = date(2025, 8, 1)
+        self.schedule.end_date = date(2025, 8, 5)
+        self.schedule.save()
+        self.assertEqual(
+            self.cells(),
+            {date(2025, 7, 1): (1000, 0, 0, 0), date(2025, 8, 1): (0, 100, 500, 1)},
+        )
+
+        incremental = self.cells()
+        rebuild_monthly_stats()
+        self.assertEqual(self.cells(), incremental)
+
+        self.schedule.delete()
+        self.assertEqual(self.cells(), {})
+
+    def test_trends_view_and_api(self):
+        user = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+        self.client.force_login(user)
+
+        with mock.patch(
+            "core.rollup.timezone.localdate", return_value=date(2025, 8, 15)
+        ):
+            response = self.client.get("/analytics/trends/?months=3")
+            self.assertContains(response, "06.2025")
+
+            response = self.client.get("/api/analytics/monthly/?months=2")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [row["month"] for row in response.json()], ["2025-07-01"]
+            )
+
+
+class TicketCountsTests(TestCase):
+    """
+    Счётчики тикетов в шапке: ленивые, кэшируются, сбрасываются сигналами.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+        Ticket.objects.create(user=self.user, subject="Ошибка", description="...")
+        self.request = RequestFactory().get("/")
+        self.request.user = self.user
+
+    def test_lazy_cached_and_invalidated(self):
+        with self.assertNumQueries(0):
+            counts = ticket_counts(self.request)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(counts["open_tickets_count"], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(ticket_counts(self.request)["open_tickets_count"], 1)
+
+        Ticket.objects.create(
+            user=self.user,
+            subject="Ответ",
+            description="...",
+            has_unread_admin_response=True,
+        )
+        counts = ticket_counts(self.request)
+        self.assertEqual(counts["open_tickets_count"], 2)
+        self.assertEqual(counts["unread_tickets_count"], 1)
+
+        self.client.force_login(self.user)
+        self.client.get("/tickets/my-tickets/")
+        self.assertEqual(ticket_counts(self.request)["unread_tickets_count"], 0)
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    """Заглушка Bot API: запоминает запросы и отвечает из очереди responses."""
+
+    requests = []
+    responses = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.requests.append(json.loads(body))
+        status, payload = self.responses.pop(0) if self.responses else (200, {})
+        data = json.dumps({"ok": status == 200, **payload}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TelegramOutboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings = override_settings(
+            TELEGRAM_BOT_TOKEN="token",
+            TELEGRAM_CHAT_ID=[1, 2],
+            TELEGRAM_API_URL=f"http://127.0.0.1:{cls.server.server_port}",
+            TELEGRAM_CHAT_INTERVAL=0,
+        )
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        TelegramStubHandler.requests.clear()
+        TelegramStubHandler.responses.clear()
+        self.user = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+
+    def test_ticket_only_enqueues(self):
+        Ticket.objects.create(user=self.user, subject="Ошибка", description="...")
+        self.assertEqual(TelegramOutbox.objects.filter(status="pending").count(), 2)
+        self.assertEqual(TelegramStubHandler.requests, [])
+
+        self.assertEqual(deliver_pending(), (2, 0))
+        self.assertEqual(
+            sorted(r["chat_id"] for r in TelegramStubHandler.requests), ["1", "2"]
+        )
+        self.assertFalse(TelegramOutbox.objects.exclude(status="sent").exists())
+
+    def test_messages_to_one_chat_are_batched(self):
+        for text in ("первое", "второе", "третье"):
+            enqueue_telegram_message(text, chat_ids=5)
+        self.assertEqual(deliver_pending(), (3, 0))
+        self.assertEqual(len(TelegramStubHandler.requests), 1)
+        self.assertEqual(
+            TelegramStubHandler.requests[0]["text"], "первое\n\nвторое\n\nтретье"
+        )
+
+    def test_retry_and_permanent_failure(self):
+        enqueue_telegram_message("сообщение", chat_ids=[1, 2])
+        TelegramStubHandler.responses.extend(
+            [
+                (429, {"parameters": {"retry_after": 120}}),
+                (400, {"description": "chat not found"}),
+            ]
+        )
+        self.assertEqual(deliver_pending(), (0, 2))
+
+        retried, failed = TelegramOutbox.objects.order_by("chat_id")
+        self.assertEqual((retried.status, retried.attempts), ("pending", 1))
+        self.assertGreater(retried.next_attempt_at, timezone.now())
+        self.assertEqual((failed.status, failed.last_error), ("failed", "chat not found"))
+
+        # Срок повтора ещё не подошёл
+        self.assertEqual(deliver_pending(), (0, 0))
+        TelegramOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_pending(), (1, 0))
+
+    def test_claimed_rows_are_leased_while_sending(self):
+        enqueue_telegram_message("первое", chat_ids=1)
+        enqueue_telegram_message("второе", chat_ids=2)
+        due_while_sending = []
+
+        def send(chat_id, text):
+            due_while_sending.append(
+                TelegramOutbox.objects.filter(
+                    status="pending", next_attempt_at__lte=timezone.now()
+                ).count()
+            )
+
+        self.assertEqual(deliver_pending(client=mock.Mock(send=send)), (2, 0))
+        self.assertEqual(due_while_sending, [0, 0])
+        self.assertEqual(TelegramOutbox.objects.filter(status="sent").count(), 2)
+
+    def test_connection_error_does_not_store_token(self):
+        enqueue_telegram_message("сообщение", chat_ids=1)
+        # Порт, на котором никто не слушает
+        with ThreadingHTTPServer(("127.0.0.1", 0), TelegramStubHandler) as closed:
+            port = closed.server_port
+        with override_settings(
+            TELEGRAM_BOT_TOKEN="123:secret", TELEGRAM_API_URL=f"http://127.0.0.1:{port}"
+        ):
+            self.assertEqual(deliver_pending(), (0, 1))
+
+        last_error = TelegramOutbox.objects.get().last_error
+        self.assertIn("<token>", last_error)
+        self.assertNotIn("123:secret", last_error)
+
+
+class GlobalSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        search_module._index = None
+        self.addCleanup(setattr, search_module, "_index", None)
+
+        self.moscow = City.objects.create(name="Москва")
+        kazan = City.objects.create(name="Казань")
+        self.main = Branch.objects.create(name="Main", city=self.moscow)
+        self.other = Branch.objects.create(name="Other", city=kazan)
+        self.schedule = Schedule.objects.create(
+            name="Летняя Робототехника",
+            branch=self.main,
+            start_date="2025-07-01",
+            end_date="2025-07-10",
+            theme="Robotics",
+        )
+        self.enrolled = Student.objects.create(
+            full_name="Фёдоров Пётр", parent_name="Фёдорова Ольга", phone="+79123456789"
+        )
+        StudentSchedule.objects.create(student=self.enrolled, schedule=self.schedule)
+        self.unenrolled = Student.objects.create(full_name="Федотов Иван")
+        Employee.objects.create(
+            full_name="Фёдорова Анна",
+            position=Position.objects.create(name="Вожатый"),
+            branch=self.other,
+        )
+        Lead.objects.create(source="website", phone="8 (912) 345-67-89")
+
+    def user(self, role, **kwargs):
+        return get_user_model().objects.create_user(
+            username=role, password="password", role=role, **kwargs
+        )
+
+    def found(self, user, query):
+        return {(r["type"], r["title"]) for r in global_search(user, query)}
+
+    def test_typed_results_and_permissions(self):
+        manager = self.user("manager")
+        self.assertEqual(
+            self.found(manager, "фед"),
+            {
+                ("student", "Фёдоров Пётр"),
+                ("student", "Федотов Иван"),
+                ("employee", "Фёдорова Анна"),
+            },
+        )
+        # Имя родителя и окончание телефона в любом формате
+        self.assertEqual(self.found(manager, "ольга"), {("student", "Фёдоров Пётр")})
+        self.assertEqual(
+            self.found(manager, "67 89"),
+            {("student", "Фёдоров Пётр"), ("lead", "8 (912) 345-67-89")},
+        )
+        self.assertEqual(
+            self.found(manager, "робот"), {("schedule", "Летняя Робототехника")}
+        )
+
+        camp_head = self.user("camp_head", branch=self.other)
+        self.assertEqual(
+            self.found(camp_head, "фед"),
+            {("student", "Федотов Иван"), ("employee", "Фёдорова Анна")},
+        )
+        self.assertEqual(self.found(camp_head, "6789"), set())
+
+        admin = self.user("admin", city=self.moscow)
+        self.assertEqual(
+            self.found(admin, "фед"),
+            {("student", "Фёдоров Пётр"), ("student", "Федотов Иван")},
+        )
+
+        self.client.force_login(manager)
+        response = self.client.get("/search/", {"q": "робот"})
+        self.assertEqual(
+            response.json()["results"][0]["url"], f"/schedule/{self.schedule.pk}/"
+        )
+
+    def test_incremental_updates(self):
+        manager = self.user("manager")
+        index = search_module.get_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unenrolled.full_name = "Смирнов Иван"
+            self.unenrolled.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enrolled.delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.found(manager, "фед"), {("employee", "Фёдорова Анна")})
+        self.assertIs(search_module.get_index(), index)
+
+        # Изменение в другом процессе: номер версии ушёл вперёд
+        cache.incr(search_module.INDEX_VERSION_KEY)
+        self.assertIsNot(search_module.get_index(), index)
+
+    def test_changes_from_other_process_are_replayed(self):
+        manager = self.user("manager")
+        index = search_module.get_index()
+
+        # Другой процесс изменил ученика и записал изменение в журнал
+        Student.objects.filter(pk=self.unenrolled.pk).update(full_name="Смирнов Иван")
+        search_module._publish("student", [self.unenrolled.pk])
+
+        # Перечитывается один документ, без пересборки индекса
+        with self.assertNumQueries(2):
+            self.assertIs(search_module.get_index(), index)
+        self.assertEqual(self.found(manager, "смирн"), {("student", "Смирнов Иван")})
+        self.assertEqual(self.found(manager, "федот"), set())
+
+        # Запись журнала вытеснена — индекс строится заново
+        search_module._publish("student", [self.unenrolled.pk])
+        cache.delete(
+            search_module.CHANGE_KEY.format(cache.get(search_module.INDEX_VERSION_KEY))
+        )
+        self.assertIsNot(search_module.get_index(), index)
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path("", views.dashboard, name="dashboard"),
     path("analytics/", views.analytics_dashboard, name="analytics_dashboard"),
+    path("analytics/trends/", views.analytics_trends, name="analytics_trends"),
+    path("search/", views.search, name="global_search"),
     path("tickets/create/", views.create_ticket, name="create_ticket"),
     path("tickets/my-tickets/", views.my_tickets, name="my_tickets"),
     path("tickets/list/", views.ticket_list, name="ticket_list"),
@@ -19,9 +19,45 @@ def role_required(allowed_roles):
 
 
 import re
+import tempfile
+
+import openpyxl
+from django.http import FileResponse
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Размер пачки при чтении строк выгрузки через QuerySet.iterator()
+EXPORT_CHUNK_SIZE = 500
 
 
 def sanitize_sheet_name(name: str) -> str:
     """Заменяет запрещённые символы и урезает до 31 символа."""
     name = re.sub(r"[:\\/?*\[\]]", "_", name)
     return name[:31]
+
+
+def excel_export_response(filename, sheet_title, headers, rows):
+    """
+    Отдаёт Excel-файл, собранный в write-only режиме openpyxl.
+
+    Строки (rows — любой итерируемый объект, обычно генератор поверх
+    queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)) пишутся сразу на диск,
+    готовая книга сохраняется во временный файл и отдаётся потоково через
+    FileResponse, поэтому потребление памяти не зависит от числа строк.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=sanitize_sheet_name(sheet_title))
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
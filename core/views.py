@@ -1,81 +1,18 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Count, Sum, Q
 from django.core.paginator import Paginator
 from django.contrib import messages
+from django.http import JsonResponse
 
+from core.context_processors import invalidate_ticket_counts
+from core.rollup import ROLLUP_FIELDS, monthly_stats_for
+from core.search import global_search
+from core.stats import get_dashboard_stats
 from core.utils import role_required
-from employees.models import Employee
-from payroll.models import Expense, Salary
-from schedule.models import Schedule
-from students.models import Student
-from branches.models import Branch
 from .models import Ticket
 from .forms import TicketForm, TicketAdminForm
 
 
-def get_dashboard_stats(user):
-    """Возвращает общую статистику и статистику по филиалам для дашборда."""
-    branches = Branch.objects.all()
-    if user.role == "admin" and user.city:
-        branches = branches.filter(city=user.city)
-
-    schedules = Schedule.objects.filter(branch__in=branches)
-
-    # Изменено: используем M2M-поле schedules
-    students = Student.objects.filter(schedules__in=schedules).distinct()
-    employees = Employee.objects.filter(schedule__in=schedules).distinct()
-
-    stats = {
-        "schedule_count": schedules.count(),
-        "employee_count": employees.count(),
-        "student_count": students.count(),
-        "total_expenses": Expense.objects.filter(schedule__in=schedules).aggregate(
-            Sum("amount")
-        )["amount__sum"]
-        or 0,
-        "total_salaries": Salary.objects.filter(employee__in=employees).aggregate(
-            Sum("total_payment")
-        )["total_payment__sum"]
-        or 0,
-    }
-
-    branches_stats = []
-    for branch in branches:
-        branch_schedules = Schedule.objects.filter(branch=branch)
-        # фильтрация студентов по сменам филиала через M2M
-        branch_students = Student.objects.filter(
-            schedules__in=branch_schedules
-        ).distinct()
-        branch_employees = Employee.objects.filter(
-            schedule__in=branch_schedules
-        ).distinct()
-        branch_expenses = (
-            Expense.objects.filter(schedule__in=branch_schedules).aggregate(
-                Sum("amount")
-            )["amount__sum"]
-            or 0
-        )
-        branch_salaries = (
-            Salary.objects.filter(employee__in=branch_employees).aggregate(
-                Sum("total_payment")
-            )["total_payment__sum"]
-            or 0
-        )
-
-        branches_stats.append(
-            {
-                "name": branch.name,
-                "schedule_count": branch_schedules.count(),
-                "employee_count": branch_employees.count(),
-                "student_count": branch_students.count(),
-                "total_expenses": branch_expenses,
-                "total_salaries": branch_salaries,
-            }
-        )
-    return stats, branches_stats
-
-
 @login_required
 def dashboard(request):
     role = request.user.role
@@ -102,65 +39,7 @@ def analytics_dashboard(request):
     Сводная аналитика с фильтрацией по городу для администраторов.
     """
     user = request.user
-    branches = Branch.objects.all()
-
-    if user.role == "admin" and user.city:
-        branches = branches.filter(city=user.city)
-
-    schedules = Schedule.objects.filter(branch__in=branches)
-
-    # Исправлено: M2M
-    students = Student.objects.filter(schedules__in=schedules).distinct()
-    employees = Employee.objects.filter(schedule__in=schedules).distinct()
-
-    stats = {
-        "schedule_count": schedules.count(),
-        "employee_count": employees.count(),
-        "student_count": students.count(),
-        "total_expenses": Expense.objects.filter(schedule__in=schedules).aggregate(
-            Sum("amount")
-        )["amount__sum"]
-        or 0,
-        "total_salaries": Salary.objects.filter(employee__in=employees).aggregate(
-            Sum("total_payment")
-        )["total_payment__sum"]
-        or 0,
-    }
-
-    branches_stats = []
-    for branch in branches:
-        branch_schedules = Schedule.objects.filter(branch=branch)
-        branch_students = Student.objects.filter(
-            schedules__in=branch_schedules
-        ).distinct()
-        branch_employees = Employee.objects.filter(
-            schedule__in=branch_schedules
-        ).distinct()
-        branch_expenses = (
-            Expense.objects.filter(schedule__in=branch_schedules).aggregate(
-                Sum("amount")
-            )["amount__sum"]
-            or 0
-        )
-        branch_salaries = (
-            Salary.objects.filter(employee__in=branch_employees).aggregate(
-                Sum("total_payment")
-            )["total_payment__sum"]
-            or 0
-        )
-
-        branches_stats.append(
-            {
-                "name": branch.name,
-                "city": branch.city.name if branch.city else "Не указан",
-                "address": branch.address,
-                "schedule_count": branch_schedules.count(),
-                "employee_count": branch_employees.count(),
-                "student_count": branch_students.count(),
-                "total_expenses": branch_expenses,
-                "total_salaries": branch_salaries,
-            }
-        )
+    stats, branches_stats = get_dashboard_stats(user)
 
     context = {
         "stats": stats,
@@ -171,6 +50,52 @@ def analytics_dashboard(request):
     return render(request, "core/analytics_dashboard.html", context)
 
 
+@role_required(["manager", "admin"])
+def analytics_trends(request):
+    """
+    Помесячная динамика выручки, расходов, зарплат и записей по филиалам.
+    Читает только предагрегированную таблицу BranchMonthlyStats.
+    """
+    try:
+        months = min(max(int(request.GET.get("months", 24)), 1), 120)
+    except ValueError:
+        months = 24
+
+    rows = list(monthly_stats_for(request.user, months))
+
+    totals = {}
+    for row in rows:
+        month_totals = totals.setdefault(row.month, dict.fromkeys(ROLLUP_FIELDS, 0))
+        for field in ROLLUP_FIELDS:
+            month_totals[field] += getattr(row, field)
+    totals = sorted(totals.items())
+
+    chart = {"labels": [month.strftime("%m.%Y") for month, _ in totals]}
+    for field in ROLLUP_FIELDS:
+        chart[field] = [float(values[field]) for _, values in totals]
+
+    context = {
+        "rows": rows,
+        "totals": totals,
+        "chart": chart,
+        "months": months,
+        "user_city": request.user.city.name if request.user.city else "Все города",
+    }
+    return render(request, "core/analytics_trends.html", context)
+
+
+@login_required
+def search(request):
+    """
+    Глобальный поиск по ученикам, сотрудникам, лидам и сменам (core/search.py)
+    с учётом прав пользователя.
+    """
+    query = request.GET.get("q", "").strip()
+    if len(query) < 2:
+        return JsonResponse({"results": []})
+    return JsonResponse({"results": global_search(request.user, query)})
+
+
 @login_required
 def create_ticket(request):
     if request.method == "POST":
@@ -194,9 +119,11 @@ def create_ticket(request):
 @login_required
 def my_tickets(request):
     if request.method == "GET":
-        Ticket.objects.filter(user=request.user, has_unread_admin_response=True).update(
-            has_unread_admin_response=False
-        )
+        if Ticket.objects.filter(
+            user=request.user, has_unread_admin_response=True
+        ).update(has_unread_admin_response=False):
+            # update() идёт мимо сигналов Ticket
+            invalidate_ticket_counts(request.user.pk)
 
     tickets = Ticket.objects.filter(user=request.user).order_by("-created_at")
     return render(request, "core/my_tickets.html", {"tickets": tickets})
@@ -242,10 +169,3 @@ def update_ticket(request, ticket_id):
         form = TicketAdminForm(instance=ticket)
 
     return render(request, "core/update_ticket.html", {"form": form, "ticket": ticket})
-
-
-def get_open_tickets_count(request):
-    """Контекстный процессор для отображения количества открытых тикетов"""
-    if request.user.is_authenticated and request.user.role == "manager":
-        return {"open_tickets_count": Ticket.objects.filter(status="open").count()}
-    return {"open_tickets_count": 0}
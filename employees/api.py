@@ -9,10 +9,12 @@ from employees.schemas import (
     EmployeeSchema,
     EmployeeCreateSchema,
     EmployeeAttendanceSchema,
+    EmployeeRateSchema,
     EmployeeAttendanceCreateSchema,
     PositionSchema,
 )
 from payroll.models import Salary
+from payroll.services import recalculate_dirty_salaries
 from schedule.models import Schedule
 
 employees_router = Router(tags=["Employees"])
@@ -222,7 +224,7 @@ def attendance_delete(request, attendance_id: int):
 
 
 @employees_router.post("/{employee_id}/update_salaries/")
-def update_employee_salaries(request, employee_id: int):
+def update_employee_salaries(request, employee_id: int, data: EmployeeRateSchema):
     employee = get_object_or_404(Employee, id=employee_id)
 
     # ПРОВЕРКА ДОСТУПА ДЛЯ АДМИНИСТРАТОРОВ И НАЧАЛЬНИКОВ
@@ -234,9 +236,10 @@ def update_employee_salaries(request, employee_id: int):
         if employee.branch and employee.branch != user.branch:
             return JsonResponse({"error": "Доступ запрещен"}, status=403)
 
-    new_rate = request.data.get("rate_per_day")
-
-    # Обновляем все связанные зарплаты
-    Salary.objects.filter(employee=employee).update(daily_rate=new_rate)
+    # Новая ставка сохраняется в карточке: сигнал помечает невыплаченные
+    # зарплаты, пересчитываем их сразу (выплаченные не меняются)
+    employee.rate_per_day = data.rate_per_day
+    employee.save(update_fields=["rate_per_day"])
+    recalculate_dirty_salaries(Salary.objects.filter(employee=employee))
 
     return {"success": True}
@@ -0,0 +1,108 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from schedule.bitmaps import mask_from_days
+
+
+def fill_attendance_bitmaps(apps, schema_editor):
+    """Заполняет битовые маски за смену по строкам EmployeeAttendance."""
+    EmployeeScheduleAttendance = apps.get_model(
+        "employees", "EmployeeScheduleAttendance"
+    )
+    EmployeeAttendance = apps.get_model("employees", "EmployeeAttendance")
+    Employee = apps.get_model("employees", "Employee")
+    EmployeeScheduleAttendance.objects.bulk_create(
+        [
+            EmployeeScheduleAttendance(employee_id=employee_id, schedule_id=schedule_id)
+            for employee_id, schedule_id in Employee.objects.filter(
+                schedule__isnull=False
+            ).values_list("id", "schedule_id")
+        ],
+        ignore_conflicts=True,
+    )
+
+    rows = list(EmployeeScheduleAttendance.objects.select_related("schedule"))
+    for offset in range(0, len(rows), 500):
+        chunk = rows[offset : offset + 500]
+        marks = {}
+        for person_id, date, present, excused in EmployeeAttendance.objects.filter(
+            employee_id__in={row.employee_id for row in chunk},
+            date__range=(
+                min(row.schedule.start_date for row in chunk),
+                max(row.schedule.end_date for row in chunk),
+            ),
+        ).values_list("employee_id", "date", "present", "excused"):
+            marks.setdefault(person_id, []).append((date, present, excused))
+
+        for row in chunk:
+            start, end = row.schedule.start_date, row.schedule.end_date
+            person_marks = marks.get(row.employee_id, [])
+            row.present_days = mask_from_days(
+                start, end, [date for date, present, _ in person_marks if present]
+            )
+            row.excused_days = mask_from_days(
+                start, end, [date for date, _, excused in person_marks if excused]
+            )
+        EmployeeScheduleAttendance.objects.bulk_update(
+            chunk, ["present_days", "excused_days"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("employees", "0010_alter_employee_is_leader"),
+        ("schedule", "0002_schedule_data_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmployeeScheduleAttendance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "present_days",
+                    models.BinaryField(default=b"", verbose_name="Дни присутствия"),
+                ),
+                (
+                    "excused_days",
+                    models.BinaryField(
+                        default=b"", verbose_name="Дни по уважительной причине"
+                    ),
+                ),
+                (
+                    "employee",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="schedule_attendances",
+                        to="employees.employee",
+                        verbose_name="Сотрудник",
+                    ),
+                ),
+                (
+                    "schedule",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="schedule.schedule",
+                        verbose_name="Смена",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Посещаемость за смену",
+                "verbose_name_plural": "Посещаемость за смены",
+                "unique_together": {("employee", "schedule")},
+            },
+        ),
+        migrations.RunPython(fill_attendance_bitmaps, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,7 @@
 # employees/models.py
 from django.db import models
 from branches.models import Branch, City
-from schedule.models import Schedule
+from schedule.models import AttendanceBitmap, Schedule
 
 
 class Position(models.Model):
@@ -100,3 +100,28 @@ class EmployeeAttendance(models.Model):
         else:
             status = "Отсутствовал"
         return f"{self.employee} - {self.date} - {status}"
+
+
+class EmployeeScheduleAttendance(AttendanceBitmap):
+    """
+    Посещаемость сотрудника за смену в виде битовых масок по дням.
+    Компактная копия EmployeeAttendance для быстрых выборок по смене.
+    """
+
+    employee = models.ForeignKey(
+        "Employee",
+        on_delete=models.CASCADE,
+        related_name="schedule_attendances",
+        verbose_name="Сотрудник",
+    )
+    schedule = models.ForeignKey(
+        Schedule, on_delete=models.CASCADE, verbose_name="Смена"
+    )
+
+    class Meta:
+        unique_together = ("employee", "schedule")
+        verbose_name = "Посещаемость за смену"
+        verbose_name_plural = "Посещаемость за смены"
+
+    def __str__(self):
+        return f"{self.employee} - {self.schedule}: {self.present_count} дн."
@@ -31,6 +31,10 @@ class EmployeeCreateSchema(Schema):
     is_leader: bool = False
 
 
+class EmployeeRateSchema(Schema):
+    rate_per_day: float
+
+
 class EmployeeAttendanceSchema(Schema):
     id: int
     employee_id: int
@@ -1,6 +1,12 @@
+import io
+
+import openpyxl
+from django.db import connection
+from django.core.cache import cache
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from employees.models import Employee, EmployeeAttendance
+from employees.models import Employee, EmployeeAttendance, Position
 from branches.models import Branch
 from schedule.models import Schedule
 
@@ -120,3 +126,63 @@ class EmployeeAttendanceApiTests(TestCase):
         updated_attendance = EmployeeAttendance.objects.get(id=self.attendance.id)
         self.assertEqual(str(updated_attendance.date), "2025-07-15")
         self.assertEqual(updated_attendance.comment, "Обновленный комментарий")
+
+
+class EmployeeAttendanceCalendarTests(TestCase):
+    """
+    Календарь посещаемости сотрудников и табель в Excel.
+    """
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(
+            get_user_model().objects.create_user(
+                username="manager", password="password", role="manager"
+            )
+        )
+        self.position = Position.objects.create(name="Вожатый")
+        self.params = {"start_date": "2025-07-01", "end_date": "2025-07-07"}
+
+    def add_employees(self, count):
+        for i in range(count):
+            employee = Employee.objects.create(
+                full_name=f"Сотрудник {Employee.objects.count():02}",
+                position=self.position,
+            )
+            EmployeeAttendance.objects.create(
+                employee=employee, date="2025-07-02", present=True
+            )
+
+    def calendar_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/employees/attendances/", self.params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_employees(self):
+        self.add_employees(2)
+        cache.clear()
+        # Первый запрос заполняет кэш счётчиков тикетов в шапке
+        self.calendar_queries()
+        few = self.calendar_queries()
+        self.add_employees(8)
+        self.assertEqual(self.calendar_queries(), few)
+
+    def test_timesheet_export(self):
+        self.add_employees(2)
+        response = self.client.get("/employees/attendances/export/excel/", self.params)
+
+        sheet = openpyxl.load_workbook(
+            io.BytesIO(b"".join(response.streaming_content))
+        ).active
+        rows = list(sheet.values)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][:5], ("Сотрудник 00", "Вожатый", "✗", "✓", "✗"))
+        self.assertEqual(rows[1][-1], 1)
+
+    def test_timesheet_export_rejects_too_long_period(self):
+        response = self.client.get(
+            "/employees/attendances/export/excel/",
+            {"start_date": "2024-01-01", "end_date": "2025-12-31"},
+        )
+        self.assertEqual(response.status_code, 400)
@@ -19,6 +19,11 @@ urlpatterns += [
         views.toggle_employee_attendance,
         name="toggle_employee_attendance",
     ),
+    path(
+        "attendances/export/excel/",
+        views.employee_attendance_export_excel,
+        name="employee_attendance_export_excel",
+    ),
     path("<int:pk>/quick_edit/", views.employee_quick_edit, name="employee_quick_edit"),
     path("create/ajax/", views.employee_create_ajax, name="employee_create_ajax"),
     path("export/excel/", views.employee_export_excel, name="employee_export_excel"),
@@ -1,22 +1,22 @@
-import io
 import json
 import logging
-import openpyxl
 from datetime import datetime, timedelta
 
+from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.template.loader import render_to_string
 from django.db.models import Q
 
-from weasyprint import HTML
 
 from branches.models import Branch
 from employees.forms import EmployeeAttendanceForm, EmployeeForm
-from core.utils import role_required
+from core.pdf import pdf_response
+from core.utils import EXPORT_CHUNK_SIZE, excel_export_response, role_required
 from schedule.models import Schedule
+from schedule.services import flip_employee_presence
 from .models import Employee, EmployeeAttendance
 
 
@@ -124,37 +124,42 @@ def employee_delete(request, pk):
     )
 
 
-@role_required(["manager", "admin"])
-def employee_attendance_list(request):
-    # Определяем период по умолчанию (текущая неделя)
+# Сотрудников на странице календаря посещаемости
+ATTENDANCE_PAGE_SIZE = 50
+
+ATTENDANCE_MARKS = {"present": "✓", "excused": "⚠", "absent": "✗"}
+# Табель строится по колонке на день: период длиннее года не выгружаем
+ATTENDANCE_EXPORT_MAX_DAYS = 366
+
+
+def _attendance_period(request):
+    """Период календаря из GET (start_date/end_date), по умолчанию — текущая неделя."""
     today = timezone.now().date()
     start_date = today - timedelta(days=today.weekday())
     end_date = start_date + timedelta(days=6)
 
-    # Обработка выбора периода пользователем
-    if request.method == "GET":
-        start_date_str = request.GET.get("start_date")
-        end_date_str = request.GET.get("end_date")
-
-        if start_date_str and end_date_str:
-            try:
-                start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-                end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    start_date_str = request.GET.get("start_date")
+    end_date_str = request.GET.get("end_date")
+    if start_date_str and end_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
 
-                # Корректируем если даты перепутаны
-                if start_date > end_date:
-                    start_date, end_date = end_date, start_date
-            except ValueError:
-                # В случае ошибки оставляем значения по умолчанию
-                pass
+            # Корректируем если даты перепутаны
+            if start_date > end_date:
+                start_date, end_date = end_date, start_date
+        except ValueError:
+            # В случае ошибки оставляем значения по умолчанию
+            pass
 
-    # Получаем даты периода
     dates = [
         start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)
     ]
+    return start_date, end_date, dates
 
-    # Получаем сотрудников с фильтрацией по роли
-    user = request.user
+
+def _attendance_employees(user):
+    """Сотрудники, доступные пользователю, с фильтрацией по роли."""
     if user.role == "manager":
         employees = Employee.objects.all()
     elif user.role == "admin" and user.city:
@@ -167,25 +172,48 @@ def employee_attendance_list(request):
         )
     else:
         employees = Employee.objects.all()
+    return employees.order_by("full_name", "id")
+
 
-    # Получаем посещения за период
-    attendances = EmployeeAttendance.objects.filter(date__range=(start_date, end_date))
-
-    # Создаем матрицу посещений: {employee_id: {date: attendance}}
-    attendance_matrix = {}
-    for employee in employees:
-        employee_matrix = {}
-        for date in dates:
-            try:
-                attendance = attendances.get(employee=employee, date=date)
-                employee_matrix[date] = attendance
-            except EmployeeAttendance.DoesNotExist:
-                employee_matrix[date] = None
-        attendance_matrix[employee.id] = employee_matrix
+def _attendance_matrix(employees, start_date, end_date):
+    """
+    Посещения сотрудников за период одним запросом: {(employee_id, date): attendance}.
+    employees — список или queryset (во втором случае фильтр уходит подзапросом).
+    """
+    attendances = EmployeeAttendance.objects.filter(
+        employee__in=employees, date__range=(start_date, end_date)
+    )
+    return {
+        (attendance.employee_id, attendance.date): attendance
+        for attendance in attendances
+    }
+
+
+def _attendance_status(attendance):
+    if attendance is None or not (attendance.present or attendance.excused):
+        return "absent"
+    return "present" if attendance.present else "excused"
+
+
+@role_required(["manager", "admin"])
+def employee_attendance_list(request):
+    start_date, end_date, dates = _attendance_period(request)
+
+    paginator = Paginator(_attendance_employees(request.user), ATTENDANCE_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get("page"))
+    employees = list(page_obj.object_list)
+
+    # Матрица посещений по сотрудникам страницы: {employee_id: {date: attendance}}
+    attendances = _attendance_matrix(employees, start_date, end_date)
+    attendance_matrix = {
+        employee.id: {date: attendances.get((employee.id, date)) for date in dates}
+        for employee in employees
+    }
 
     context = {
         "dates": dates,
         "employees": employees,
+        "page_obj": page_obj,
         "attendance_matrix": attendance_matrix,
         "start_date": start_date,
         "end_date": end_date,
@@ -195,6 +223,37 @@ def employee_attendance_list(request):
     return render(request, "employees/employee_attendance_calendar.html", context)
 
 
+@role_required(["manager", "admin"])
+def employee_attendance_export_excel(request):
+    """Табель посещаемости сотрудников за период (Excel)."""
+    start_date, end_date, dates = _attendance_period(request)
+    if len(dates) > ATTENDANCE_EXPORT_MAX_DAYS:
+        message = f"Период табеля не может превышать {ATTENDANCE_EXPORT_MAX_DAYS} дней"
+        return JsonResponse({"status": "error", "message": message}, status=400)
+    employees = _attendance_employees(request.user).select_related("position")
+    attendances = _attendance_matrix(employees, start_date, end_date)
+
+    def rows():
+        for employee in employees.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            statuses = [
+                _attendance_status(attendances.get((employee.id, date)))
+                for date in dates
+            ]
+            yield [
+                employee.full_name,
+                employee.position.name,
+                *[ATTENDANCE_MARKS[status] for status in statuses],
+                statuses.count("present"),
+            ]
+
+    return excel_export_response(
+        f"employee_attendance_{start_date:%Y%m%d}_{end_date:%Y%m%d}.xlsx",
+        "Табель",
+        ["ФИО", "Должность", *[date.strftime("%d.%m") for date in dates], "Итого"],
+        rows(),
+    )
+
+
 @role_required(["manager", "admin"])
 def employee_attendance_create(request):
     """
@@ -258,17 +317,10 @@ def toggle_employee_attendance(request):
             employee = Employee.objects.get(id=employee_id)
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
 
-            # Ищем существующую запись
-            attendance, created = EmployeeAttendance.objects.get_or_create(
-                employee=employee, date=date_obj, defaults={"present": True}
-            )
+            # Инвертируем статус одним UPDATE (новая запись — «присутствовал»)
+            present = flip_employee_presence(employee.id, date_obj)
 
-            if not created:
-                # Инвертируем статус присутствия
-                attendance.present = not attendance.present
-                attendance.save()
-
-            return JsonResponse({"status": "success", "present": attendance.present})
+            return JsonResponse({"status": "success", "present": present})
 
         except Exception as e:
             return JsonResponse({"status": "error", "message": str(e)}, status=400)
@@ -382,33 +434,24 @@ def employee_export_excel(request):
     else:
         employees = Employee.objects.all()
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Сотрудники"
-
-    ws.append(["ФИО", "Должность", "Филиал", "Смена", "Ставка за день"])
+    employees = employees.select_related("position", "branch", "schedule")
 
-    for employee in employees:
-        ws.append(
-            [
+    def rows():
+        for employee in employees.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
                 employee.full_name,
                 employee.position.name,
                 employee.branch.name if employee.branch else "",
                 employee.schedule.name if employee.schedule else "",
                 employee.rate_per_day,
             ]
-        )
-
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
 
-    response = HttpResponse(
-        buffer,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    return excel_export_response(
+        "employees.xlsx",
+        "Сотрудники",
+        ["ФИО", "Должность", "Филиал", "Смена", "Ставка за день"],
+        rows(),
     )
-    response["Content-Disposition"] = "attachment; filename=employees.xlsx"
-    return response
 
 
 @role_required(["manager", "admin"])
@@ -434,10 +477,4 @@ def employee_export_pdf(request):
     html_string = render_to_string(
         "employees/employee_pdf_template.html", {"employees": employees}
     )
-    html = HTML(string=html_string)
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = "inline; filename=employees.pdf"
-    html.write_pdf(response)
-
-    return response
+    return pdf_response(html_string, "employees.pdf")
@@ -88,8 +88,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "core.views.get_open_tickets_count",
-                "core.context_processors.unread_tickets_count",
+                "core.context_processors.ticket_counts",
             ],
         },
     },
@@ -165,11 +164,41 @@ LOGOUT_REDIRECT_URL = "login"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Общий для всех процессов файловый кэш: сброс статистики дашборда
+# сигналами виден каждому воркеру
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_DIR", BASE_DIR / "cache"),
+        "TIMEOUT": 300,
+    }
+}
+
+# Время жизни кэша статистики дашборда (core/stats.py), секунды
+DASHBOARD_STATS_TTL = int(os.getenv("DASHBOARD_STATS_TTL", 300))
+
+# Кэш выгрузок смен (schedule/export_cache.py). В выгрузках персональные
+# данные учеников, поэтому каталог не должен раздаваться как MEDIA
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", BASE_DIR / "export_cache")
+EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = 6903748145
+# Очередь уведомлений (core/telegram.py): адрес Bot API (для тестов — локальная
+# заглушка), пауза между сообщениями в один чат, число попыток и размер пачки
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_CHAT_INTERVAL = 1.0
+TELEGRAM_MAX_ATTEMPTS = 8
+TELEGRAM_BATCH_SIZE = 50
+
+# Рендер PDF (core/pdf.py): число процессов пула (0 — рендер в процессе
+# запроса), таймаут в секундах и максимум одновременных заданий
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", 2))
+PDF_RENDER_TIMEOUT = 60
+PDF_RENDER_MAX_JOBS = 4
 
 
 LOGGING = {
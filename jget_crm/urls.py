@@ -13,6 +13,7 @@ api = NinjaAPI(title="J-GET CAMP API", csrf=False)
 
 # Импортируем все API-роутеры
 from core.api import router as core_router
+from core.api import analytics_router
 from students.api import router as students_router
 from employees.api import employees_router
 from employees.api import attendances_router
@@ -25,6 +26,7 @@ from schedule.api import filters_router
 
 # Подключаем роутеры
 api.add_router("", core_router) 
+api.add_router("analytics/", analytics_router)
 api.add_router("students/", students_router)
 api.add_router("employees/", employees_router)
 api.add_router("/employees/attendances/", attendances_router)
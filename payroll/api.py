@@ -6,6 +6,7 @@ from django.core.exceptions import PermissionDenied
 
 from students.models import Payment
 from .models import Expense, Salary
+from .services import recalculate_dirty_salaries
 from .schemas import (
     ExpenseSchema,
     ExpenseCreateSchema,
@@ -43,7 +44,7 @@ def delete_expense(request, expense_id: int):
 # Salary Endpoints
 @router.get("/salaries/", response=list[SalarySchema])
 def list_salaries(request):
-    return Salary.objects.all()
+    return Salary.objects.with_days_worked().select_related("employee", "schedule")
 
 
 @router.post("/salaries/", response=SalarySchema)
@@ -54,7 +55,9 @@ def create_salary(request, data: SalaryCreateSchema):
     schedule = get_object_or_404(Schedule, id=data.schedule_id)
 
     salary = Salary(employee=employee, schedule=schedule, **data.dict())
-    salary.save()  # Расчет произойдет автоматически в методе save()
+    salary.save()  # save() помечает зарплату к пересчёту
+    recalculate_dirty_salaries(Salary.objects.filter(pk=salary.pk))
+    salary.refresh_from_db()
     return salary
 
 
@@ -67,7 +70,9 @@ def update_salary(request, salary_id: int, data: SalaryCreateSchema):
     for attr, value in data.dict().items():
         setattr(salary, attr, value)
 
-    salary.save()  # Расчет произойдет автоматически
+    salary.save()  # save() помечает зарплату к пересчёту
+    recalculate_dirty_salaries(Salary.objects.filter(pk=salary.pk))
+    salary.refresh_from_db()
     return salary
 
 
@@ -5,4 +5,6 @@ class PayrollConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "payroll"
 
-
+    def ready(self):
+        # Регистрируем сигналы
+        import payroll.signals
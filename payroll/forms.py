@@ -1,5 +1,6 @@
 from django import forms
 
+from schedule.models import Schedule
 from students.models import Payment
 from .models import Expense, ExpenseCategory, Salary
 
@@ -82,3 +83,44 @@ class PaymentForm(forms.ModelForm):
         widgets = {
             "date": forms.DateInput(attrs={"type": "date"}),
         }
+
+
+class PayrollRunForm(forms.Form):
+    """
+    Параметры массового расчёта зарплат по сменам.
+    """
+
+    schedules = forms.ModelMultipleChoiceField(
+        queryset=Schedule.objects.all(),
+        label="Смены",
+        widget=forms.SelectMultiple(attrs={"class": "form-select", "size": 8}),
+    )
+    payment_type = forms.ChoiceField(
+        choices=Salary.PAYMENT_TYPE_CHOICES,
+        initial="fixed",
+        label="Тип выплаты для новых зарплат",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    percent_rate = forms.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        initial=0,
+        min_value=0,
+        label="Процент от оплаты",
+        widget=forms.NumberInput(attrs={"class": "form-control"}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop("user", None)
+        super().__init__(*args, **kwargs)
+
+        # Для администраторов ограничиваем выбор смен только филиалами их города
+        if (
+            self.user
+            and self.user.is_authenticated
+            and self.user.role == "admin"
+            and self.user.city
+        ):
+            self.fields["schedules"].queryset = self.fields[
+                "schedules"
+            ].queryset.filter(branch__city=self.user.city)
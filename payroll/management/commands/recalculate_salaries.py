@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payroll.services import RECALC_BATCH_SIZE, recalculate_dirty_salaries
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает невыплаченные зарплаты, помеченные как устаревшие (для cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=RECALC_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        updated = recalculate_dirty_salaries(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано зарплат: {updated}"))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payroll", "0004_expensecategory_alter_expense_category"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salary",
+            name="needs_recalc",
+            field=models.BooleanField(
+                db_index=True,
+                default=True,
+                editable=False,
+                verbose_name="Требует пересчёта",
+            ),
+        ),
+    ]
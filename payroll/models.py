@@ -1,7 +1,11 @@
-from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
 from django.db import models
-from employees.models import Employee
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from employees.models import Employee, EmployeeAttendance
 from schedule.models import Schedule
+from students.models import Payment
 
 
 class ExpenseCategory(models.Model):
@@ -30,6 +34,30 @@ class Expense(models.Model):
         return f"{self.category.name} — {self.amount}"
 
 
+class SalaryQuerySet(models.QuerySet):
+    def with_days_worked(self):
+        """
+        Аннотирует worked_days — дни присутствия сотрудника в границах смены
+        (коррелированный подзапрос по EmployeeAttendance), чтобы список
+        зарплат не делал отдельный COUNT на каждую строку.
+        """
+        worked = (
+            EmployeeAttendance.objects.filter(
+                employee=OuterRef("employee_id"),
+                present=True,
+                date__gte=OuterRef("schedule__start_date"),
+                date__lte=OuterRef("schedule__end_date"),
+            )
+            .order_by()
+            .values("employee")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        return self.annotate(
+            worked_days=Coalesce(Subquery(worked, output_field=IntegerField()), 0)
+        )
+
+
 class Salary(models.Model):
     """
     Зарплата сотрудника за смену с учётом типа выплаты.                                                                                              
@@ -74,51 +102,94 @@ class Salary(models.Model):
         verbose_name="Итоговая сумма выплаты",
     )
     is_paid = models.BooleanField(default=False, verbose_name="Выплачено")
+    # Итог устарел (изменились посещаемость, ставка или условия выплаты);
+    # пересчитывается пачкой в payroll.services.recalculate_dirty_salaries
+    needs_recalc = models.BooleanField(
+        default=True, db_index=True, editable=False, verbose_name="Требует пересчёта"
+    )
 
 
+    objects = SalaryQuerySet.as_manager()
+
     def calculate_days_worked(self):
         """
         Расчёт количества отработанных дней на основе посещаемости.
         """
-        from employees.models import EmployeeAttendance
-
-        # Получаем все даты смены
-        dates = [
-            self.schedule.start_date + timedelta(days=i)
-            for i in range((self.schedule.end_date - self.schedule.start_date).days + 1)
-        ]
-
-        # Считаем количество дней с отметкой "присутствовал"
+        # Считаем количество дней смены с отметкой "присутствовал"
         return EmployeeAttendance.objects.filter(
-            employee=self.employee, date__in=dates, present=True
+            employee_id=self.employee_id,
+            date__range=(self.schedule.start_date, self.schedule.end_date),
+            present=True,
         ).count()
 
-    def calculate_total_payment(self):
+    def calculate_schedule_balance(self):
         """
-        Расчёт итоговой суммы выплаты в зависимости от типа выплаты.
+        Баланс смены, от которого считается процент: платежи учеников за
+        смену минус её расходы.
         """
-        days_worked = self.calculate_days_worked()
-
+        paid = Payment.objects.filter(schedule_id=self.schedule_id).aggregate(
+            total=Sum("amount")
+        )["total"]
+        spent = Expense.objects.filter(schedule_id=self.schedule_id).aggregate(
+            total=Sum("amount")
+        )["total"]
+        return (paid or 0) - (spent or 0)
+
+    def calculate_total_payment(self, days_worked=None, schedule_balance=None):
+        """
+        Расчёт итоговой суммы выплаты в зависимости от типа выплаты:
+        фиксированная часть — дни × ставка, процентная — percent_rate
+        процентов от баланса смены, округлённые до рубля. days_worked и
+        schedule_balance можно передать заранее посчитанными (массовый расчёт).
+        """
+        if days_worked is None:
+            days_worked = self.calculate_days_worked()
+        fixed = days_worked * Decimal(self.daily_rate)
         if self.payment_type == "fixed":
-            self.total_payment = days_worked * self.daily_rate
-        elif self.payment_type == "percent":
-            self.total_payment = (
-                self.percent_rate
-            )  # Подразумевается ручной ввод суммы с учётом процента
+            self.total_payment = fixed
+            return self.total_payment
+
+        if schedule_balance is None:
+            schedule_balance = self.calculate_schedule_balance()
+        percent = (
+            Decimal(schedule_balance) * Decimal(self.percent_rate) / 100
+        ).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+        if self.payment_type == "percent":
+            self.total_payment = percent
         elif self.payment_type == "combined":
-            self.total_payment = (days_worked * self.daily_rate) + self.percent_rate
+            self.total_payment = fixed + percent
         return self.total_payment
 
     def save(self, *args, **kwargs):
         if not self.daily_rate or self.daily_rate == 0:
             self.daily_rate = self.employee.rate_per_day
+        if not self.is_paid:
+            self.needs_recalc = True
+        elif self._becomes_paid():
+            # Выплаченные зарплаты больше не пересчитываются: итог фиксируем
+            # по текущим данным в момент выплаты
+            self.calculate_total_payment()
+            self.needs_recalc = False
         super().save(*args, **kwargs)
 
+    def _becomes_paid(self):
+        """
+        Зарплата сохраняется выплаченной впервые. Итог, заданный вручную при
+        создании уже выплаченной зарплаты (админка, перенос данных), не
+        пересчитывается.
+        """
+        if self._state.adding:
+            return not self.total_payment
+        return not Salary.objects.filter(pk=self.pk, is_paid=True).exists()
+
     @property
     def days_worked(self):
         """
         Свойство для получения количества отработанных дней.
+        Берёт аннотацию SalaryQuerySet.with_days_worked(), если она есть.
         """
+        if hasattr(self, "worked_days"):
+            return self.worked_days
         return self.calculate_days_worked()
 
     class Meta:
@@ -25,6 +25,7 @@ class SalarySchema(Schema):
     percent_rate: float
     total_payment: float
     is_paid: bool
+    days_worked: int = 0
 
 
 class SalaryCreateSchema(Schema):
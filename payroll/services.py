@@ -0,0 +1,255 @@
+# payroll/services.py
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Round
+
+from core.rollup import refresh_monthly_stats, rollup_cells
+from core.stats import invalidate_dashboard_stats
+from employees.models import Employee, EmployeeAttendance
+from schedule.models import Schedule
+from students.models import Payment
+
+from .models import Expense, Salary
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+SALARY_RUN_FIELDS = [
+    "payment_type",
+    "daily_rate",
+    "percent_rate",
+    "total_payment",
+    "needs_recalc",
+]
+
+RECALC_BATCH_SIZE = 500
+PERCENT_PAYMENT_TYPES = ["percent", "combined"]
+
+
+def get_schedule_balances(schedule_ids):
+    """
+    Балансы смен для процентных зарплат: {schedule_id: платежи − расходы},
+    по одному сгруппированному запросу на платежи и на расходы.
+    """
+    balances = {schedule_id: 0 for schedule_id in schedule_ids}
+    for model, sign in ((Payment, 1), (Expense, -1)):
+        rows = (
+            model.objects.filter(schedule__in=balances)
+            .order_by()
+            .values("schedule")
+            .annotate(total=Sum("amount"))
+        )
+        for row in rows:
+            balances[row["schedule"]] += sign * row["total"]
+    return balances
+
+
+def run_payroll(schedules, payment_type="fixed", percent_rate=0, dry_run=False):
+    """
+    Массовый расчёт зарплат всех сотрудников, прикреплённых к сменам.
+
+    Отработанные дни считаются одним сгруппированным запросом по
+    EmployeeAttendance в границах смены сотрудника. Для сотрудника без
+    зарплаты за смену создаётся новая строка с payment_type/percent_rate
+    из параметров, у существующей невыплаченной сохраняются её тип и
+    процент, а ставка берётся текущая из карточки сотрудника. Выплаченные
+    зарплаты не трогаем.
+
+    Возвращает список Salary (у новых pk=None при dry_run) с атрибутом
+    worked_days; при dry_run в БД ничего не пишется.
+    """
+    employees = (
+        Employee.objects.filter(schedule__in=schedules)
+        .select_related("schedule")
+        .annotate(
+            worked_days=Count(
+                "attendances",
+                filter=Q(
+                    attendances__present=True,
+                    attendances__date__gte=F("schedule__start_date"),
+                    attendances__date__lte=F("schedule__end_date"),
+                ),
+            )
+        )
+        .order_by("schedule__start_date", "full_name")
+    )
+    employees = list(employees)
+
+    # Последняя зарплата по каждой паре (сотрудник, смена)
+    existing = {}
+    for salary in Salary.objects.filter(
+        schedule__in={employee.schedule_id for employee in employees},
+        employee__in=[employee.pk for employee in employees],
+    ).order_by("id"):
+        existing[(salary.employee_id, salary.schedule_id)] = salary
+
+    balances = get_schedule_balances({employee.schedule_id for employee in employees})
+
+    to_create, to_update, results = [], [], []
+    for employee in employees:
+        salary = existing.get((employee.pk, employee.schedule_id))
+        if salary is None:
+            salary = Salary(
+                employee=employee,
+                schedule=employee.schedule,
+                payment_type=payment_type,
+                percent_rate=percent_rate,
+            )
+            to_create.append(salary)
+        elif salary.is_paid:
+            continue
+        else:
+            salary.employee = employee
+            salary.schedule = employee.schedule
+            to_update.append(salary)
+
+        salary.daily_rate = employee.rate_per_day or 0
+        salary.calculate_total_payment(
+            days_worked=employee.worked_days,
+            schedule_balance=balances[employee.schedule_id],
+        )
+        salary.needs_recalc = False
+        salary.worked_days = employee.worked_days
+        results.append(salary)
+
+    if not dry_run:
+        with transaction.atomic():
+            Salary.objects.bulk_create(to_create)
+            Salary.objects.bulk_update(to_update, SALARY_RUN_FIELDS)
+        # bulk-операции не шлют сигналы
+        invalidate_dashboard_stats()
+        refresh_monthly_stats(
+            {(s.schedule.branch_id, s.schedule.start_date) for s in results},
+            fields=["salaries"],
+        )
+
+    return results
+
+
+def mark_salaries_dirty(employee_ids, period=None):
+    """
+    Помечает невыплаченные зарплаты сотрудников как требующие пересчёта.
+    period=(start, end) ограничивает пометку сменами, пересекающими период.
+    """
+    salaries = Salary.objects.filter(
+        employee__in=employee_ids, is_paid=False, needs_recalc=False
+    )
+    if period is not None:
+        salaries = salaries.filter(
+            schedule__start_date__lte=period[1], schedule__end_date__gte=period[0]
+        )
+    return salaries.update(needs_recalc=True)
+
+
+def mark_percent_salaries_dirty(schedule_ids):
+    """
+    Помечает невыплаченные процентные зарплаты смен: их итог зависит от
+    платежей и расходов смены.
+    """
+    return Salary.objects.filter(
+        schedule__in=schedule_ids,
+        payment_type__in=PERCENT_PAYMENT_TYPES,
+        is_paid=False,
+        needs_recalc=False,
+    ).update(needs_recalc=True)
+
+
+def _schedule_total(model):
+    """Сумма amount строк model по смене зарплаты — подзапрос для UPDATE."""
+    total = (
+        model.objects.filter(schedule=OuterRef("schedule_id"))
+        .order_by()
+        .values("schedule")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    return Coalesce(Subquery(total, output_field=MONEY), Value(0), output_field=MONEY)
+
+
+def _recalc_changes():
+    """
+    SET-выражения пересчёта строки Salary целиком на стороне БД: ставка
+    берётся текущая из карточки сотрудника, дни — из EmployeeAttendance в
+    границах смены, баланс смены — из Payment и Expense. Формулы повторяют
+    Salary.calculate_total_payment.
+    """
+    schedule = Schedule.objects.filter(pk=OuterRef(OuterRef("schedule_id")))
+    worked = (
+        EmployeeAttendance.objects.filter(
+            employee=OuterRef("employee_id"),
+            present=True,
+            date__gte=Subquery(schedule.values("start_date")),
+            date__lte=Subquery(schedule.values("end_date")),
+        )
+        .order_by()
+        .values("employee")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    days = Coalesce(Subquery(worked, output_field=IntegerField()), 0)
+    rate = Subquery(
+        Employee.objects.filter(pk=OuterRef("employee_id")).values("rate_per_day"),
+        output_field=MONEY,
+    )
+    fixed = ExpressionWrapper(days * rate, output_field=MONEY)
+    balance = ExpressionWrapper(
+        _schedule_total(Payment) - _schedule_total(Expense), output_field=MONEY
+    )
+    # SQLite хранит целые суммы как INTEGER и делит их нацело
+    hundred = Value(100.0 if connection.vendor == "sqlite" else 100)
+    percent = Round(
+        ExpressionWrapper(balance * F("percent_rate") / hundred, output_field=MONEY),
+        output_field=MONEY,
+    )
+    return {
+        "daily_rate": rate,
+        "total_payment": Case(
+            When(payment_type="fixed", then=fixed),
+            When(payment_type="percent", then=percent),
+            When(
+                payment_type="combined",
+                then=ExpressionWrapper(fixed + percent, output_field=MONEY),
+            ),
+            default=F("total_payment"),
+            output_field=MONEY,
+        ),
+        "needs_recalc": False,
+    }
+
+
+def recalculate_dirty_salaries(salaries=None, batch_size=RECALC_BATCH_SIZE):
+    """
+    Пересчитывает помеченные невыплаченные зарплаты пачками по batch_size:
+    на пачку один SELECT идентификаторов и один UPDATE с подзапросами,
+    без загрузки строк в Python. salaries — необязательный queryset,
+    ограничивающий пересчёт. Возвращает число пересчитанных строк.
+    """
+    if salaries is None:
+        salaries = Salary.objects.all()
+    dirty = salaries.filter(needs_recalc=True, is_paid=False)
+    changes = _recalc_changes()
+
+    updated = 0
+    while True:
+        ids = list(dirty.values_list("pk", flat=True)[:batch_size])
+        if ids:
+            updated += Salary.objects.filter(
+                pk__in=ids, needs_recalc=True, is_paid=False
+            ).update(**changes)
+            refresh_monthly_stats(rollup_cells(Salary, pk__in=ids), fields=["salaries"])
+        if len(ids) < batch_size:
+            if updated:
+                invalidate_dashboard_stats()
+            return updated
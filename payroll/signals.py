@@ -0,0 +1,38 @@
+# payroll/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from employees.models import Employee, EmployeeAttendance
+from payroll.models import Expense, Salary
+from payroll.services import mark_percent_salaries_dirty, mark_salaries_dirty
+from students.models import Payment
+
+# Итоги невыплаченных зарплат зависят от посещаемости и ставки сотрудника,
+# процентные — ещё от платежей и расходов смены: здесь строки только
+# помечаются, пересчёт — recalculate_dirty_salaries.
+
+
+@receiver(post_save, sender=EmployeeAttendance)
+@receiver(post_delete, sender=EmployeeAttendance)
+def mark_attendance_salaries(sender, instance, origin=None, **kwargs):
+    if origin is not None and getattr(origin, "model", type(origin)) is not sender:
+        # Каскадное удаление вместе с сотрудником: зарплаты уйдут тоже
+        return
+    mark_salaries_dirty([instance.employee_id], period=(instance.date, instance.date))
+
+
+@receiver(post_save, sender=Employee)
+def mark_rate_salaries(sender, instance, created, **kwargs):
+    """Ставка сотрудника изменилась — невыплаченные зарплаты по старой ставке устарели."""
+    if not created:
+        Salary.objects.filter(
+            employee=instance, is_paid=False, needs_recalc=False
+        ).exclude(daily_rate=instance.rate_per_day).update(needs_recalc=True)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def mark_percent_salaries(sender, instance, **kwargs):
+    mark_percent_salaries_dirty([instance.schedule_id])
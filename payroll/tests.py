@@ -1,9 +1,11 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
-from payroll.models import Expense, Salary
+from payroll.models import Expense, ExpenseCategory, Salary
+from payroll.services import recalculate_dirty_salaries, run_payroll
 from schedule.models import Schedule
-from branches.models import Branch
-from employees.models import Employee
+from branches.models import Branch, City
+from employees.models import Employee, EmployeeAttendance, Position
+from students.models import Payment, Student
 import json
 from datetime import date
 
@@ -93,3 +95,354 @@ class PayrollApiTests(TestCase):
         self.assertEqual(Salary.objects.count(), 1)
         salary = Salary.objects.first()
         self.assertEqual(salary.total_payment, 15000)
+
+
+class SalaryDaysWorkedTests(TestCase):
+    """
+    Отработанные дни в списке зарплат считаются одной аннотацией.
+    """
+
+    def setUp(self):
+        branch = Branch.objects.create(name="Тестовый филиал")
+        self.schedule = Schedule.objects.create(
+            name="Тестовая смена",
+            branch=branch,
+            start_date=date(2025, 7, 1),
+            end_date=date(2025, 7, 5),
+            theme="Робототехника",
+        )
+        position = Position.objects.create(name="Вожатый")
+        for i, days in enumerate((0, 2, 3)):
+            employee = Employee.objects.create(
+                full_name=f"Сотрудник {i}", position=position, rate_per_day=1000
+            )
+            for day in range(1, days + 1):
+                EmployeeAttendance.objects.create(
+                    employee=employee, date=date(2025, 7, day), present=True
+                )
+            # Посещение вне смены не учитывается
+            EmployeeAttendance.objects.create(
+                employee=employee, date=date(2025, 7, 20), present=True
+            )
+            Salary.objects.create(employee=employee, schedule=self.schedule)
+
+    def test_days_worked_annotation(self):
+        with self.assertNumQueries(1):
+            salaries = list(
+                Salary.objects.with_days_worked()
+                .select_related("employee", "schedule")
+                .order_by("employee__full_name")
+            )
+            days = [salary.days_worked for salary in salaries]
+
+        self.assertEqual(days, [0, 2, 3])
+        self.assertEqual(
+            [salary.calculate_days_worked() for salary in salaries], [0, 2, 3]
+        )
+
+
+class PayrollRunTests(TestCase):
+    """
+    Массовый расчёт зарплат по смене.
+    """
+
+    def setUp(self):
+        branch = Branch.objects.create(name="Тестовый филиал")
+        self.schedule = Schedule.objects.create(
+            name="Тестовая смена",
+            branch=branch,
+            start_date=date(2025, 7, 1),
+            end_date=date(2025, 7, 5),
+            theme="Робототехника",
+        )
+        position = Position.objects.create(name="Вожатый")
+        self.employees = []
+        for i, days in enumerate((1, 2, 3)):
+            employee = Employee.objects.create(
+                full_name=f"Сотрудник {i}",
+                position=position,
+                schedule=self.schedule,
+                rate_per_day=1000,
+            )
+            for day in range(1, days + 1):
+                EmployeeAttendance.objects.create(
+                    employee=employee, date=date(2025, 7, day), present=True
+                )
+            self.employees.append(employee)
+
+        # Баланс смены 10000: процент считается от платежей за вычетом расходов
+        Payment.objects.create(
+            student=Student.objects.create(full_name="Ученик"),
+            schedule=self.schedule,
+            amount=12000,
+        )
+        Expense.objects.create(
+            schedule=self.schedule,
+            category=ExpenseCategory.objects.create(name="Материалы"),
+            amount=2000,
+        )
+
+        # Невыплаченная зарплата обновляется с сохранением типа выплаты
+        self.unpaid = Salary.objects.create(
+            employee=self.employees[1],
+            schedule=self.schedule,
+            payment_type="combined",
+            percent_rate=5,
+        )
+        # Выплаченная не пересчитывается
+        self.paid = Salary.objects.create(
+            employee=self.employees[2],
+            schedule=self.schedule,
+            total_payment=100,
+            is_paid=True,
+        )
+
+    def test_dry_run_writes_nothing(self):
+        # Сотрудники с днями, зарплаты, платежи и расходы смен
+        with self.assertNumQueries(4):
+            salaries = run_payroll([self.schedule], dry_run=True)
+
+        self.assertEqual(
+            [(s.employee_id, s.total_payment) for s in salaries],
+            [(self.employees[0].pk, 1000), (self.employees[1].pk, 2500)],
+        )
+        self.assertEqual(Salary.objects.count(), 2)
+        self.unpaid.refresh_from_db()
+        self.assertEqual(self.unpaid.total_payment, 0)
+
+    def test_run_creates_and_updates(self):
+        run_payroll([self.schedule])
+
+        created = Salary.objects.get(employee=self.employees[0])
+        self.assertEqual(created.payment_type, "fixed")
+        self.assertEqual(created.total_payment, 1000)
+        self.unpaid.refresh_from_db()
+        self.assertEqual(self.unpaid.total_payment, 2500)
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.total_payment, 100)
+
+    def test_view_preview_and_commit(self):
+        user = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+        self.client.force_login(user)
+        data = {"schedules": [self.schedule.pk], "payment_type": "fixed"}
+        data["percent_rate"] = "0"
+
+        response = self.client.post("/payroll/salaries/run/", {**data, "preview": ""})
+        self.assertContains(response, "Предпросмотр")
+        self.assertEqual(Salary.objects.count(), 2)
+
+        response = self.client.post("/payroll/salaries/run/", {**data, "commit": ""})
+        self.assertContains(response, "Зарплаты сохранены: 2")
+        self.assertEqual(Salary.objects.count(), 3)
+
+
+class SalaryRecalcTests(TestCase):
+    """
+    Пометка зарплат при изменении посещаемости и ставки и пакетный пересчёт.
+    """
+
+    def setUp(self):
+        branch = Branch.objects.create(name="Тестовый филиал")
+        self.schedule = Schedule.objects.create(
+            name="Тестовая смена",
+            branch=branch,
+            start_date=date(2025, 7, 1),
+            end_date=date(2025, 7, 5),
+            theme="Робототехника",
+        )
+        position = Position.objects.create(name="Вожатый")
+        self.employee = Employee.objects.create(
+            full_name="Сотрудник",
+            position=position,
+            schedule=self.schedule,
+            rate_per_day=1000,
+        )
+        self.salary = Salary.objects.create(
+            employee=self.employee, schedule=self.schedule
+        )
+        self.paid = Salary.objects.create(
+            employee=self.employee,
+            schedule=self.schedule,
+            total_payment=100,
+            is_paid=True,
+        )
+        recalculate_dirty_salaries()
+
+    def test_attendance_marks_and_recalculates(self):
+        self.salary.refresh_from_db()
+        self.assertFalse(self.salary.needs_recalc)
+
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 7, 2), present=True
+        )
+        # Посещение вне смены зарплату не трогает
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 8, 2), present=True
+        )
+        self.salary.refresh_from_db()
+        self.assertTrue(self.salary.needs_recalc)
+
+        # SELECT id + UPDATE пачки, затем пересчёт помесячных итогов
+        # зарплат (ячейки, агрегат и upsert в SAVEPOINT)
+        with self.assertNumQueries(8):
+            self.assertEqual(recalculate_dirty_salaries(), 1)
+        self.salary.refresh_from_db()
+        self.assertFalse(self.salary.needs_recalc)
+        self.assertEqual(self.salary.total_payment, 1000)
+
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.total_payment, 100)
+
+    def test_rate_change_and_combined(self):
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 7, 1), present=True
+        )
+        Payment.objects.create(
+            student=Student.objects.create(full_name="Ученик"),
+            schedule=self.schedule,
+            amount=3000,
+        )
+        self.salary.payment_type = "combined"
+        self.salary.percent_rate = 10
+        self.salary.save()
+        recalculate_dirty_salaries()
+
+        self.employee.rate_per_day = 2000
+        self.employee.save()
+        self.salary.refresh_from_db()
+        self.assertTrue(self.salary.needs_recalc)
+
+        recalculate_dirty_salaries()
+        self.salary.refresh_from_db()
+        self.assertEqual(self.salary.daily_rate, 2000)
+        self.assertEqual(self.salary.total_payment, 2300)
+        self.assertEqual(
+            self.salary.calculate_total_payment(), self.salary.total_payment
+        )
+
+    def test_payments_and_expenses_mark_percent_salaries(self):
+        self.salary.payment_type = "percent"
+        self.salary.percent_rate = 10
+        self.salary.save()
+        recalculate_dirty_salaries()
+
+        payment = Payment.objects.create(
+            student=Student.objects.create(full_name="Ученик"),
+            schedule=self.schedule,
+            amount=5005,
+        )
+        self.salary.refresh_from_db()
+        self.assertTrue(self.salary.needs_recalc)
+        recalculate_dirty_salaries()
+        self.salary.refresh_from_db()
+        # 10% от 5005, округлено до рубля
+        self.assertEqual(self.salary.total_payment, 501)
+
+        Expense.objects.create(
+            schedule=self.schedule,
+            category=ExpenseCategory.objects.create(name="Материалы"),
+            amount=1005,
+        )
+        payment.delete()
+        recalculate_dirty_salaries()
+        self.salary.refresh_from_db()
+        self.assertEqual(self.salary.total_payment, -101)
+        self.assertEqual(
+            self.salary.calculate_total_payment(), self.salary.total_payment
+        )
+
+    def test_total_is_calculated_when_salary_becomes_paid(self):
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 7, 1), present=True
+        )
+        self.salary.refresh_from_db()
+        self.assertTrue(self.salary.needs_recalc)
+
+        self.salary.is_paid = True
+        self.salary.save()
+        self.salary.refresh_from_db()
+        self.assertEqual(self.salary.total_payment, 1000)
+        self.assertFalse(self.salary.needs_recalc)
+
+        created_paid = Salary.objects.create(
+            employee=self.employee, schedule=self.schedule, is_paid=True
+        )
+        self.assertEqual(created_paid.total_payment, 1000)
+
+    def test_list_is_read_only_and_recalculate_is_scoped(self):
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 7, 1), present=True
+        )
+        manager = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+        admin = get_user_model().objects.create_user(
+            username="admin",
+            password="password",
+            role="admin",
+            city=City.objects.create(name="Другой город"),
+        )
+
+        self.client.force_login(manager)
+        self.assertEqual(self.client.get("/payroll/salaries/").status_code, 200)
+        self.salary.refresh_from_db()
+        self.assertTrue(self.salary.needs_recalc)
+
+        # Администратор другого города чужие зарплаты не пересчитывает
+        self.client.force_login(admin)
+        response = self.client.post("/payroll/salaries/recalculate/")
+        self.assertEqual(response.json()["updated"], 0)
+        self.salary.refresh_from_db()
+        self.assertTrue(self.salary.needs_recalc)
+
+        self.client.force_login(manager)
+        response = self.client.post("/payroll/salaries/recalculate/")
+        self.assertEqual(response.json()["updated"], 1)
+        self.salary.refresh_from_db()
+        self.assertEqual(self.salary.total_payment, 1000)
+
+    def test_salary_form_saves_calculated_total(self):
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 7, 1), present=True
+        )
+        self.client.force_login(
+            get_user_model().objects.create_user(
+                username="manager", password="password", role="manager"
+            )
+        )
+        response = self.client.post(
+            f"/payroll/salaries/edit/{self.salary.pk}/",
+            {
+                "employee": self.employee.pk,
+                "schedule": self.schedule.pk,
+                "payment_type": "fixed",
+                "percent_rate": "0",
+            },
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertTrue(response.json()["success"])
+        self.salary.refresh_from_db()
+        self.assertFalse(self.salary.needs_recalc)
+        self.assertEqual(self.salary.total_payment, 1000)
+
+    def test_update_employee_salaries_api(self):
+        user = get_user_model().objects.create_user(
+            username="manager", password="password", role="manager"
+        )
+        self.client.force_login(user)
+        EmployeeAttendance.objects.create(
+            employee=self.employee, date=date(2025, 7, 1), present=True
+        )
+
+        response = self.client.post(
+            f"/api/employees/{self.employee.id}/update_salaries/",
+            data=json.dumps({"rate_per_day": 1500}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.salary.refresh_from_db()
+        self.assertEqual(self.salary.total_payment, 1500)
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.daily_rate, 1000)
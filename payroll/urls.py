@@ -13,6 +13,8 @@ urlpatterns += [
     path('salaries/create/', views.salary_create, name='salary_create'),
     path('salaries/edit/<int:pk>/', views.salary_edit, name='salary_edit'),
     path('salaries/delete/<int:pk>/', views.salary_delete, name='salary_delete'),
+    path('salaries/run/', views.payroll_run, name='payroll_run'),
+    path('salaries/recalculate/', views.salary_recalculate, name='salary_recalculate'),
 ]
 
 
@@ -5,7 +5,8 @@ from django.db import models
 
 from core.utils import role_required
 from employees.models import Employee
-from payroll.forms import ExpenseForm, SalaryForm
+from payroll.forms import ExpenseForm, PayrollRunForm, SalaryForm
+from payroll.services import recalculate_dirty_salaries, run_payroll
 from schedule.models import Schedule
 from .models import Expense, Salary
 
@@ -36,10 +37,8 @@ def expense_list(request):
     )
 
 
-@role_required(["manager", "admin"])
-def salary_list(request):
-    user = request.user
-
+def _salary_scope(user):
+    """Зарплаты, сотрудники и смены, которые видит пользователь."""
     if user.role == "manager":
         salaries = Salary.objects.all()
         employees = Employee.objects.all()
@@ -54,10 +53,18 @@ def salary_list(request):
             salaries = Salary.objects.none()
             employees = Employee.objects.none()
             schedules = Schedule.objects.none()
+    return salaries, employees, schedules
+
+
+@role_required(["manager", "admin"])
+def salary_list(request):
+    # Только чтение: итоги хранятся в total_payment, помеченные строки
+    # пересчитывает кнопка «Пересчитать» (salary_recalculate) или команда
+    # recalculate_salaries
+    salaries, employees, schedules = _salary_scope(request.user)
 
-    # Добавляем вычисляемое поле
-    for salary in salaries:
-        salary.days_worked_display = salary.calculate_days_worked()
+    # Отработанные дни считаются подзапросом в том же SELECT
+    salaries = salaries.with_days_worked().select_related("employee", "schedule")
 
     total_salary = (
         salaries.aggregate(models.Sum("total_payment"))["total_payment__sum"] or 0
@@ -91,7 +98,8 @@ def salary_create(request):
     if request.method == "POST":
         form = SalaryForm(request.POST, user=request.user)  # Передаем пользователя
         if form.is_valid():
-            salary = form.save()
+            salary = form.save()  # save() помечает зарплату к пересчёту
+            recalculate_dirty_salaries(Salary.objects.filter(pk=salary.pk))
 
             if request.headers.get("X-Requested-With") == "XMLHttpRequest":
                 return JsonResponse({"success": True})
@@ -131,7 +139,8 @@ def salary_edit(request, pk):
             request.POST, instance=salary, user=request.user
         )  # Передаем пользователя
         if form.is_valid():
-            salary = form.save()
+            salary = form.save()  # save() помечает зарплату к пересчёту
+            recalculate_dirty_salaries(Salary.objects.filter(pk=salary.pk))
 
             if request.headers.get("X-Requested-With") == "XMLHttpRequest":
                 return JsonResponse({"success": True})
@@ -177,6 +186,53 @@ def salary_delete(request, pk):
         return JsonResponse({"success": False, "error": "Invalid request method"})
 
 
+@role_required(["manager", "admin"])
+def salary_recalculate(request):
+    """
+    Пересчёт помеченных зарплат по кнопке «Пересчитать» — только тех,
+    что пользователь видит в списке.
+    """
+    if request.method != "POST":
+        return JsonResponse({"success": False, "error": "Invalid request method"})
+
+    salaries, _, _ = _salary_scope(request.user)
+    updated = recalculate_dirty_salaries(salaries)
+    return JsonResponse({"success": True, "updated": updated})
+
+
+@role_required(["manager", "admin"])
+def payroll_run(request):
+    """
+    Массовый расчёт зарплат по выбранным сменам.
+    Кнопка «Предпросмотр» считает без записи, «Провести» сохраняет результат.
+    """
+    form = PayrollRunForm(request.POST or None, user=request.user)
+    salaries = None
+    committed = False
+
+    if request.method == "POST" and form.is_valid():
+        committed = "commit" in request.POST
+        salaries = run_payroll(
+            form.cleaned_data["schedules"],
+            payment_type=form.cleaned_data["payment_type"],
+            percent_rate=form.cleaned_data["percent_rate"],
+            dry_run=not committed,
+        )
+
+    total_payment = sum(salary.total_payment for salary in salaries or [])
+
+    return render(
+        request,
+        "payroll/payroll_run.html",
+        {
+            "form": form,
+            "salaries": salaries,
+            "committed": committed,
+            "total_payment": total_payment,
+        },
+    )
+
+
 def expense_create(request):
     """
     Создание нового расхода.
@@ -1,3 +1,5 @@
+from datetime import date
+
 from ninja import Router
 from django.db.models import Sum
 from django.shortcuts import get_object_or_404
@@ -5,7 +7,7 @@ from django.shortcuts import get_object_or_404
 from .models import Schedule, COLOR_CHOICES
 from branches.models import Branch
 from .schemas import ScheduleSchema, ScheduleCreateSchema
-from students.models import Payment
+from .services import ScheduleIntervalIndex, get_schedule_paid_total
 
 router = Router(tags=["Schedules"])
 filters_router = Router(tags=["Schedule filters"])
@@ -134,15 +136,26 @@ def get_schedule_balance(request, schedule_id: int):
     schedule = get_object_or_404(Schedule, id=schedule_id)
 
     # Расчет доходов (платежи студентов за эту смену)
-    total_income = (
-        Payment.objects.filter(schedule=schedule).aggregate(Sum("amount"))[
-            "amount__sum"
-        ]
-        or 0
-    )
+    total_income = get_schedule_paid_total(schedule)
 
     # Расчет расходов по смене
     total_expenses = schedule.expenses.aggregate(Sum("amount"))["amount__sum"] or 0
 
     balance = total_income - total_expenses
     return {"balance": balance}
+
+
+@filters_router.get("/period/", response=list[ScheduleSchema])
+def list_schedules_in_period(
+    request, start_date: date, end_date: date, branch_id: int = None
+):
+    user = request.user
+    schedules = Schedule.objects.all()
+
+    if hasattr(user, "role") and user.role == "admin" and user.city:
+        schedules = schedules.filter(branch__city=user.city)
+    elif hasattr(user, "role") and user.role in ["camp_head", "lab_head"]:
+        schedules = schedules.filter(branch=user.branch)
+
+    index = ScheduleIntervalIndex.for_period(start_date, end_date, schedules)
+    return index.overlapping(start_date, end_date, branch_id=branch_id)
@@ -5,4 +5,6 @@ class ScheduleConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "schedule"
 
-
+    def ready(self):
+        # Регистрируем сигналы
+        import schedule.signals
@@ -0,0 +1,39 @@
+# schedule/bitmaps.py
+"""
+Битовые маски дней смены: бит i соответствует дню start_date + i.
+
+Маски хранятся в BinaryField как little-endian байты и в Python
+обрабатываются как int, поэтому длина смены не ограничена 64 днями.
+"""
+
+
+def to_int(mask):
+    """Маска из БД (bytes/memoryview/None) -> int."""
+    return int.from_bytes(bytes(mask or b""), "little")
+
+
+def to_bytes(bits):
+    """int -> компактная маска для BinaryField."""
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def day_index(start_date, date):
+    return (date - start_date).days
+
+
+def has_day(bits, index):
+    return index >= 0 and bool(bits >> index & 1)
+
+
+def popcount(mask):
+    """Количество отмеченных дней в маске."""
+    return to_int(mask).bit_count()
+
+
+def mask_from_days(start_date, end_date, dates):
+    """Маска по набору дат; даты вне [start_date, end_date] отбрасываются."""
+    bits = 0
+    for date in dates:
+        if start_date <= date <= end_date:
+            bits |= 1 << day_index(start_date, date)
+    return to_bytes(bits)
@@ -0,0 +1,136 @@
+# schedule/export_cache.py
+import logging
+import os
+import tempfile
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from core.utils import XLSX_CONTENT_TYPE
+
+from .models import Schedule
+
+logger = logging.getLogger(__name__)
+
+# Значение по умолчанию; переопределяется в settings.py
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+CONTENT_TYPES = {"pdf": "application/pdf", "xlsx": XLSX_CONTENT_TYPE}
+
+
+def _cache_dir():
+    # Не под MEDIA_ROOT: MEDIA раздаётся без авторизации
+    path = Path(
+        getattr(settings, "EXPORT_CACHE_DIR", Path(settings.BASE_DIR) / "export_cache")
+    )
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _evict(cache_dir, keep):
+    """Удаляет давно не запрашивавшиеся файлы, пока кэш больше лимита (LRU по mtime)."""
+    max_bytes = getattr(settings, "EXPORT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+    files = []
+    for path in cache_dir.iterdir():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def _store(cache_dir, path, response):
+    """Сохраняет тело ответа на диск атомарно (через временный файл и rename)."""
+    # Старые версии этой же выгрузки больше не понадобятся
+    prefix = path.name.split("-v", 1)[0] + "-v"
+    for old in cache_dir.glob(prefix + "*"):
+        old.unlink(missing_ok=True)
+
+    fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as tmp:
+        if response.streaming:
+            for chunk in response.streaming_content:
+                tmp.write(chunk)
+        else:
+            tmp.write(response.content)
+    os.replace(tmp_name, path)
+    response.close()
+    _evict(cache_dir, keep=path)
+
+
+def cached_schedule_export(export_type, filename, as_attachment=False):
+    """
+    Декоратор выгрузки смены view(request, pk): кэширует готовый файл на диске
+    в EXPORT_CACHE_DIR по ключу (смена, тип выгрузки, data_version).
+
+    filename — шаблон имени файла для str.format с полем {name} (название
+    смены). Повторный запрос отдаётся с диска без обращения к данным смены,
+    клиенту с совпадающим If-None-Match отвечаем 304. Неуспешные ответы
+    (например, 503 от рендера PDF) не кэшируются.
+    """
+    extension = filename.rsplit(".", 1)[-1]
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, pk, *args, **kwargs):
+            row = (
+                Schedule.objects.filter(pk=pk)
+                .values_list("name", "data_version")
+                .first()
+            )
+            if row is None:
+                raise Http404("Смена не найдена")
+            name, version = row
+
+            key = f"schedule{pk}-{export_type}-v{version}"
+            etag = f'"{key}"'
+            if etag in parse_etags(request.headers.get("If-None-Match", "")):
+                response = HttpResponseNotModified()
+                response["ETag"] = etag
+                return response
+
+            cache_dir = _cache_dir()
+            path = cache_dir / f"{key}.{extension}"
+            if path.exists():
+                # Отмечаем использование для LRU
+                os.utime(path)
+            else:
+                response = view_func(request, pk, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                try:
+                    _store(cache_dir, path, response)
+                except OSError as exc:
+                    logger.warning(f"Не удалось закэшировать {key}: {exc}")
+                    return view_func(request, pk, *args, **kwargs)
+
+            try:
+                cached_file = open(path, "rb")
+            except FileNotFoundError:
+                # Файл успели вытеснить между проверкой и открытием
+                return view_func(request, pk, *args, **kwargs)
+
+            response = FileResponse(
+                cached_file,
+                as_attachment=as_attachment,
+                filename=filename.format(name=name),
+                content_type=CONTENT_TYPES[extension],
+            )
+            response["ETag"] = etag
+            return response
+
+        return _wrapped_view
+
+    return decorator
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="schedule",
+            name="data_version",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Версия данных"
+            ),
+        ),
+    ]
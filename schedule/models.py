@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models import F
 from branches.models import Branch
 
+from .bitmaps import day_index, has_day, popcount, to_int
+
 
 COLOR_CHOICES = [
     ("#ff6b6b", "Красный"),
@@ -28,10 +31,66 @@ class Schedule(models.Model):
         default="#cce6ff",
         verbose_name="Цвет маркировки",
     )
+    # Растёт при любом изменении данных смены; входит в ключ кэша выгрузок
+    data_version = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Версия данных"
+    )
 
     def __str__(self):
         return f"{self.name} ({self.start_date} — {self.end_date})"
 
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            # data_version меняет только bump_data_version; значение,
+            # загруженное раньше, откатило бы чужие увеличения версии
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "data_version"
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bump_data_version(cls, schedules):
+        """Увеличивает версию данных у переданных смен (id или queryset)."""
+        cls.objects.filter(pk__in=schedules).update(data_version=F("data_version") + 1)
+
     class Meta:
         verbose_name = "Смена"
         verbose_name_plural = "Смены"
+
+
+class AttendanceBitmap(models.Model):
+    """
+    Посещаемость за смену одной строкой: битовые маски по дням смены
+    (бит i — день schedule.start_date + i). Наследник обязан иметь поле
+    schedule. Маски пересобираются из построчных таблиц посещаемости
+    (schedule.services.rebuild_attendance_bitmaps).
+    """
+
+    present_days = models.BinaryField(
+        default=b"", editable=False, verbose_name="Дни присутствия"
+    )
+    excused_days = models.BinaryField(
+        default=b"", editable=False, verbose_name="Дни по уважительной причине"
+    )
+
+    class Meta:
+        abstract = True
+
+    def day_status(self, date):
+        """present / excused / absent для даты смены."""
+        index = day_index(self.schedule.start_date, date)
+        if has_day(to_int(self.present_days), index):
+            return "present"
+        if has_day(to_int(self.excused_days), index):
+            return "excused"
+        return "absent"
+
+    @property
+    def present_count(self):
+        return popcount(self.present_days)
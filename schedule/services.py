@@ -0,0 +1,675 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Coalesce, NullIf
+
+from employees.models import Employee, EmployeeAttendance, EmployeeScheduleAttendance
+from payroll.services import mark_salaries_dirty
+from students.models import Attendance, Payment, StudentSchedule
+
+from .bitmaps import (
+    day_index,
+    has_day,
+    mask_from_days,
+    popcount,
+    to_bytes,
+    to_int,
+)
+from .models import Schedule
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+# Статус ячейки посещаемости -> значения полей (present, excused)
+ATTENDANCE_FLAGS = {
+    "present": (True, False),
+    "excused": (False, True),
+    "absent": (False, False),
+}
+
+# Построчная таблица посещаемости и её компактная копия (битовые маски за смену)
+BITMAP_SOURCES = {
+    "student": (Attendance, StudentSchedule),
+    "employee": (EmployeeAttendance, EmployeeScheduleAttendance),
+}
+
+
+def get_branch_stats(branches, first_day, last_day):
+    """
+    Статистика по филиалам за период одним сгруппированным запросом.
+
+    Возвращает {branch_id: {"schedule_count", "total_students", "total_payments"}}
+    для всех переданных филиалов. Ученики и платежи считаются коррелированными
+    подзапросами по каждой смене, поэтому JOIN-ы не размножают строки.
+    """
+    students_per_schedule = (
+        StudentSchedule.objects.filter(schedule=OuterRef("pk"))
+        .order_by()
+        .values("schedule")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    payments_per_schedule = (
+        Payment.objects.filter(schedule=OuterRef("pk"))
+        .order_by()
+        .values("schedule")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+
+    rows = (
+        Schedule.objects.filter(
+            branch__in=branches, start_date__lte=last_day, end_date__gte=first_day
+        )
+        .order_by()
+        .values("branch_id")
+        .annotate(
+            schedule_count=Count("id"),
+            total_students=Sum(
+                Coalesce(
+                    Subquery(students_per_schedule, output_field=IntegerField()), 0
+                )
+            ),
+            total_payments=Sum(Subquery(payments_per_schedule)),
+        )
+    )
+
+    branch_stats = {
+        branch.id: {"schedule_count": 0, "total_students": 0, "total_payments": 0}
+        for branch in branches
+    }
+    for row in rows:
+        branch_stats[row["branch_id"]] = {
+            "schedule_count": row["schedule_count"],
+            "total_students": row["total_students"] or 0,
+            "total_payments": row["total_payments"] or 0,
+        }
+    return branch_stats
+
+
+def get_student_payment_totals(schedule):
+    """Сумма платежей каждого ученика за смену: {student_id: total}."""
+    rows = (
+        Payment.objects.filter(schedule=schedule)
+        .order_by()
+        .values("student_id")
+        .annotate(total=Sum("amount"))
+    )
+    return {row["student_id"]: row["total"] for row in rows}
+
+
+def get_schedule_paid_total(schedule):
+    """Сумма всех платежей за смену одним агрегатом."""
+    return (
+        Payment.objects.filter(schedule=schedule).aggregate(Sum("amount"))[
+            "amount__sum"
+        ]
+        or 0
+    )
+
+
+def get_schedule_finance_stats(schedules):
+    """
+    Финансовая статистика по набору смен за два запроса.
+
+    Для каждой смены возвращает total_students, expected_total (индивидуальная
+    цена, если задана, иначе базовая), actual_paid (все платежи по смене),
+    debt, paid_count и unpaid_count. Оплаты ученика подтягиваются
+    коррелированным подзапросом по Payment, суммирование идёт в SQL.
+    """
+    schedule_ids = [getattr(s, "pk", s) for s in schedules]
+
+    paid_by_student = (
+        Payment.objects.filter(
+            student=OuterRef("student_id"), schedule=OuterRef("schedule_id")
+        )
+        .order_by()
+        .values("student", "schedule")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    enrollments = (
+        StudentSchedule.objects.filter(schedule_id__in=schedule_ids)
+        .annotate(
+            price=Coalesce(
+                NullIf("individual_price", Value(0)),
+                "default_price",
+                output_field=MONEY,
+            ),
+            paid=Coalesce(
+                Subquery(paid_by_student, output_field=MONEY),
+                Value(Decimal("0")),
+                output_field=MONEY,
+            ),
+        )
+        .order_by()
+        .values("schedule_id")
+        .annotate(
+            total_students=Count("id"),
+            expected_total=Sum("price"),
+            debt=Sum(
+                Case(
+                    When(price__gt=F("paid"), then=F("price") - F("paid")),
+                    default=Value(Decimal("0")),
+                    output_field=MONEY,
+                )
+            ),
+            paid_count=Count("id", filter=Q(price__lte=F("paid"))),
+            unpaid_count=Count("id", filter=Q(price__gt=F("paid"))),
+        )
+    )
+    payments = (
+        Payment.objects.filter(schedule_id__in=schedule_ids)
+        .order_by()
+        .values("schedule_id")
+        .annotate(total=Sum("amount"))
+    )
+    actual_paid = {row["schedule_id"]: row["total"] for row in payments}
+
+    stats = {
+        schedule_id: {
+            "total_students": 0,
+            "expected_total": 0,
+            "actual_paid": actual_paid.get(schedule_id) or 0,
+            "debt": 0,
+            "paid_count": 0,
+            "unpaid_count": 0,
+        }
+        for schedule_id in schedule_ids
+    }
+    for row in enrollments:
+        stats[row["schedule_id"]].update(
+            {
+                "total_students": row["total_students"],
+                "expected_total": row["expected_total"] or 0,
+                "debt": row["debt"] or 0,
+                "paid_count": row["paid_count"],
+                "unpaid_count": row["unpaid_count"],
+            }
+        )
+    return stats
+
+
+def get_attendance_grid(model, person_field, person_ids, dates):
+    """
+    Сетка посещаемости {"<id>_<дата>": статус} одним SELECT-ом.
+
+    model — Attendance или EmployeeAttendance, person_field — "student" или
+    "employee". Отсутствующие строки считаются «absent» и в БД не создаются.
+    """
+    grid = {
+        f"{person_id}_{date}": "absent" for person_id in person_ids for date in dates
+    }
+    if not grid:
+        return grid
+
+    rows = model.objects.filter(
+        **{f"{person_field}_id__in": person_ids},
+        date__range=(dates[0], dates[-1]),
+    ).values_list(f"{person_field}_id", "date", "present", "excused")
+    for person_id, date, present, excused in rows:
+        if present:
+            status = "present"
+        elif excused:
+            status = "excused"
+        else:
+            status = "absent"
+        grid[f"{person_id}_{date}"] = status
+    return grid
+
+
+def get_present_counts(model, person_field, person_ids, start_date, end_date):
+    """Количество дней присутствия за период по каждому человеку: {id: count}."""
+    counts = {person_id: 0 for person_id in person_ids}
+    rows = (
+        model.objects.filter(
+            **{f"{person_field}_id__in": person_ids},
+            date__range=(start_date, end_date),
+            present=True,
+        )
+        .order_by()
+        .values(f"{person_field}_id")
+        .annotate(total=Count("id"))
+    )
+    for row in rows:
+        counts[row[f"{person_field}_id"]] = row["total"]
+    return counts
+
+
+def rebuild_attendance_bitmaps(
+    person_field, person_ids=None, schedules=None, period=None
+):
+    """
+    Пересобирает битовые маски посещаемости за смену (AttendanceBitmap)
+    из построчных таблиц Attendance / EmployeeAttendance.
+
+    person_field — "student" или "employee"; фильтры: person_ids, schedules
+    (id или queryset) и period — (first, last) для смен, пересекающих период.
+    Строки сотрудников создаются по Employee.schedule, если их ещё нет.
+    Строки масок блокируются select_for_update, поэтому параллельные
+    пересборки одной строки не затирают друг друга.
+    """
+    source, bitmap_model = BITMAP_SOURCES[person_field]
+    person_key = f"{person_field}_id"
+
+    schedule_filters = {}
+    if schedules is not None:
+        schedule_filters["schedule__in"] = schedules
+    if period is not None:
+        schedule_filters["schedule__start_date__lte"] = period[1]
+        schedule_filters["schedule__end_date__gte"] = period[0]
+    filters = dict(schedule_filters)
+    if person_ids is not None:
+        filters[f"{person_key}__in"] = person_ids
+
+    with transaction.atomic():
+        if bitmap_model is EmployeeScheduleAttendance:
+            employees = Employee.objects.filter(
+                schedule__isnull=False, **schedule_filters
+            )
+            if person_ids is not None:
+                employees = employees.filter(id__in=person_ids)
+            EmployeeScheduleAttendance.objects.bulk_create(
+                [
+                    EmployeeScheduleAttendance(
+                        employee_id=employee_id, schedule_id=schedule_id
+                    )
+                    for employee_id, schedule_id in employees.values_list(
+                        "id", "schedule_id"
+                    )
+                ],
+                ignore_conflicts=True,
+            )
+
+        rows = list(
+            bitmap_model.objects.select_for_update()
+            .filter(**filters)
+            .annotate(start=F("schedule__start_date"), end=F("schedule__end_date"))
+        )
+        if not rows:
+            return 0
+
+        marks = {}
+        for person_id, date, present, excused in source.objects.filter(
+            **{f"{person_key}__in": {getattr(row, person_key) for row in rows}},
+            date__range=(min(row.start for row in rows), max(row.end for row in rows)),
+        ).values_list(person_key, "date", "present", "excused"):
+            marks.setdefault(person_id, []).append((date, present, excused))
+
+        for row in rows:
+            person_marks = marks.get(getattr(row, person_key), [])
+            row.present_days = mask_from_days(
+                row.start,
+                row.end,
+                [date for date, present, _ in person_marks if present],
+            )
+            row.excused_days = mask_from_days(
+                row.start,
+                row.end,
+                [date for date, _, excused in person_marks if excused],
+            )
+        bitmap_model.objects.bulk_update(
+            rows, ["present_days", "excused_days"], batch_size=500
+        )
+    return len(rows)
+
+
+def set_attendance_day(person_field, person_id, date, present, excused):
+    """
+    Записывает состояние одной ячейки посещаемости в маски человека за
+    смены, включающие date: ставит или снимает по одному биту в
+    present_days и excused_days и сохраняет строку UPDATE-ом по pk, не
+    перечитывая построчную таблицу за всю смену. Строки масок блокируются
+    select_for_update, чтобы параллельные отметки других дней не затёрли
+    друг друга. Если у сотрудника строки маски ещё нет, её создаёт
+    rebuild_attendance_bitmaps.
+    """
+    _, bitmap_model = BITMAP_SOURCES[person_field]
+    with transaction.atomic(savepoint=False):
+        rows = list(
+            bitmap_model.objects.select_for_update()
+            .filter(
+                **{f"{person_field}_id": person_id},
+                schedule__start_date__lte=date,
+                schedule__end_date__gte=date,
+            )
+            .values_list("pk", "schedule__start_date", "present_days", "excused_days")
+        )
+        if not rows and bitmap_model is EmployeeScheduleAttendance:
+            rebuild_attendance_bitmaps(person_field, [person_id], period=(date, date))
+            return
+
+        for pk, start_date, present_days, excused_days in rows:
+            bit = 1 << day_index(start_date, date)
+            present_bits = to_int(present_days) & ~bit
+            excused_bits = to_int(excused_days) & ~bit
+            bitmap_model.objects.filter(pk=pk).update(
+                present_days=to_bytes(present_bits | bit if present else present_bits),
+                excused_days=to_bytes(excused_bits | bit if excused else excused_bits),
+            )
+
+
+def get_schedule_attendance(person_field, schedule, person_ids, dates):
+    """
+    Сетка посещаемости {"<id>_<дата>": статус} и число дней присутствия
+    {id: count} за смену по битовым маскам — один SELECT по строкам масок.
+    """
+    _, bitmap_model = BITMAP_SOURCES[person_field]
+    person_key = f"{person_field}_id"
+    grid = {
+        f"{person_id}_{date}": "absent" for person_id in person_ids for date in dates
+    }
+    counts = {person_id: 0 for person_id in person_ids}
+
+    rows = bitmap_model.objects.filter(
+        schedule=schedule, **{f"{person_key}__in": person_ids}
+    ).values_list(person_key, "present_days", "excused_days")
+    for person_id, present_days, excused_days in rows:
+        present_bits, excused_bits = to_int(present_days), to_int(excused_days)
+        for date in dates:
+            index = day_index(schedule.start_date, date)
+            if has_day(present_bits, index):
+                grid[f"{person_id}_{date}"] = "present"
+            elif has_day(excused_bits, index):
+                grid[f"{person_id}_{date}"] = "excused"
+        counts[person_id] = popcount(present_days)
+    return grid, counts
+
+
+def save_attendance_batch(schedule, student_marks, employee_marks):
+    """
+    Сохраняет пачку отметок посещаемости одной транзакцией.
+
+    student_marks / employee_marks — {(id, date): статус из ATTENDANCE_FLAGS}.
+    Строки вставляются или обновляются bulk_create(update_conflicts=True)
+    по уникальной паре (человек, дата). Возвращает обновлённые итоги
+    присутствия за смену: {"students": {id: count}, "employees": {id: count}}.
+    """
+    batches = (
+        (Attendance, "student", student_marks),
+        (EmployeeAttendance, "employee", employee_marks),
+    )
+    with transaction.atomic():
+        for model, person_field, marks in batches:
+            if not marks:
+                continue
+            # MySQL (ON DUPLICATE KEY UPDATE) не принимает явный unique_fields,
+            # конфликт там определяется по unique_together (человек, дата)
+            conflict_target = (
+                {"unique_fields": [person_field, "date"]}
+                if connection.features.supports_update_conflicts_with_target
+                else {}
+            )
+            model.objects.bulk_create(
+                [
+                    model(
+                        **{f"{person_field}_id": person_id},
+                        date=date,
+                        present=ATTENDANCE_FLAGS[status][0],
+                        excused=ATTENDANCE_FLAGS[status][1],
+                    )
+                    for (person_id, date), status in marks.items()
+                ],
+                update_conflicts=True,
+                update_fields=["present", "excused"],
+                **conflict_target,
+            )
+
+        # bulk_create не шлёт сигналы: маски, версию выгрузок и пометки
+        # зарплат обновляем сами
+        for person_field, marks in (
+            ("student", student_marks),
+            ("employee", employee_marks),
+        ):
+            if marks:
+                dates = [date for _, date in marks]
+                rebuild_attendance_bitmaps(
+                    person_field,
+                    {person_id for person_id, _ in marks},
+                    period=(min(dates), max(dates)),
+                )
+
+        if employee_marks:
+            dates = [date for _, date in employee_marks]
+            mark_salaries_dirty(
+                {person_id for person_id, _ in employee_marks},
+                period=(min(dates), max(dates)),
+            )
+
+        if student_marks:
+            dates = [date for _, date in student_marks]
+            Schedule.bump_data_version(
+                Schedule.objects.filter(
+                    students__in={person_id for person_id, _ in student_marks},
+                    start_date__lte=max(dates),
+                    end_date__gte=min(dates),
+                ).values("pk")
+            )
+
+    return {
+        f"{person_field}s": get_present_counts(
+            model,
+            person_field,
+            {person_id for person_id, _ in marks},
+            schedule.start_date,
+            schedule.end_date,
+        )
+        for model, person_field, marks in batches
+    }
+
+
+def _update_or_insert(model, lookup, changes, initial):
+    """
+    Применяет к строке посещаемости переход changes одним UPDATE, без чтения
+    строки в Python. Если строки нет — вставляет её в состоянии initial;
+    если её параллельно вставил другой запрос, применяет переход к ней.
+    Возвращает True, если строка была изменена UPDATE-ом (сигналы не
+    отправлялись), и False, если она создана.
+    """
+    with transaction.atomic():
+        if model.objects.filter(**lookup).update(**changes):
+            return True
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **initial)
+            return False
+        except IntegrityError:
+            model.objects.filter(**lookup).update(**changes)
+            return True
+
+
+def _cycle_row(model, lookup):
+    """
+    Переводит ячейку по кругу absent -> present -> excused -> absent и
+    возвращает (updated, present, excused). Новое состояние зависит сразу от
+    обоих флагов, а MySQL присваивает SET слева направо, поэтому строка
+    блокируется SELECT ... FOR UPDATE и записывается готовыми значениями:
+    параллельные клики по ячейке применяются по очереди. Отсутствующая
+    ячейка вставляется присутствующей.
+    """
+    rows = model.objects.select_for_update().filter(**lookup)
+    state = rows.values_list("present", "excused").first()
+    if state is None:
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, present=True, excused=False)
+            return False, True, False
+        except IntegrityError:
+            state = rows.values_list("present", "excused").get()
+
+    present, excused = state
+    if present:
+        present, excused = False, True
+    elif excused:
+        excused = False
+    else:
+        present = True
+    model.objects.filter(**lookup).update(present=present, excused=excused)
+    return True, present, excused
+
+
+def cycle_attendance(model, person_field, person_id, date, start_date, end_date):
+    """
+    Переключает ячейку посещаемости по кругу (или вставляет новую) и
+    возвращает (present, excused, total), где total — дни присутствия
+    человека за период [start_date, end_date]. Всё выполняется в одной
+    транзакции, поэтому строка ячейки остаётся заблокированной, пока её
+    состояние не записано в маски.
+    """
+    lookup = {f"{person_field}_id": person_id, "date": date}
+    with transaction.atomic(savepoint=False):
+        updated, present, excused = _cycle_row(model, lookup)
+        total = model.objects.filter(
+            date__range=(start_date, end_date),
+            present=True,
+            **{f"{person_field}_id": person_id},
+        ).count()
+
+        if updated:
+            # UPDATE не шлёт post_save: маски, версию выгрузок и пометки
+            # зарплат обновляем сами
+            set_attendance_day(person_field, person_id, date, present, excused)
+        if updated and model is EmployeeAttendance:
+            mark_salaries_dirty([person_id], period=(date, date))
+        if updated and model is Attendance:
+            Schedule.bump_data_version(
+                Schedule.objects.filter(
+                    students=person_id, start_date__lte=date, end_date__gte=date
+                ).values("pk")
+            )
+    return present, excused, total
+
+
+def flip_employee_presence(employee_id, date):
+    """
+    Инвертирует отметку присутствия сотрудника одним UPDATE; новая запись
+    создаётся присутствующей. Возвращает новое значение present.
+    """
+    lookup = {"employee_id": employee_id, "date": date}
+    flip = Case(
+        When(present=True, then=Value(False)),
+        default=Value(True),
+        output_field=BooleanField(),
+    )
+    with transaction.atomic(savepoint=False):
+        updated = _update_or_insert(
+            EmployeeAttendance, lookup, {"present": flip}, {"present": True}
+        )
+        present, excused = (
+            EmployeeAttendance.objects.filter(**lookup)
+            .values_list("present", "excused")
+            .get()
+        )
+        if updated:
+            set_attendance_day("employee", employee_id, date, present, excused)
+            mark_salaries_dirty([employee_id], period=(date, date))
+    return present
+
+
+class AttendanceMatrix:
+    """
+    Посещаемость учеников смены за все её дни, загруженная одним запросом
+    по битовым маскам StudentSchedule.
+
+    Используется выгрузками: статус ячейки, число дней присутствия ученика
+    и итог присутствующих по каждому дню считаются в памяти без обращений
+    к БД на каждую ячейку.
+    """
+
+    PRESENT = "present"
+    EXCUSED = "excused"
+    ABSENT = "absent"
+
+    def __init__(self, schedule, dates):
+        self.dates = list(dates)
+        self._cells = {}
+        self._present_counts = {}
+        self.day_totals = [0] * len(self.dates)
+
+        indexes = [day_index(schedule.start_date, date) for date in self.dates]
+        rows = StudentSchedule.objects.filter(schedule=schedule).values_list(
+            "student_id", "present_days", "excused_days"
+        )
+        for student_id, present_days, excused_days in rows:
+            present_bits, excused_bits = to_int(present_days), to_int(excused_days)
+            count = 0
+            for position, (date, index) in enumerate(zip(self.dates, indexes)):
+                if has_day(present_bits, index):
+                    self._cells[(student_id, date)] = self.PRESENT
+                    self.day_totals[position] += 1
+                    count += 1
+                elif has_day(excused_bits, index):
+                    self._cells[(student_id, date)] = self.EXCUSED
+            self._present_counts[student_id] = count
+
+    def status(self, student_id, date):
+        return self._cells.get((student_id, date), self.ABSENT)
+
+    def statuses(self, student_id):
+        """Статусы ученика по всем дням смены в порядке self.dates."""
+        return [self.status(student_id, date) for date in self.dates]
+
+    def present_count(self, student_id):
+        return self._present_counts.get(student_id, 0)
+
+
+class ScheduleIntervalIndex:
+    """
+    Индекс смен по интервалам дат для ответа на вопрос
+    «какие смены активны в периоде» без запроса к БД на каждую ячейку.
+
+    Смены загружаются один раз (см. for_period), сортируются по дате начала
+    и группируются по филиалу. Поиск пересечений — бинарный поиск по дате
+    начала в окне [start - максимальная длительность смены, end] с
+    последующей проверкой даты окончания: O(log n + k).
+    """
+
+    def __init__(self, schedules):
+        by_branch = {}
+        for schedule in schedules:
+            by_branch.setdefault(schedule.branch_id, []).append(schedule)
+
+        self._buckets = {None: self._build(schedules)}
+        for branch_id, branch_schedules in by_branch.items():
+            self._buckets[branch_id] = self._build(branch_schedules)
+
+    @staticmethod
+    def _build(schedules):
+        items = sorted(schedules, key=lambda s: (s.start_date, s.id))
+        starts = [s.start_date for s in items]
+        max_length = max(
+            (s.end_date - s.start_date for s in items), default=timedelta(0)
+        )
+        return starts, items, max_length
+
+    @classmethod
+    def for_period(cls, start, end, queryset=None):
+        """Строит индекс по всем сменам, пересекающим период, одним запросом."""
+        if queryset is None:
+            queryset = Schedule.objects.all()
+        return cls(list(queryset.filter(start_date__lte=end, end_date__gte=start)))
+
+    def overlapping(self, start, end, branch_id=None):
+        """Смены (по дате начала), пересекающие период [start, end]."""
+        bucket = self._buckets.get(branch_id)
+        if bucket is None:
+            return []
+        starts, items, max_length = bucket
+        lo = bisect_left(starts, start - max_length)
+        hi = bisect_right(starts, end)
+        return [s for s in items[lo:hi] if s.end_date >= start]
@@ -0,0 +1,163 @@
+# schedule/signals.py
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from branches.models import Branch
+from employees.models import Employee, EmployeeAttendance
+from schedule.models import Schedule
+from schedule.services import rebuild_attendance_bitmaps, set_attendance_day
+from students.models import (
+    Attendance,
+    Balance,
+    Payment,
+    Squad,
+    Student,
+    StudentSchedule,
+)
+
+# Любое изменение этих строк меняет содержимое выгрузок смены
+# (см. schedule/export_cache.py), поэтому увеличиваем её data_version.
+
+
+@receiver(post_save, sender=StudentSchedule)
+@receiver(post_delete, sender=StudentSchedule)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Squad)
+@receiver(post_delete, sender=Squad)
+def bump_schedule_version(sender, instance, **kwargs):
+    Schedule.bump_data_version([instance.schedule_id])
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def bump_attendance_schedules_version(sender, instance, **kwargs):
+    """Посещение не привязано к смене: обновляем смены ученика на эту дату."""
+    Schedule.bump_data_version(
+        Schedule.objects.filter(
+            students=instance.student_id,
+            start_date__lte=instance.date,
+            end_date__gte=instance.date,
+        ).values("pk")
+    )
+
+
+@receiver(post_save, sender=Student)
+def bump_student_schedules_version(sender, instance, created, **kwargs):
+    """ФИО, телефон и отряд ученика попадают в выгрузки всех его смен."""
+    if not created:
+        Schedule.bump_data_version(
+            StudentSchedule.objects.filter(student=instance).values("schedule_id")
+        )
+
+
+@receiver(post_save, sender=Balance)
+@receiver(post_delete, sender=Balance)
+def bump_balance_schedules_version(sender, instance, **kwargs):
+    """
+    Баланс ученика есть в выгрузке посещаемости его смен, а
+    Student.apply_balance_delta меняет его UPDATE-ом, без post_save.
+    """
+    Schedule.bump_data_version(
+        StudentSchedule.objects.filter(student=instance.student_id).values(
+            "schedule_id"
+        )
+    )
+
+
+@receiver(post_save, sender=Schedule)
+def bump_own_version(sender, instance, created, **kwargs):
+    """Название и даты смены — в заголовке выгрузок и в колонках дней."""
+    if not created:
+        Schedule.bump_data_version([instance.pk])
+
+
+@receiver(post_save, sender=Branch)
+def bump_branch_schedules_version(sender, instance, created, **kwargs):
+    """Название филиала печатается в списке учеников смены."""
+    if not created:
+        Schedule.bump_data_version(
+            Schedule.objects.filter(branch=instance).values("pk")
+        )
+
+
+@receiver(post_save, sender=Employee)
+def bump_employee_schedules_version(sender, instance, created, **kwargs):
+    """ФИО сотрудника и вожатого отряда относятся к данным его смен."""
+    if not created:
+        Schedule.bump_data_version(
+            Schedule.objects.filter(
+                Q(pk=instance.schedule_id) | Q(squads__leader=instance)
+            ).values("pk")
+        )
+
+
+@receiver(m2m_changed, sender=Student.schedules.through)
+def bump_enrollment_version(sender, instance, action, reverse, pk_set, **kwargs):
+    """student.schedules.add()/remove() идут мимо post_save у StudentSchedule."""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        # instance — смена
+        Schedule.bump_data_version([instance.pk])
+    elif action == "pre_clear":
+        Schedule.bump_data_version(
+            StudentSchedule.objects.filter(student=instance).values("schedule_id")
+        )
+    else:
+        Schedule.bump_data_version(pk_set)
+
+    if action == "post_add":
+        # add() создаёт StudentSchedule через bulk_create, минуя post_save
+        if reverse:
+            rebuild_attendance_bitmaps("student", pk_set, schedules=[instance.pk])
+        else:
+            rebuild_attendance_bitmaps("student", [instance.pk], schedules=pk_set)
+
+
+# Битовые маски посещаемости за смену (AttendanceBitmap) повторяют
+# построчные таблицы; здесь они обновляются при изменениях через ORM.
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=EmployeeAttendance)
+@receiver(post_delete, sender=EmployeeAttendance)
+def sync_attendance_bitmaps(sender, instance, signal, origin=None, **kwargs):
+    if origin is not None and getattr(origin, "model", type(origin)) is not sender:
+        # Каскадное удаление вместе с учеником/сотрудником: маски уйдут тоже
+        return
+    person_field = "student" if sender is Attendance else "employee"
+    deleted = signal is post_delete
+    set_attendance_day(
+        person_field,
+        getattr(instance, f"{person_field}_id"),
+        instance.date,
+        present=instance.present and not deleted,
+        excused=instance.excused and not deleted,
+    )
+
+
+@receiver(post_save, sender=StudentSchedule)
+def fill_enrollment_bitmaps(sender, instance, created, **kwargs):
+    if created:
+        rebuild_attendance_bitmaps(
+            "student", [instance.student_id], schedules=[instance.schedule_id]
+        )
+
+
+@receiver(post_save, sender=Employee)
+def fill_employee_bitmaps(sender, instance, **kwargs):
+    if instance.schedule_id:
+        rebuild_attendance_bitmaps(
+            "employee", [instance.pk], schedules=[instance.schedule_id]
+        )
+
+
+@receiver(post_save, sender=Schedule)
+def realign_schedule_bitmaps(sender, instance, created, **kwargs):
+    """Маски привязаны к start_date: после правки смены пересобираем их."""
+    if not created:
+        rebuild_attendance_bitmaps("student", schedules=[instance.pk])
+        rebuild_attendance_bitmaps("employee", schedules=[instance.pk])
@@ -1,8 +1,37 @@
-from django.test import TestCase, Client
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, Client, override_settings
 from schedule.models import Schedule
 from branches.models import Branch
 from django.contrib.auth import get_user_model
 import json
+from datetime import date
+
+from schedule.services import (
+    AttendanceMatrix,
+    ScheduleIntervalIndex,
+    get_attendance_grid,
+    get_branch_stats,
+    get_present_counts,
+    cycle_attendance,
+    flip_employee_presence,
+    get_schedule_finance_stats,
+)
+from employees.models import (
+    Employee,
+    EmployeeAttendance,
+    EmployeeScheduleAttendance,
+    Position,
+)
+from students.models import (
+    Attendance,
+    Balance,
+    Payment,
+    Student,
+    StudentSchedule,
+)
 
 
 class ScheduleApiTests(TestCase):
@@ -51,3 +80,443 @@ class ScheduleApiTests(TestCase):
         response = self.client.delete(f"/api/schedules/{self.schedule.pk}/")
         self.assertEqual(response.status_code, 200)
         self.assertEqual(Schedule.objects.count(), 0)
+
+
+class BranchStatsServiceTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Main")
+        self.empty_branch = Branch.objects.create(name="Empty")
+        first = Schedule.objects.create(
+            name="First",
+            branch=self.branch,
+            start_date="2025-07-01",
+            end_date="2025-07-10",
+            theme="Robotics",
+        )
+        second = Schedule.objects.create(
+            name="Second",
+            branch=self.branch,
+            start_date="2025-07-14",
+            end_date="2025-07-25",
+            theme="Chess",
+        )
+        for name in ["A", "B"]:
+            student = Student.objects.create(full_name=name)
+            StudentSchedule.objects.create(student=student, schedule=first)
+            StudentSchedule.objects.create(student=student, schedule=second)
+            Payment.objects.create(student=student, schedule=first, amount=100)
+            Payment.objects.create(student=student, schedule=first, amount=50)
+
+    def test_branch_stats_are_not_multiplied_by_joins(self):
+        stats = get_branch_stats(
+            Branch.objects.all(), date(2025, 7, 1), date(2025, 7, 31)
+        )
+        self.assertEqual(stats[self.branch.id]["schedule_count"], 2)
+        self.assertEqual(stats[self.branch.id]["total_students"], 4)
+        self.assertEqual(stats[self.branch.id]["total_payments"], 300)
+        self.assertEqual(
+            stats[self.empty_branch.id],
+            {"schedule_count": 0, "total_students": 0, "total_payments": 0},
+        )
+
+
+class ScheduleIntervalIndexTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Main")
+        self.other_branch = Branch.objects.create(name="Other")
+        self.long = Schedule.objects.create(
+            name="Long",
+            branch=self.branch,
+            start_date="2025-06-01",
+            end_date="2025-07-20",
+            theme="Robotics",
+        )
+        self.short = Schedule.objects.create(
+            name="Short",
+            branch=self.branch,
+            start_date="2025-07-14",
+            end_date="2025-07-18",
+            theme="Chess",
+        )
+        self.other = Schedule.objects.create(
+            name="Other",
+            branch=self.other_branch,
+            start_date="2025-07-07",
+            end_date="2025-07-11",
+            theme="Art",
+        )
+
+    def test_overlapping_by_branch(self):
+        index = ScheduleIntervalIndex.for_period(date(2025, 6, 30), date(2025, 8, 1))
+        self.assertEqual(
+            index.overlapping(date(2025, 7, 14), date(2025, 7, 18), self.branch.id),
+            [self.long, self.short],
+        )
+        self.assertEqual(
+            index.overlapping(date(2025, 7, 21), date(2025, 7, 25), self.branch.id),
+            [],
+        )
+        self.assertEqual(
+            index.overlapping(date(2025, 7, 7), date(2025, 7, 11)),
+            [self.long, self.other],
+        )
+        self.assertEqual(
+            index.overlapping(date(2025, 7, 7), date(2025, 7, 11), 999), []
+        )
+
+
+class ScheduleFinanceStatsTests(TestCase):
+    def setUp(self):
+        branch = Branch.objects.create(name="Main")
+        self.schedule = Schedule.objects.create(
+            name="Summer",
+            branch=branch,
+            start_date="2025-07-01",
+            end_date="2025-07-10",
+            theme="Robotics",
+        )
+        self.empty = Schedule.objects.create(
+            name="Empty",
+            branch=branch,
+            start_date="2025-08-01",
+            end_date="2025-08-10",
+            theme="Chess",
+        )
+        paid = Student.objects.create(full_name="Paid")
+        partial = Student.objects.create(full_name="Partial")
+        StudentSchedule.objects.create(
+            student=paid, schedule=self.schedule, default_price=10000
+        )
+        StudentSchedule.objects.create(
+            student=partial,
+            schedule=self.schedule,
+            default_price=10000,
+            individual_price=8000,
+        )
+        Payment.objects.create(student=paid, schedule=self.schedule, amount=6000)
+        Payment.objects.create(student=paid, schedule=self.schedule, amount=4000)
+        Payment.objects.create(student=partial, schedule=self.schedule, amount=3000)
+
+    def test_finance_stats(self):
+        with self.assertNumQueries(2):
+            stats = get_schedule_finance_stats([self.schedule, self.empty])
+
+        self.assertEqual(
+            stats[self.schedule.id],
+            {
+                "total_students": 2,
+                "expected_total": 18000,
+                "actual_paid": 13000,
+                "debt": 5000,
+                "paid_count": 1,
+                "unpaid_count": 1,
+            },
+        )
+        self.assertEqual(stats[self.empty.id]["total_students"], 0)
+        self.assertEqual(stats[self.empty.id]["actual_paid"], 0)
+
+
+class AttendanceGridTests(TestCase):
+    def setUp(self):
+        self.first = Student.objects.create(full_name="First")
+        self.second = Student.objects.create(full_name="Second")
+        self.dates = [date(2025, 7, 1), date(2025, 7, 2)]
+        Attendance.objects.create(student=self.first, date=self.dates[0], present=True)
+        Attendance.objects.create(student=self.first, date=self.dates[1], excused=True)
+
+    def test_grid_is_read_only_and_defaults_to_absent(self):
+        ids = [self.first.id, self.second.id]
+        with self.assertNumQueries(2):
+            grid = get_attendance_grid(Attendance, "student", ids, self.dates)
+            counts = get_present_counts(
+                Attendance, "student", ids, self.dates[0], self.dates[-1]
+            )
+
+        self.assertEqual(grid[f"{self.first.id}_2025-07-01"], "present")
+        self.assertEqual(grid[f"{self.first.id}_2025-07-02"], "excused")
+        self.assertEqual(grid[f"{self.second.id}_2025-07-01"], "absent")
+        self.assertEqual(counts, {self.first.id: 1, self.second.id: 0})
+        self.assertEqual(Attendance.objects.count(), 2)
+
+    def test_attendance_matrix_loads_schedule_in_one_query(self):
+        schedule = Schedule.objects.create(
+            name="Summer",
+            branch=Branch.objects.create(name="Main"),
+            start_date=self.dates[0],
+            end_date=self.dates[-1],
+            theme="Robotics",
+        )
+        StudentSchedule.objects.create(student=self.first, schedule=schedule)
+        StudentSchedule.objects.create(student=self.second, schedule=schedule)
+        outsider = Student.objects.create(full_name="Outsider")
+        Attendance.objects.create(student=outsider, date=self.dates[0], present=True)
+
+        with self.assertNumQueries(1):
+            matrix = AttendanceMatrix(schedule, self.dates)
+
+        self.assertEqual(matrix.statuses(self.first.id), ["present", "excused"])
+        self.assertEqual(matrix.statuses(self.second.id), ["absent", "absent"])
+        self.assertEqual(matrix.present_count(self.first.id), 1)
+        self.assertEqual(matrix.day_totals, [1, 0])
+
+
+class ScheduleExportCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        override = override_settings(EXPORT_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client = Client()
+        self.client.force_login(
+            get_user_model().objects.create_user(
+                username="manager", password="password", role="manager"
+            )
+        )
+        self.schedule = Schedule.objects.create(
+            name="Summer",
+            branch=Branch.objects.create(name="Main"),
+            start_date="2025-07-01",
+            end_date="2025-07-03",
+            theme="Robotics",
+        )
+        self.student = Student.objects.create(full_name="Student")
+        StudentSchedule.objects.create(student=self.student, schedule=self.schedule)
+        self.url = f"/schedule/{self.schedule.id}/export_excel/"
+
+    def test_repeat_download_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        body = b"".join(first.streaming_content)
+        etag = first["ETag"]
+
+        second = self.client.get(self.url)
+        self.assertEqual(second["ETag"], etag)
+        self.assertEqual(b"".join(second.streaming_content), body)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Файл лежит в EXPORT_CACHE_DIR, а не в раздаваемом MEDIA_ROOT
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_data_change_bumps_version(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        Payment.objects.create(
+            student=self.student, schedule=self.schedule, amount=1000
+        )
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+        Attendance.objects.create(student=self.student, date=date(2025, 7, 2))
+        self.assertNotEqual(self.client.get(self.url)["ETag"], changed["ETag"])
+
+    def test_schedule_and_balance_changes_bump_version(self):
+        def version():
+            return Schedule.objects.values_list("data_version", flat=True).get(
+                pk=self.schedule.pk
+            )
+
+        # Экземпляр с устаревшей версией не откатывает её при save
+        stale = Schedule.objects.get(pk=self.schedule.pk)
+        Payment.objects.create(
+            student=self.student, schedule=self.schedule, amount=1000
+        )
+        before = version()
+        stale.name = "Winter"
+        stale.save()
+        self.assertEqual(version(), before + 1)
+
+        operation = Balance.objects.create(
+            student=self.student, amount=500, operation_type="deposit"
+        )
+        self.assertEqual(version(), before + 2)
+        operation.delete()
+        self.assertEqual(version(), before + 3)
+
+        self.schedule.branch.name = "Центральный"
+        self.schedule.branch.save()
+        self.assertEqual(version(), before + 4)
+
+
+class BatchAttendanceTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(
+            get_user_model().objects.create_user(
+                username="manager", password="password", role="manager"
+            )
+        )
+        self.schedule = Schedule.objects.create(
+            name="Summer",
+            branch=Branch.objects.create(name="Main"),
+            start_date="2025-07-01",
+            end_date="2025-07-03",
+            theme="Robotics",
+        )
+        self.student = Student.objects.create(full_name="Student")
+        StudentSchedule.objects.create(student=self.student, schedule=self.schedule)
+        self.employee = Employee.objects.create(
+            full_name="Employee",
+            position=Position.objects.create(name="Вожатый"),
+            schedule=self.schedule,
+        )
+        self.url = f"/schedule/{self.schedule.id}/attendance/batch/"
+
+    def post(self, items):
+        return self.client.post(
+            self.url, data=json.dumps({"items": items}), content_type="application/json"
+        )
+
+    def test_batch_upserts_and_returns_totals(self):
+        Attendance.objects.create(student=self.student, date=date(2025, 7, 1))
+        student, employee = self.student.id, self.employee.id
+        response = self.post(
+            [
+                {"student_id": student, "date": "2025-07-01", "status": "present"},
+                {"student_id": student, "date": "2025-07-02", "status": "excused"},
+                {"student_id": student, "date": "2025-07-02", "status": "present"},
+                {"employee_id": employee, "date": "2025-07-03", "status": "absent"},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["students"], {str(self.student.id): 2})
+        self.assertEqual(data["employees"], {str(self.employee.id): 0})
+        self.assertEqual(Attendance.objects.filter(present=True).count(), 2)
+        self.assertFalse(EmployeeAttendance.objects.get().present)
+
+    def test_rejects_people_outside_schedule(self):
+        outsider = Student.objects.create(full_name="Outsider")
+        response = self.post(
+            [{"student_id": outsider.id, "date": "2025-07-01", "status": "present"}]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_toggle_cycles_cell_with_update(self):
+        url = f"/schedule/{self.schedule.id}/toggle_attendance/"
+        payload = json.dumps({"student_id": self.student.id, "date": "2025-07-02"})
+
+        states = []
+        for _ in range(4):
+            data = self.client.post(
+                url, data=payload, content_type="application/json"
+            ).json()
+            states.append((data["present"], data["excused"], data["total_attendance"]))
+
+        self.assertEqual(
+            states,
+            [(True, False, 1), (False, True, 0), (False, False, 0), (True, False, 1)],
+        )
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_toggle_rejects_people_outside_schedule(self):
+        url = f"/schedule/{self.schedule.id}/toggle_attendance/"
+        outsider = Student.objects.create(full_name="Outsider")
+        for payload in (
+            {"student_id": outsider.id, "date": "2025-07-02"},
+            {"student_id": 0, "date": "2025-07-02"},
+            {"employee_id": 0, "date": "2025-07-02"},
+        ):
+            response = self.client.post(
+                url, data=json.dumps(payload), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 404)
+        self.assertFalse(Attendance.objects.exists())
+        self.assertFalse(EmployeeAttendance.objects.exists())
+
+    def test_cycle_attendance_query_count(self):
+        day = date(2025, 7, 1)
+        EmployeeAttendance.objects.create(employee=self.employee, date=day)
+        # Чтение ячейки под блокировкой и её UPDATE, итог, чтение и UPDATE
+        # строки маски, пометка зарплат
+        with self.assertNumQueries(6):
+            result = cycle_attendance(
+                EmployeeAttendance,
+                "employee",
+                self.employee.id,
+                day,
+                self.schedule.start_date,
+                self.schedule.end_date,
+            )
+        self.assertEqual(result, (False, True, 0))
+        bitmap = EmployeeScheduleAttendance.objects.get(employee=self.employee)
+        self.assertEqual(bitmap.day_status(day), "excused")
+
+    def test_cycle_attendance_from_present_and_excused(self):
+        day = date(2025, 7, 1)
+        Attendance.objects.create(
+            student=self.student, date=day, present=True, excused=True
+        )
+        result = cycle_attendance(
+            Attendance,
+            "student",
+            self.student.id,
+            day,
+            self.schedule.start_date,
+            self.schedule.end_date,
+        )
+        self.assertEqual(result, (False, True, 0))
+        cell = Attendance.objects.get()
+        self.assertEqual((cell.present, cell.excused), (False, True))
+
+    def test_flip_employee_presence(self):
+        day = date(2025, 7, 1)
+        self.assertTrue(flip_employee_presence(self.employee.id, day))
+        self.assertFalse(flip_employee_presence(self.employee.id, day))
+        self.assertEqual(EmployeeAttendance.objects.count(), 1)
+
+
+class AttendanceBitmapTests(TestCase):
+    def setUp(self):
+        self.schedule = Schedule.objects.create(
+            name="Summer",
+            branch=Branch.objects.create(name="Main"),
+            start_date=date(2025, 7, 1),
+            end_date=date(2025, 7, 10),
+            theme="Robotics",
+        )
+        self.student = Student.objects.create(full_name="Student")
+        self.enrollment = StudentSchedule.objects.create(
+            student=self.student, schedule=self.schedule
+        )
+
+    def test_bitmaps_follow_attendance_rows(self):
+        for day in (1, 2, 10):
+            Attendance.objects.create(
+                student=self.student, date=date(2025, 7, day), present=True
+            )
+        Attendance.objects.create(
+            student=self.student, date=date(2025, 7, 3), excused=True
+        )
+        Attendance.objects.filter(date=date(2025, 7, 2)).get().delete()
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.present_count, 2)
+        self.assertEqual(self.enrollment.day_status(date(2025, 7, 10)), "present")
+        self.assertEqual(self.enrollment.day_status(date(2025, 7, 3)), "excused")
+        self.assertEqual(self.enrollment.day_status(date(2025, 7, 2)), "absent")
+
+        attendance = Attendance.objects.get(date=date(2025, 7, 3))
+        attendance.present, attendance.excused = True, False
+        attendance.save()
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.present_count, 3)
+        self.assertEqual(self.enrollment.day_status(date(2025, 7, 3)), "present")
+        self.assertEqual(self.enrollment.day_status(date(2025, 7, 1)), "present")
+
+    def test_schedule_date_change_realigns_bitmaps(self):
+        Attendance.objects.create(
+            student=self.student, date=date(2025, 7, 5), present=True
+        )
+        self.schedule.start_date = date(2025, 7, 4)
+        self.schedule.save()
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(bytes(self.enrollment.present_days), b"\x02")
+        self.assertEqual(self.enrollment.day_status(date(2025, 7, 5)), "present")
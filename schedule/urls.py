@@ -47,6 +47,11 @@ urlpatterns = [
         views.toggle_attendance,
         name="toggle_attendance",
     ),
+    path(
+        "<int:schedule_id>/attendance/batch/",
+        views.batch_attendance,
+        name="batch_attendance",
+    ),
     path(
         "schedule/<int:pk>/get_updated_data/",
         views.get_updated_schedule_data,
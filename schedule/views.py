@@ -1,23 +1,21 @@
 # schedule/views.py (полный файл)
 
-import io
 import json
-import openpyxl
 
 from datetime import datetime, timedelta
-from weasyprint import HTML
 
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, JsonResponse
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.utils import timezone
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 
 from branches.models import Branch
-from core.utils import role_required, sanitize_sheet_name
+from core.pdf import pdf_response
+from core.utils import EXPORT_CHUNK_SIZE, excel_export_response, role_required
 from employees.models import Employee, EmployeeAttendance, Position
 from payroll.models import Expense, ExpenseCategory, Salary
 from students.forms import SquadForm, StudentScheduleForm
@@ -29,7 +27,21 @@ from students.models import (
     StudentSchedule,
     Attendance,
 )
+from students.search import search_students
+from schedule.export_cache import cached_schedule_export
 from schedule.forms import ScheduleForm
+from schedule.services import (
+    ATTENDANCE_FLAGS,
+    AttendanceMatrix,
+    ScheduleIntervalIndex,
+    cycle_attendance,
+    get_branch_stats,
+    get_schedule_attendance,
+    get_schedule_finance_stats,
+    get_schedule_paid_total,
+    get_student_payment_totals,
+    save_attendance_batch,
+)
 
 from .models import COLOR_CHOICES, Schedule
 
@@ -114,42 +126,21 @@ def schedule_calendar(request):
         branches = Branch.objects.all()
 
     # ===== СТАТИСТИКА ПО ФИЛИАЛАМ ЗА ТЕКУЩИЙ МЕСЯЦ =====
-    branch_stats = {}
-    for branch in branches:
-        month_schedules = Schedule.objects.filter(
-            branch=branch, start_date__lte=last_day, end_date__gte=first_day
-        )
-        schedule_count = month_schedules.count()
-        total_students = (
-            month_schedules.annotate(num_students=Count("students")).aggregate(
-                total=Sum("num_students")
-            )["total"]
-            or 0
-        )
-        total_payments = (
-            Payment.objects.filter(schedule__in=month_schedules).aggregate(
-                total=Sum("amount")
-            )["total"]
-            or 0
-        )
-
-        branch_stats[branch.id] = {
-            "schedule_count": schedule_count,
-            "total_students": total_students,
-            "total_payments": total_payments,
-        }
+    branch_stats = get_branch_stats(branches, first_day, last_day)
     # ===== КОНЕЦ СТАТИСТИКИ ПО ФИЛИАЛАМ =====
 
     # Матрица смен по филиалам и неделям
+    schedule_index = ScheduleIntervalIndex.for_period(
+        weeks[0][0], weeks[-1][1], Schedule.objects.filter(branch__in=branches)
+    )
     matrix = {}
     for branch in branches:
-        branch_schedules = {}
-        for week_start, week_end in weeks:
-            schedules = Schedule.objects.filter(
-                branch=branch, start_date__lte=week_end, end_date__gte=week_start
+        matrix[branch.id] = {
+            week_start: schedule_index.overlapping(
+                week_start, week_end, branch_id=branch.id
             )
-            branch_schedules[week_start] = schedules
-        matrix[branch.id] = branch_schedules
+            for week_start, week_end in weeks
+        }
 
     # ===== НОВАЯ ФИНАНСОВАЯ СТАТИСТИКА ПО СМЕНАМ =====
     schedule_ids = set()
@@ -158,54 +149,7 @@ def schedule_calendar(request):
             for schedule in schedules:
                 schedule_ids.add(schedule.id)
 
-    schedule_stats = {}
-    for sched_id in schedule_ids:
-        sched = Schedule.objects.get(id=sched_id)
-        students = sched.students.all()
-        total_students = students.count()
-
-        expected_total = 0
-        actual_paid = (
-            Payment.objects.filter(schedule=sched).aggregate(total=Sum("amount"))[
-                "total"
-            ]
-            or 0
-        )
-
-        debt = 0
-        paid_count = 0
-        unpaid_count = 0
-
-        for student in students:
-            ss = student.studentschedule_set.filter(schedule=sched).first()
-            price = (
-                ss.individual_price
-                if ss and ss.individual_price
-                else (ss.default_price if ss else 0)
-            )
-            expected_total += price
-
-            student_paid = (
-                Payment.objects.filter(student=student, schedule=sched).aggregate(
-                    total=Sum("amount")
-                )["total"]
-                or 0
-            )
-
-            if price > student_paid:
-                debt += price - student_paid
-                unpaid_count += 1
-            else:
-                paid_count += 1
-
-        schedule_stats[sched_id] = {
-            "total_students": total_students,
-            "expected_total": expected_total,
-            "actual_paid": actual_paid,
-            "debt": debt,
-            "paid_count": paid_count,
-            "unpaid_count": unpaid_count,
-        }
+    schedule_stats = get_schedule_finance_stats(schedule_ids)
     # ===== КОНЕЦ СТАТИСТИКИ ПО СМЕНАМ =====
 
     week_headers = []
@@ -391,73 +335,43 @@ def schedule_detail(request, pk):
         dates.append(current_date)
         current_date += timedelta(days=1)
 
-    employees = Employee.objects.filter(schedule=schedule)
-    students = schedule.students.prefetch_related("studentschedule_set").order_by(
-        "full_name"
+    employees = list(
+        Employee.objects.filter(schedule=schedule).select_related("position")
     )
+    students = list(
+        schedule.students.select_related("squad__leader").order_by("full_name")
+    )
+    student_ids = [student.id for student in students]
+    employee_ids = [employee.id for employee in employees]
 
     # Собираем настройки студент-смена
-    student_schedule_map = {}
-    for ss in StudentSchedule.objects.filter(
-        schedule=schedule, student__in=students
-    ).select_related("student"):
-        student_schedule_map[ss.student_id] = ss
+    student_schedule_map = {
+        ss.student_id: ss for ss in StudentSchedule.objects.filter(schedule=schedule)
+    }
 
-    attendance = {}
-    for student in students:
-        for date in dates:
-            att, created = Attendance.objects.get_or_create(
-                student=student,
-                date=date,
-                defaults={"present": False, "excused": False},
-            )
-            key = f"{student.id}_{date}"
-            if att.present:
-                status = "present"
-            elif att.excused:
-                status = "excused"
-            else:
-                status = "absent"
-            attendance[key] = status
+    # Сетки и итоги посещаемости читаются из битовых масок за смену двумя
+    # SELECT-ами; записи создаются только при переключении ячейки
+    attendance, student_attendance_counts = get_schedule_attendance(
+        "student", schedule, student_ids, dates
+    )
+    employee_attendance, employee_attendance_counts = get_schedule_attendance(
+        "employee", schedule, employee_ids, dates
+    )
 
-    student_attendance_counts = {}
-    for student in students:
-        count = Attendance.objects.filter(
-            student=student, date__in=dates, present=True
-        ).count()
-        student_attendance_counts[student.id] = count
+    paid_salaries = {
+        salary.employee_id: salary
+        for salary in Salary.objects.filter(schedule=schedule, is_paid=True).order_by(
+            "-id"
+        )
+    }
 
-    employee_attendance = {}
-    employee_attendance_counts = {}
     employee_salaries = {}
     employee_paid_salaries = {}
-
     for employee in employees:
-        total = 0
-        for date in dates:
-            att, created = EmployeeAttendance.objects.get_or_create(
-                employee=employee,
-                date=date,
-                defaults={"present": False, "excused": False},
-            )
-            key = f"{employee.id}_{date}"
-            if att.present:
-                status = "present"
-                total += 1
-            elif att.excused:
-                status = "excused"
-            else:
-                status = "absent"
-            employee_attendance[key] = status
-
-        employee_attendance_counts[employee.id] = total
         rate = employee.rate_per_day or 0
-        calculated_salary = rate * total
-
-        paid_salary = Salary.objects.filter(
-            employee=employee, schedule=schedule, is_paid=True
-        ).first()
+        calculated_salary = rate * employee_attendance_counts[employee.id]
 
+        paid_salary = paid_salaries.get(employee.id)
         if paid_salary:
             employee_salaries[employee.id] = paid_salary.total_payment
             employee_paid_salaries[employee.id] = {
@@ -473,17 +387,8 @@ def schedule_detail(request, pk):
                 "salary_id": None,
             }
 
-    student_total_payments = {}
-    for student in students:
-        total_paid = student.get_total_paid_for_schedule(schedule)
-        student_total_payments[student.id] = total_paid
-
-    total_payments = (
-        Payment.objects.filter(schedule=schedule).aggregate(total=Sum("amount"))[
-            "total"
-        ]
-        or 0
-    )
+    student_total_payments = get_student_payment_totals(schedule)
+    total_payments = get_schedule_paid_total(schedule)
 
     available_employees = Employee.objects.exclude(schedule=schedule)
     available_students = Student.objects.exclude(schedules=schedule)
@@ -612,45 +517,36 @@ def remove_student_from_schedule(request, schedule_id, student_id):
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
+@cached_schedule_export("students_xlsx", "students_{name}.xlsx", as_attachment=True)
 def export_schedule_students_excel(request, pk):
     schedule = get_object_or_404(Schedule, pk=pk)
-    students = schedule.students.prefetch_related("studentschedule_set").order_by(
-        "full_name"
-    )
+    students = schedule.students.select_related("squad").order_by("full_name")
 
     # Собираем StudentSchedule для доступа к параметрам
     ss_map = {
-        ss.student_id: ss
-        for ss in StudentSchedule.objects.filter(
-            schedule=schedule, student__in=students
-        )
+        ss.student_id: ss for ss in StudentSchedule.objects.filter(schedule=schedule)
     }
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Ученики {sanitize_sheet_name(schedule.name)}"
-    ws.append(
-        [
-            "ФИО",
-            "Телефон",
-            "Родитель",
-            "Тип посещения",
-            "Цена",
-            "Комментарий к цене",
-            "Отряд",
-            "Особые отметки",
-        ]
-    )
-
-    for student in students:
-        ss = ss_map.get(student.id)
-        attendance_type = ss.get_attendance_type_display() if ss else ""
-        price = ss.individual_price or ss.default_price if ss else ""
-        price_comment = ss.price_comment if ss else ""
-        special_notes = ss.special_notes if ss else ""
-
-        ws.append(
-            [
+    headers = [
+        "ФИО",
+        "Телефон",
+        "Родитель",
+        "Тип посещения",
+        "Цена",
+        "Комментарий к цене",
+        "Отряд",
+        "Особые отметки",
+    ]
+
+    def rows():
+        for student in students.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            ss = ss_map.get(student.id)
+            attendance_type = ss.get_attendance_type_display() if ss else ""
+            price = ss.individual_price or ss.default_price if ss else ""
+            price_comment = ss.price_comment if ss else ""
+            special_notes = ss.special_notes if ss else ""
+
+            yield [
                 student.full_name,
                 student.phone,
                 student.parent_name,
@@ -660,35 +556,24 @@ def export_schedule_students_excel(request, pk):
                 student.squad.name if student.squad else "—",
                 special_notes or "—",
             ]
-        )
 
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
-    response = HttpResponse(
-        buffer,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = (
-        f"attachment; filename=students_{schedule.name}.xlsx"
+    return excel_export_response(
+        f"students_{schedule.name}.xlsx",
+        f"Ученики {schedule.name}",
+        headers,
+        rows(),
     )
-    return response
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
+@cached_schedule_export("students_pdf", "students_{name}.pdf")
 def export_schedule_students_pdf(request, pk):
     schedule = get_object_or_404(Schedule, pk=pk)
-    students = schedule.students.prefetch_related("studentschedule_set").order_by(
-        "full_name"
-    )
+    students = schedule.students.select_related("squad").order_by("full_name")
 
     # Собираем StudentSchedule для шаблона
     ss_map = {
-        ss.student_id: ss
-        for ss in StudentSchedule.objects.filter(
-            schedule=schedule, student__in=students
-        )
+        ss.student_id: ss for ss in StudentSchedule.objects.filter(schedule=schedule)
     }
 
     html_string = render_to_string(
@@ -699,13 +584,7 @@ def export_schedule_students_pdf(request, pk):
             "student_schedule_map": ss_map,
         },
     )
-    html = HTML(string=html_string)
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f"inline; filename=students_{schedule.name}.pdf"
-    html.write_pdf(response)
-
-    return response
+    return pdf_response(html_string, f"students_{schedule.name}.pdf")
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
@@ -772,36 +651,28 @@ def toggle_attendance(request, schedule_id):
             date_str = data.get("date")
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
 
-            student = get_object_or_404(Student, id=student_id)
-            att, created = Attendance.objects.get_or_create(
-                student=student,
-                date=date_obj,
-                defaults={"present": False, "excused": False},
-            )
-
-            if not att.present and not att.excused:
-                att.present = True
-                status = "present"
-            elif att.present:
-                att.present = False
-                att.excused = True
-                status = "excused"
-            else:
-                att.excused = False
-                status = "absent"
-            att.save()
+            if not StudentSchedule.objects.filter(
+                schedule=schedule, student_id=student_id
+            ).exists():
+                return JsonResponse(
+                    {"status": "error", "message": "Ученик не записан на смену"},
+                    status=404,
+                )
 
-            total_attendance = Attendance.objects.filter(
-                student=student,
-                date__range=(schedule.start_date, schedule.end_date),
-                present=True,
-            ).count()
+            present, excused, total_attendance = cycle_attendance(
+                Attendance,
+                "student",
+                student_id,
+                date_obj,
+                schedule.start_date,
+                schedule.end_date,
+            )
 
             return JsonResponse(
                 {
                     "status": "success",
-                    "present": att.present,
-                    "excused": att.excused,
+                    "present": present,
+                    "excused": excused,
                     "total_attendance": total_attendance,
                     "student_id": student_id,
                     "date": date_str,
@@ -813,36 +684,26 @@ def toggle_attendance(request, schedule_id):
             date_str = data.get("date")
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
 
-            employee = get_object_or_404(Employee, id=employee_id)
-            att, created = EmployeeAttendance.objects.get_or_create(
-                employee=employee,
-                date=date_obj,
-                defaults={"present": False, "excused": False},
-            )
-
-            if not att.present and not att.excused:
-                att.present = True
-                status = "present"
-            elif att.present:
-                att.present = False
-                att.excused = True
-                status = "excused"
-            else:
-                att.excused = False
-                status = "absent"
-            att.save()
+            if not Employee.objects.filter(schedule=schedule, id=employee_id).exists():
+                return JsonResponse(
+                    {"status": "error", "message": "Сотрудник не работает на смене"},
+                    status=404,
+                )
 
-            total_attendance = EmployeeAttendance.objects.filter(
-                employee=employee,
-                date__range=(schedule.start_date, schedule.end_date),
-                present=True,
-            ).count()
+            present, excused, total_attendance = cycle_attendance(
+                EmployeeAttendance,
+                "employee",
+                employee_id,
+                date_obj,
+                schedule.start_date,
+                schedule.end_date,
+            )
 
             return JsonResponse(
                 {
                     "status": "success",
-                    "present": att.present,
-                    "excused": att.excused,
+                    "present": present,
+                    "excused": excused,
                     "total_attendance": total_attendance,
                     "employee_id": employee_id,
                     "date": date_str,
@@ -859,16 +720,64 @@ def toggle_attendance(request, schedule_id):
         return JsonResponse({"status": "error", "message": str(e)}, status=400)
 
 
+@require_POST
+@role_required(["manager", "admin", "camp_head", "lab_head"])
+def batch_attendance(request, schedule_id):
+    """
+    Пакетное сохранение посещаемости: {"items": [{"student_id" | "employee_id",
+    "date", "status"}, ...]}, status — present / excused / absent.
+    Повторные отметки одной ячейки схлопываются, побеждает последняя.
+    """
+    schedule = get_object_or_404(Schedule, pk=schedule_id)
+
+    student_marks = {}
+    employee_marks = {}
+    try:
+        items = json.loads(request.body)["items"]
+        for item in items:
+            status = item["status"]
+            if status not in ATTENDANCE_FLAGS:
+                raise ValueError(f"Неизвестный статус: {status}")
+            date_obj = datetime.strptime(item["date"], "%Y-%m-%d").date()
+            if not schedule.start_date <= date_obj <= schedule.end_date:
+                raise ValueError(f"Дата {item['date']} вне смены")
+            if "student_id" in item:
+                student_marks[(int(item["student_id"]), date_obj)] = status
+            elif "employee_id" in item:
+                employee_marks[(int(item["employee_id"]), date_obj)] = status
+            else:
+                raise ValueError("Не указан student_id или employee_id")
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    # Отмечать можно только участников этой смены
+    student_ids = {student_id for student_id, _ in student_marks}
+    employee_ids = {employee_id for employee_id, _ in employee_marks}
+    enrolled = set(
+        StudentSchedule.objects.filter(
+            schedule=schedule, student_id__in=student_ids
+        ).values_list("student_id", flat=True)
+    )
+    assigned = set(
+        Employee.objects.filter(schedule=schedule, id__in=employee_ids).values_list(
+            "id", flat=True
+        )
+    )
+    if enrolled != student_ids or assigned != employee_ids:
+        return JsonResponse(
+            {"status": "error", "message": "Участник не относится к смене"},
+            status=400,
+        )
+
+    totals = save_attendance_batch(schedule, student_marks, employee_marks)
+    return JsonResponse({"status": "success", **totals})
+
+
 def get_updated_schedule_data(request, pk):
     try:
         schedule = Schedule.objects.get(pk=pk)
 
-        total_payments = (
-            Payment.objects.filter(student__schedules=schedule).aggregate(
-                total=Sum("amount")
-            )["total"]
-            or 0
-        )
+        total_payments = get_schedule_paid_total(schedule)
 
         total_expenses = (
             Expense.objects.filter(schedule=schedule).aggregate(total=Sum("amount"))[
@@ -889,24 +798,20 @@ def get_updated_schedule_data(request, pk):
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
+@cached_schedule_export("attendance_xlsx", "attendance_{name}.xlsx", as_attachment=True)
 def export_schedule_attendance_excel(request, pk):
     schedule = get_object_or_404(Schedule, pk=pk)
-    students = schedule.students.prefetch_related("studentschedule_set").order_by(
-        "full_name"
+    students = (
+        schedule.students.with_finance(schedule)
+        .select_related("squad")
+        .order_by("full_name")
     )
 
     # Карта StudentSchedule
     ss_map = {
-        ss.student_id: ss
-        for ss in StudentSchedule.objects.filter(
-            schedule=schedule, student__in=students
-        )
+        ss.student_id: ss for ss in StudentSchedule.objects.filter(schedule=schedule)
     }
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Посещаемость {sanitize_sheet_name(schedule.name)}"
-
     headers = ["№", "ФИО", "Стоимость", "Платежи", "Тип", "Явка"]
     dates = []
     current_date = schedule.start_date
@@ -915,71 +820,49 @@ def export_schedule_attendance_excel(request, pk):
         headers.append(current_date.strftime("%d.%m"))
         current_date += timedelta(days=1)
 
-    ws.append(headers)
-
-    for index, student in enumerate(students, 1):
-        ss = ss_map.get(student.id)
-        attendance_count = Attendance.objects.filter(
-            student=student, date__in=dates, present=True
-        ).count()
-
-        total_paid = (
-            Payment.objects.filter(student=student, schedule=schedule).aggregate(
-                total=Sum("amount")
-            )["total"]
-            or 0
-        )
-
-        row = [
-            index,
-            student.full_name,
-            ss.individual_price or ss.default_price if ss else "",
-            total_paid,
-            ss.get_attendance_type_display() if ss else "",
-            attendance_count,
-        ]
+    # Вся посещаемость смены — одним запросом
+    matrix = AttendanceMatrix(schedule, dates)
+    marks = {
+        AttendanceMatrix.PRESENT: "✓",
+        AttendanceMatrix.EXCUSED: "⚠",
+        AttendanceMatrix.ABSENT: "✗",
+    }
 
-        for date in dates:
-            try:
-                att = Attendance.objects.get(student=student, date=date)
-                if att.present:
-                    status = "✓"
-                elif att.excused:
-                    status = "⚠"
-                else:
-                    status = "✗"
-            except Attendance.DoesNotExist:
-                status = "✗"
-            row.append(status)
-
-        ws.append(row)
-
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
-    response = HttpResponse(
-        buffer,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = (
-        f"attachment; filename=attendance_{schedule.name}.xlsx"
+    def rows():
+        students_iter = students.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for index, student in enumerate(students_iter, 1):
+            ss = ss_map.get(student.id)
+            row = [
+                index,
+                student.full_name,
+                ss.individual_price or ss.default_price if ss else "",
+                student.total_paid,
+                ss.get_attendance_type_display() if ss else "",
+                matrix.present_count(student.id),
+            ]
+            row.extend(marks[status] for status in matrix.statuses(student.id))
+            yield row
+
+    return excel_export_response(
+        f"attendance_{schedule.name}.xlsx",
+        f"Посещаемость {schedule.name}",
+        headers,
+        rows(),
     )
-    return response
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
+@cached_schedule_export("attendance_pdf", "attendance_{name}.pdf")
 def export_schedule_attendance_pdf(request, pk):
     schedule = get_object_or_404(Schedule, pk=pk)
-    students = schedule.students.prefetch_related("studentschedule_set").order_by(
-        "full_name"
+    students = (
+        schedule.students.with_finance(schedule)
+        .select_related("squad")
+        .order_by("full_name")
     )
 
     ss_map = {
-        ss.student_id: ss
-        for ss in StudentSchedule.objects.filter(
-            schedule=schedule, student__in=students
-        )
+        ss.student_id: ss for ss in StudentSchedule.objects.filter(schedule=schedule)
     }
 
     dates = []
@@ -988,59 +871,44 @@ def export_schedule_attendance_pdf(request, pk):
         dates.append(current_date)
         current_date += timedelta(days=1)
 
+    matrix = AttendanceMatrix(schedule, dates)
+    labels = {
+        AttendanceMatrix.PRESENT: "Присутствовал",
+        AttendanceMatrix.EXCUSED: "По уважительной",
+        AttendanceMatrix.ABSENT: "Отсутствовал",
+    }
+
     attendance_data = []
     for student in students:
         ss = ss_map.get(student.id)
-        attendance_count = Attendance.objects.filter(
-            student=student, date__in=dates, present=True
-        ).count()
-
-        total_paid = (
-            Payment.objects.filter(student=student, schedule=schedule).aggregate(
-                total=Sum("amount")
-            )["total"]
-            or 0
+        attendance_data.append(
+            {
+                "full_name": student.full_name,
+                "attendance_type": ss.get_attendance_type_display() if ss else "",
+                "price": ss.individual_price or ss.default_price if ss else "",
+                "total_paid": student.total_paid,
+                "current_balance": student.current_balance,
+                "attendance_count": matrix.present_count(student.id),
+                "squad_name": student.squad.name if student.squad else None,
+                "special_notes": ss.special_notes if ss else "",
+                "daily_attendance": [
+                    {"date": date, "status": labels[status]}
+                    for date, status in zip(dates, matrix.statuses(student.id))
+                ],
+            }
         )
 
-        row = {
-            "full_name": student.full_name,
-            "attendance_type": ss.get_attendance_type_display() if ss else "",
-            "price": ss.individual_price or ss.default_price if ss else "",
-            "total_paid": total_paid,
-            "current_balance": student.current_balance,
-            "attendance_count": attendance_count,
-            "squad_name": student.squad.name if student.squad else None,
-            "special_notes": ss.special_notes if ss else "",
-            "daily_attendance": [],
-        }
-
-        for date in dates:
-            try:
-                att = Attendance.objects.get(student=student, date=date)
-                if att.present:
-                    status = "Присутствовал"
-                elif att.excused:
-                    status = "По уважительной"
-                else:
-                    status = "Отсутствовал"
-            except Attendance.DoesNotExist:
-                status = "Отсутствовал"
-            row["daily_attendance"].append({"date": date, "status": status})
-
-        attendance_data.append(row)
-
     html_string = render_to_string(
         "schedule/schedule_attendance_pdf.html",
-        {"schedule": schedule, "dates": dates, "attendance_data": attendance_data},
+        {
+            "schedule": schedule,
+            "dates": dates,
+            "attendance_data": attendance_data,
+            "day_totals": matrix.day_totals,
+        },
     )
 
-    html = HTML(string=html_string)
-    buffer = io.BytesIO()
-    html.write_pdf(buffer)
-
-    response = HttpResponse(buffer.getvalue(), content_type="application/pdf")
-    response["Content-Disposition"] = f"inline; filename=attendance_{schedule.name}.pdf"
-    return response
+    return pdf_response(html_string, f"attendance_{schedule.name}.pdf")
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
@@ -1105,15 +973,14 @@ def delete_squad(request, pk, squad_id):
 @login_required
 def schedule_search_students(request):
     """
-    Возвращает список студентов по подстроке в имени или номере телефона.
+    Возвращает список студентов по началу слов ФИО или окончанию номера
+    телефона, лучшие совпадения первыми (students/search.py).
     """
     query = request.GET.get("q", "").strip()
     if len(query) < 2:
         return JsonResponse({"students": []})
 
-    students = Student.objects.filter(
-        Q(full_name__icontains=query) | Q(phone__icontains=query)
-    )[:15]
+    students = search_students(query, Student.objects.only("id", "full_name"))
 
     return JsonResponse(
         {"students": [{"id": s.id, "full_name": s.full_name} for s in students]}
@@ -0,0 +1,76 @@
+// Глобальный поиск в шапке: ученики, сотрудники, лиды и смены за один запрос
+document.addEventListener('DOMContentLoaded', function() {
+  const input = document.getElementById('globalSearchInput');
+  const results = document.getElementById('globalSearchResults');
+  if (!input || !results) return;
+
+  let timer = null;
+  let controller = null;
+
+  function hide() {
+    results.classList.add('d-none');
+    results.innerHTML = '';
+  }
+
+  function render(items) {
+    results.innerHTML = '';
+    if (!items.length) {
+      const empty = document.createElement('div');
+      empty.className = 'list-group-item text-muted';
+      empty.textContent = 'Ничего не найдено';
+      results.appendChild(empty);
+    }
+    items.forEach(function(item) {
+      const link = document.createElement('a');
+      link.className = 'list-group-item list-group-item-action';
+      link.href = item.url;
+
+      const badge = document.createElement('span');
+      badge.className = 'badge bg-secondary me-2';
+      badge.textContent = item.type_label;
+      link.appendChild(badge);
+      link.appendChild(document.createTextNode(item.title));
+
+      if (item.subtitle) {
+        const subtitle = document.createElement('div');
+        subtitle.className = 'small text-muted';
+        subtitle.textContent = item.subtitle;
+        link.appendChild(subtitle);
+      }
+      results.appendChild(link);
+    });
+    results.classList.remove('d-none');
+  }
+
+  input.addEventListener('input', function() {
+    clearTimeout(timer);
+    const query = input.value.trim();
+    if (query.length < 2) {
+      hide();
+      return;
+    }
+    timer = setTimeout(function() {
+      if (controller) controller.abort();
+      controller = new AbortController();
+      fetch(input.dataset.url + '?q=' + encodeURIComponent(query), {
+        signal: controller.signal,
+      })
+        .then(function(response) { return response.json(); })
+        .then(function(data) { render(data.results); })
+        .catch(function(error) {
+          if (error.name !== 'AbortError') hide();
+        });
+    }, 200);
+  });
+
+  input.addEventListener('keydown', function(event) {
+    if (event.key === 'Escape') {
+      input.value = '';
+      hide();
+    }
+  });
+
+  document.addEventListener('click', function(event) {
+    if (!input.parentElement.contains(event.target)) hide();
+  });
+});
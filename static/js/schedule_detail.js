@@ -237,6 +237,13 @@ document.addEventListener('DOMContentLoaded', function () {
     });
   }
 
+  // Очередь отметок посещаемости: быстрые клики копятся и уходят одним
+  // запросом на /attendance/batch/; для ячейки побеждает последний клик
+  const ATTENDANCE_CYCLE = { absent: 'present', present: 'excused', excused: 'absent' };
+  const ATTENDANCE_FLUSH_DELAY = 400;
+  const pendingAttendance = new Map();
+  let attendanceFlushTimer = null;
+
   // Функция для обработки кликов по ячейкам посещаемости
   function handleAttendanceClick(event) {
     const cell = event.target.closest('.attendance-cell');
@@ -246,68 +253,86 @@ document.addEventListener('DOMContentLoaded', function () {
     const employeeId = cell.dataset.employeeId;
     const studentId = cell.dataset.studentId;
     const date = cell.dataset.date;
+    if (!employeeId && !studentId) return;
+
+    const key = employeeId ? `employee-${employeeId}-${date}` : `student-${studentId}-${date}`;
+    const current = cell.dataset.attendanceType || 'absent';
+    const status = ATTENDANCE_CYCLE[current] || 'present';
+
+    // Сразу показываем новый статус, исходный запоминаем для отката
+    const pending = pendingAttendance.get(key);
+    pendingAttendance.set(key, {
+      cell: cell,
+      item: employeeId
+        ? { employee_id: employeeId, date: date, status: status }
+        : { student_id: studentId, date: date, status: status },
+      original: pending ? pending.original : current
+    });
+    updateAttendanceCell(cell, { present: status === 'present', excused: status === 'excused' });
+    updateAttendanceTotals();
 
-    if (employeeId) {
-      // Обработка посещаемости сотрудника
-      fetch(`/schedule/${SCHEDULE_ID}/toggle_attendance/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRFToken': CSRF_TOKEN
-        },
-        body: JSON.stringify({
-          employee_id: employeeId,
-          date: date
-        })
-      })
-        .then(response => response.json())
-        .then(data => {
-          if (data.status === 'success') {
-            updateAttendanceCell(cell, data);
-
-            // Обновляем счетчик посещений сотрудника
-            if (data.employee_id) {
-              const row = document.getElementById(`employee-${data.employee_id}`);
-              if (row) {
-                const countCell = row.querySelector('td:nth-child(7)'); // Обновлен индекс из-за нового столбца
-                if (countCell) {
-                  countCell.textContent = data.total_attendance;
-                }
+    clearTimeout(attendanceFlushTimer);
+    attendanceFlushTimer = setTimeout(flushAttendance, ATTENDANCE_FLUSH_DELAY);
+  }
 
-                // Обновляем зарплату сотрудника
-                updateEmployeeSalary(data.employee_id, data.total_attendance);
-              }
+  // Отправка накопленных отметок одним запросом
+  function flushAttendance() {
+    if (pendingAttendance.size === 0) return;
+
+    const batch = Array.from(pendingAttendance.values());
+    pendingAttendance.clear();
+
+    fetch(`/schedule/${SCHEDULE_ID}/attendance/batch/`, {
+      method: 'POST',
+      keepalive: true,
+      headers: {
+        'Content-Type': 'application/json',
+        'X-CSRFToken': CSRF_TOKEN
+      },
+      body: JSON.stringify({ items: batch.map(entry => entry.item) })
+    })
+      .then(response => response.json())
+      .then(data => {
+        if (data.status !== 'success') {
+          throw new Error(data.message || 'Не удалось сохранить посещаемость');
+        }
+
+        Object.entries(data.students || {}).forEach(([studentId, total]) => {
+          updateAttendanceCounter(studentId, total);
+        });
+
+        Object.entries(data.employees || {}).forEach(([employeeId, total]) => {
+          const row = document.getElementById(`employee-${employeeId}`);
+          if (row) {
+            const countCell = row.querySelector('td:nth-child(7)');
+            if (countCell) {
+              countCell.textContent = total;
             }
-            updateAttendanceTotals(); // Обновляем итоги
+            updateEmployeeSalary(employeeId, total);
           }
-        })
-        .catch(error => console.error('Error:', error));
-    }
-    else if (studentId) {
-      // Обработка посещаемости ученика
-      fetch(`/schedule/${SCHEDULE_ID}/toggle_attendance/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRFToken': CSRF_TOKEN
-        },
-        body: JSON.stringify({
-          student_id: studentId,
-          date: date
-        })
+        });
       })
-        .then(response => response.json())
-        .then(data => {
-          if (data.status === 'success') {
-            updateAttendanceCell(cell, data);
-            updateAttendanceCounter(studentId, data.total_attendance);
-            updateAttendanceTotals(); // Обновляем итоги
+      .catch(error => {
+        console.error('Error:', error);
+        // Возвращаем ячейкам исходный вид, если их не успели кликнуть снова
+        batch.forEach(entry => {
+          const key = entry.item.employee_id
+            ? `employee-${entry.item.employee_id}-${entry.item.date}`
+            : `student-${entry.item.student_id}-${entry.item.date}`;
+          if (!pendingAttendance.has(key)) {
+            updateAttendanceCell(entry.cell, {
+              present: entry.original === 'present',
+              excused: entry.original === 'excused'
+            });
           }
-        })
-        .catch(error => console.error('Error:', error));
-    }
+        });
+        updateAttendanceTotals();
+      });
   }
 
+  // Не теряем отметки, если страницу закрывают до отправки
+  window.addEventListener('beforeunload', flushAttendance);
+
   // Функция обновления зарплаты сотрудника
   function updateEmployeeSalary(employeeId, attendanceCount) {
     const row = document.getElementById(`employee-${employeeId}`);
@@ -137,6 +137,7 @@ class StudentAdmin(admin.ModelAdmin):
 
         # 4. Операции по балансу (Balance)
         duplicate.balance_operations.all().update(student=master)
+        Student.rebuild_balances([master.id])
 
         # 5. Отряд (squad) – переносим, только если у master не задан
         if not master.squad and duplicate.squad:
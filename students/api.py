@@ -1,6 +1,7 @@
 from ninja import Router
 from schedule.models import Schedule
 from students.models import Attendance, Payment, Student, Squad
+from students.search import duplicates_as_dicts, find_duplicates
 from students.schemas import (
     AttendanceCreateSchema,
     AttendanceSchema,
@@ -13,6 +14,7 @@ from students.schemas import (
     StudentUpdateSchema,
     SquadSchema,
 )
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from django.core.exceptions import PermissionDenied
@@ -22,7 +24,7 @@ router = Router(tags=["Students"])
 
 @router.get("/", response=list[StudentSchema])
 def list_students(request):
-    students = Student.objects.all()
+    students = Student.objects.with_finance().select_related("squad__leader")
 
     # Фильтрация для начальников лагеря/лаборатории и администраторов
     if request.user.role in ["camp_head", "lab_head"]:
@@ -49,16 +51,25 @@ def get_student(request, student_id: int):
 
 @router.post("/", response=StudentSchema)
 def create_student(request, data: StudentCreateSchema):
-    # Создаём студента без привязки к конкретной смене
+    # Похожие ученики (students/search.py): 409, если не force_create
+    if not data.force_create:
+        duplicates = find_duplicates(data.full_name, data.phone, data.parent_name)
+        if duplicates:
+            return JsonResponse(
+                {
+                    "error": "Найдены похожие ученики",
+                    "duplicates": duplicates_as_dicts(duplicates),
+                },
+                status=409,
+            )
+
+    # Создаём студента без привязки к конкретной смене: параметры участия
+    # хранятся в StudentSchedule
     student = Student.objects.create(
         full_name=data.full_name,
-        phone=data.phone,
-        parent_name=data.parent_name,
-        attendance_type=data.attendance_type,
-        default_price=data.default_price,
-        individual_price=data.individual_price,
-        price_comment=data.price_comment,
-        special_notes=data.special_notes,
+        phone=data.phone or "",
+        parent_name=data.parent_name or "",
+        squad_id=data.squad_id,
     )
     return student
 
@@ -5,4 +5,6 @@ class StudentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "students"
 
-
+    def ready(self):
+        # Регистрируем сигналы
+        import students.signals
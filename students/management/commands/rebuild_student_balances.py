@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from students.models import Student
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сохранённые балансы учеников по журналу операций"
+
+    def handle(self, *args, **options):
+        updated = Student.rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано балансов: {updated}"))
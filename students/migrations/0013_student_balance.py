@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:52
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def fill_student_balances(apps, schema_editor):
+    Student = apps.get_model("students", "Student")
+    Balance = apps.get_model("students", "Balance")
+    signed_amount = Case(
+        When(operation_type="deposit", then=F("amount")),
+        When(operation_type="payment", then=-F("amount")),
+        When(operation_type="correction", then=F("amount")),
+        default=Value(0),
+        output_field=models.DecimalField(),
+    )
+    totals = (
+        Balance.objects.filter(student=OuterRef("pk"))
+        .order_by()
+        .values("student")
+        .annotate(total=Sum(signed_amount))
+        .values("total")
+    )
+    Student.objects.update(
+        balance=Coalesce(Subquery(totals, output_field=models.DecimalField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("students", "0012_move_fields_to_studentschedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="student",
+            name="balance",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                max_digits=12,
+                verbose_name="Баланс",
+            ),
+        ),
+        migrations.RunPython(fill_student_balances, migrations.RunPython.noop),
+    ]
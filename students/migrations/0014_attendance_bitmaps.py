@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+from schedule.bitmaps import mask_from_days
+
+
+def fill_attendance_bitmaps(apps, schema_editor):
+    """Заполняет битовые маски за смену по строкам Attendance."""
+    StudentSchedule = apps.get_model("students", "StudentSchedule")
+    Attendance = apps.get_model("students", "Attendance")
+
+    rows = list(StudentSchedule.objects.select_related("schedule"))
+    for offset in range(0, len(rows), 500):
+        chunk = rows[offset : offset + 500]
+        marks = {}
+        for person_id, date, present, excused in Attendance.objects.filter(
+            student_id__in={row.student_id for row in chunk},
+            date__range=(
+                min(row.schedule.start_date for row in chunk),
+                max(row.schedule.end_date for row in chunk),
+            ),
+        ).values_list("student_id", "date", "present", "excused"):
+            marks.setdefault(person_id, []).append((date, present, excused))
+
+        for row in chunk:
+            start, end = row.schedule.start_date, row.schedule.end_date
+            person_marks = marks.get(row.student_id, [])
+            row.present_days = mask_from_days(
+                start, end, [date for date, present, _ in person_marks if present]
+            )
+            row.excused_days = mask_from_days(
+                start, end, [date for date, _, excused in person_marks if excused]
+            )
+        StudentSchedule.objects.bulk_update(chunk, ["present_days", "excused_days"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("students", "0013_student_balance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="studentschedule",
+            name="excused_days",
+            field=models.BinaryField(
+                default=b"", verbose_name="Дни по уважительной причине"
+            ),
+        ),
+        migrations.AddField(
+            model_name="studentschedule",
+            name="present_days",
+            field=models.BinaryField(default=b"", verbose_name="Дни присутствия"),
+        ),
+        migrations.RunPython(fill_attendance_bitmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from students.search import name_tokens, phone_digits
+
+
+def fill_search_columns(apps, schema_editor):
+    Student = apps.get_model("students", "Student")
+    StudentSearchToken = apps.get_model("students", "StudentSearchToken")
+    students = list(Student.objects.only("full_name", "phone"))
+    tokens = []
+    for student in students:
+        words = name_tokens(student.full_name)
+        student.search_name = " ".join(words)
+        student.phone_digits_rev = phone_digits(student.phone)[::-1]
+        tokens.extend(
+            StudentSearchToken(student_id=student.pk, token=word) for word in set(words)
+        )
+    Student.objects.bulk_update(
+        students, ["search_name", "phone_digits_rev"], batch_size=500
+    )
+    StudentSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("students", "0014_attendance_bitmaps"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="student",
+            name="phone_digits_rev",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=20
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="search_name",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=255
+            ),
+        ),
+        migrations.CreateModel(
+            name="StudentSearchToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token", models.CharField(max_length=64)),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_tokens",
+                        to="students.student",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("token", "student")},
+            },
+        ),
+        migrations.RunPython(fill_search_columns, migrations.RunPython.noop),
+    ]
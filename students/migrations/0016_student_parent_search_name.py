@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+from students.search import normalize_name
+
+
+def fill_parent_search_name(apps, schema_editor):
+    Student = apps.get_model("students", "Student")
+    students = list(Student.objects.exclude(parent_name="").only("parent_name"))
+    for student in students:
+        student.parent_search_name = normalize_name(student.parent_name)
+    Student.objects.bulk_update(students, ["parent_search_name"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("students", "0015_student_search_columns"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="student",
+            name="parent_search_name",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(fill_parent_search_name, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,23 @@
 import re
 from django.utils import timezone
-from django.db.models import Sum
-from django.db import models
+from django.db.models import (
+    Aggregate,
+    Case,
+    CharField,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.db import models, transaction
 from jget_crm import settings
-from schedule.models import Schedule
+from schedule.models import AttendanceBitmap, Schedule
 from schedule.templatetags.schedule_extras import romanize
+from students.search import name_tokens, normalize_name, phone_digits
 
 
 class Squad(models.Model):
@@ -43,6 +56,56 @@ class Squad(models.Model):
         return romanize(self.name) if self.name else str(self.name)
 
 
+class GroupConcat(Aggregate):
+    """GROUP_CONCAT с разделителем по умолчанию (",") — MySQL и SQLite."""
+
+    function = "GROUP_CONCAT"
+    output_field = CharField()
+
+
+class StudentQuerySet(models.QuerySet):
+    def with_finance(self, schedule=None):
+        """
+        Аннотирует учеников финансовыми данными одним запросом:
+        total_paid — сумма платежей (за смену schedule, если передана, иначе
+        за все смены) и schedule_ids_csv — ID смен ученика через запятую.
+        Баланс хранится в колонке balance и аннотации не требует.
+        """
+        payments = Payment.objects.filter(student=OuterRef("pk"))
+        if schedule is not None:
+            payments = payments.filter(schedule=schedule)
+        total_paid = (
+            payments.order_by()
+            .values("student")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        schedule_ids = (
+            StudentSchedule.objects.filter(student=OuterRef("pk"))
+            .order_by()
+            .values("student")
+            .annotate(ids=GroupConcat("schedule_id"))
+            .values("ids")
+        )
+        return self.annotate(
+            total_paid=Coalesce(
+                Subquery(total_paid, output_field=models.DecimalField()),
+                Value(0),
+                output_field=models.DecimalField(),
+            ),
+            schedule_ids_csv=Subquery(schedule_ids, output_field=CharField()),
+        )
+
+    def with_schedules(self):
+        """Подгружает смены (с филиалами) и отряд для списков и выгрузок."""
+        return self.select_related("squad__leader").prefetch_related(
+            Prefetch(
+                "schedules",
+                queryset=Schedule.objects.select_related("branch").order_by("pk"),
+            )
+        )
+
+
 class Student(models.Model):
     # Базовые персональные данные (без привязки к смене)
     full_name = models.CharField(max_length=255, verbose_name="ФИО")
@@ -65,33 +128,80 @@ class Student(models.Model):
         verbose_name="Отряд",
         related_name="students",
     )
+    # Нормализованные колонки для поиска (students/search.py), заполняются в save
+    search_name = models.CharField(
+        max_length=255, blank=True, db_index=True, editable=False
+    )
+    phone_digits_rev = models.CharField(
+        max_length=20, blank=True, db_index=True, editable=False
+    )
+    parent_search_name = models.CharField(
+        max_length=255, blank=True, db_index=True, editable=False
+    )
     # attendance_dates пока оставляем – оно может использоваться для быстрых пометок,
     # но его использование стоит пересмотреть. Пока не трогаем.
     attendance_dates = models.JSONField(
         default=list, blank=True, verbose_name="Даты посещений"
     )
 
+    # Денормализованный баланс: поддерживается Balance.save и сигналом
+    # post_delete в одной транзакции с операцией, пересчитывается командой
+    # rebuild_student_balances
+    balance = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Баланс",
+    )
+
+    objects = StudentQuerySet.as_manager()
+
     @property
     def current_balance(self):
-        deposits = (
-            self.balance_operations.filter(operation_type="deposit").aggregate(
-                Sum("amount")
-            )["amount__sum"]
-            or 0
-        )
-        payments = (
-            self.balance_operations.filter(operation_type="payment").aggregate(
-                Sum("amount")
-            )["amount__sum"]
-            or 0
+        return self.balance
+
+    @property
+    def enrolled_schedule_ids(self):
+        """ID смен ученика; без запроса, если применён with_finance()."""
+        if hasattr(self, "schedule_ids_csv"):
+            if not self.schedule_ids_csv:
+                return []
+            return sorted(int(pk) for pk in self.schedule_ids_csv.split(","))
+        return list(self.schedules.order_by("pk").values_list("pk", flat=True))
+
+    @classmethod
+    def apply_balance_delta(cls, student_id, delta):
+        """Атомарно сдвигает сохранённый баланс ученика на delta."""
+        if delta:
+            cls.objects.filter(pk=student_id).update(balance=F("balance") + delta)
+
+    @classmethod
+    def rebuild_balances(cls, student_ids=None):
+        """
+        Пересчитывает сохранённые балансы по журналу Balance одним UPDATE.
+        Если student_ids не передан, пересчитываются все ученики.
+        """
+        totals = (
+            Balance.objects.filter(student=OuterRef("pk"))
+            .order_by()
+            .values("student")
+            .annotate(total=Sum(Balance.signed_amount_expression()))
+            .values("total")
         )
-        corrections = (
-            self.balance_operations.filter(operation_type="correction").aggregate(
-                Sum("amount")
-            )["amount__sum"]
-            or 0
+        students = cls.objects.all()
+        enrollments = StudentSchedule.objects.all()
+        if student_ids is not None:
+            students = students.filter(pk__in=student_ids)
+            enrollments = enrollments.filter(student__in=student_ids)
+        updated = students.update(
+            balance=Coalesce(
+                Subquery(totals, output_field=models.DecimalField()), Value(0)
+            )
         )
-        return deposits - payments + corrections
+        # Баланс печатается в выгрузке посещаемости смены
+        Schedule.bump_data_version(enrollments.values("schedule_id"))
+        return updated
 
     def charge_for_schedule(self, schedule, user):
         """Списание стоимости смены с баланса ученика"""
@@ -140,10 +250,56 @@ class Student(models.Model):
         if self.phone:
             # Оставляем только цифры и плюс в начале
             self.phone = re.sub(r'[^\d+]', '', self.phone)
-        super().save(*args, **kwargs)
 
+        tokens = name_tokens(self.full_name)
+        adding = self._state.adding
+        name_changed = adding or self.search_name != " ".join(tokens)
+        self.search_name = " ".join(tokens)
+        self.phone_digits_rev = phone_digits(self.phone)[::-1]
+        self.parent_search_name = normalize_name(self.parent_name)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {
+                *kwargs["update_fields"],
+                "search_name",
+                "phone_digits_rev",
+                "parent_search_name",
+            }
+        elif not adding and not kwargs.get("force_insert"):
+            # balance меняет только apply_balance_delta; значение, загруженное
+            # раньше, затёрло бы чужие операции, сделанные между чтением и save
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "balance"
+            ]
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Слова ФИО для поиска переписываем, только если ФИО изменилось
+            if name_changed:
+                if not adding:
+                    StudentSearchToken.objects.filter(student=self).delete()
+                StudentSearchToken.objects.bulk_create(
+                    [
+                        StudentSearchToken(student=self, token=token)
+                        for token in set(tokens)
+                    ]
+                )
+
+
+class StudentSearchToken(models.Model):
+    """Слово ФИО ученика — для поиска по началу любого слова (students/search.py)."""
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="search_tokens"
+    )
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ("token", "student")
 
-class StudentSchedule(models.Model):
+
+class StudentSchedule(AttendanceBitmap):
     """Промежуточная модель с настройками участия студента в конкретной смене"""
 
     ATTENDANCE_TYPE_CHOICES = [
@@ -259,6 +415,37 @@ class Balance(models.Model):
         verbose_name="Кем создано",
     )
 
+    # Знак операции в балансе; прочие типы на баланс не влияют
+    BALANCE_SIGNS = {"deposit": 1, "payment": -1, "correction": 1}
+
+    @property
+    def signed_amount(self):
+        return self.amount * self.BALANCE_SIGNS.get(self.operation_type, 0)
+
+    @classmethod
+    def signed_amount_expression(cls):
+        return Case(
+            *[
+                When(operation_type=operation_type, then=F("amount") * sign)
+                for operation_type, sign in cls.BALANCE_SIGNS.items()
+            ],
+            default=Value(0),
+            output_field=models.DecimalField(),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.pk:
+                previous = Balance.objects.filter(pk=self.pk).first()
+                if previous:
+                    Student.apply_balance_delta(
+                        previous.student_id, -previous.signed_amount
+                    )
+            super().save(*args, **kwargs)
+            Student.apply_balance_delta(self.student_id, self.signed_amount)
+        if Balance.student.is_cached(self):
+            self.student.refresh_from_db(fields=["balance"])
+
     class Meta:
         verbose_name = "Операция по балансу"
         verbose_name_plural = "Операции по балансу"
@@ -12,7 +12,7 @@ class SquadSchema(Schema):
     leader: Optional[dict] = None
 
     @staticmethod
-    def resolve_leader(obj, info):
+    def resolve_leader(obj):
         if obj.leader:
             return {
                 "id": obj.leader.id,
@@ -30,25 +30,33 @@ class StudentSchema(Schema):
     parent_name: Optional[str]
     # Больше нет одиночного schedule_id
     schedules_ids: Optional[list[int]] = None  # список ID смен
-    attendance_type: str
+    # Параметры участия перенесены в StudentSchedule
+    attendance_type: Optional[str] = None
     attendance_dates: Optional[list] = None
-    default_price: float
-    individual_price: Optional[float]
-    price_comment: Optional[str]
+    default_price: Optional[float] = None
+    individual_price: Optional[float] = None
+    price_comment: Optional[str] = None
     special_notes: Optional[str] = None
     squad_name: Optional[str] = None
     squad_leader_name: Optional[str] = None
+    balance: float = 0
+    total_paid: Optional[float] = None
 
     @staticmethod
-    def resolve_schedules_ids(obj, info):
-        return [s.id for s in obj.schedules.all()]
+    def resolve_schedules_ids(obj):
+        return obj.enrolled_schedule_ids
 
     @staticmethod
-    def resolve_squad_name(obj, info):
+    def resolve_total_paid(obj):
+        # Заполняется аннотацией Student.objects.with_finance()
+        return getattr(obj, "total_paid", None)
+
+    @staticmethod
+    def resolve_squad_name(obj):
         return obj.squad.name if obj.squad else None
 
     @staticmethod
-    def resolve_squad_leader_name(obj, info):
+    def resolve_squad_leader_name(obj):
         if obj.squad and obj.squad.leader:
             return obj.squad.leader.full_name
         return None
@@ -60,11 +68,14 @@ class StudentCreateSchema(Schema):
     phone: Optional[str] = ""
     parent_name: Optional[str] = ""
     # schedule_id больше нет – привязка к смене будет через отдельные M2M-операции
-    attendance_type: str
+    # Параметры участия задаются в StudentSchedule, здесь не используются
+    attendance_type: Optional[str] = None
     default_price: Optional[float] = None
     individual_price: Optional[float] = None
     price_comment: Optional[str] = ""
     special_notes: Optional[str] = None
+    # Создать, даже если найдены похожие ученики
+    force_create: bool = False
 
 
 class StudentUpdateSchema(Schema):
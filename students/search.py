@@ -0,0 +1,170 @@
+# students/search.py
+"""
+Поиск учеников и проверка дубликатов по нормализованным колонкам.
+
+Student.search_name — ФИО в нижнем регистре с «ё» → «е» и словами через
+пробел, Student.parent_search_name — так же имя родителя,
+Student.phone_digits_rev — цифры телефона в обратном порядке,
+StudentSearchToken — отдельные слова ФИО. Колонки заполняет Student.save,
+все проиндексированы, поэтому и поиск по началу любого слова ФИО, и
+поиск по последним цифрам телефона — выборка диапазона по индексу.
+"""
+
+import re
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+TOKEN_MAX_LENGTH = 64
+SEARCH_LIMIT = 15
+DUPLICATES_LIMIT = 10
+# Телефоны сравниваются по последним цифрам: +7 912… и 8 912… совпадают
+PHONE_KEY_DIGITS = 10
+PHONE_MIN_DIGITS = 7
+DUPLICATE_WEIGHTS = {"ФИО": 4, "телефон": 2, "родитель": 1}
+DUPLICATE_MIN_SCORE = 3
+# Больше любого символа нормализованных колонок: верхняя граница префикса
+PREFIX_END = "\uffff"
+
+_NON_WORD = re.compile(r"[^\w]+|_")
+_NON_DIGIT = re.compile(r"\D")
+
+
+def name_tokens(text):
+    """Слова строки: нижний регистр, «ё» → «е», без знаков препинания."""
+    folded = (text or "").lower().replace("ё", "е")
+    return [token[:TOKEN_MAX_LENGTH] for token in _NON_WORD.sub(" ", folded).split()]
+
+
+def normalize_name(text):
+    return " ".join(name_tokens(text))
+
+
+def phone_digits(phone):
+    return _NON_DIGIT.sub("", phone or "")
+
+
+def _prefix(field, value):
+    """
+    Условие «field начинается с value» диапазоном по индексу. startswith
+    на MySQL даёт LIKE BINARY, а istartswith на SQLite — LIKE без индекса;
+    колонки уже нормализованы, регистр сравнивать не нужно.
+    """
+    return Q(**{f"{field}__gte": value, f"{field}__lt": value + PREFIX_END})
+
+
+def search_students(query, queryset=None, limit=SEARCH_LIMIT):
+    """
+    Ученики по строке запроса, лучшие совпадения первыми.
+
+    Слова из букв ищутся по началу слов ФИО (все слова запроса должны
+    совпасть), слова из цифр вместе — по окончанию номера телефона.
+    Порядок: ФИО совпало целиком, ФИО начинается с запроса, ФИО начинается
+    с первого слова запроса (обычно фамилия), остальные; внутри группы — по
+    алфавиту.
+    """
+    from .models import Student, StudentSearchToken
+
+    tokens = name_tokens(query)
+    words = [token for token in tokens if not token.isdigit()]
+    digits = "".join(token for token in tokens if token.isdigit())
+    if not words and not digits:
+        return Student.objects.none()
+
+    students = Student.objects.all() if queryset is None else queryset
+    for word in words:
+        students = students.filter(
+            pk__in=StudentSearchToken.objects.filter(_prefix("token", word)).values(
+                "student"
+            )
+        )
+    if digits:
+        students = students.filter(_prefix("phone_digits_rev", digits[::-1]))
+
+    name = " ".join(words)
+    surname = words[0] if words else ""
+    return students.annotate(
+        relevance=Case(
+            When(search_name=name, then=Value(0)),
+            When(search_name__startswith=name, then=Value(1)),
+            When(search_name__startswith=surname, then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField(),
+        )
+    ).order_by("relevance", "search_name", "pk")[:limit]
+
+
+def find_duplicates(full_name, phone="", parent_name="", limit=DUPLICATES_LIMIT):
+    """
+    Возможные дубликаты нового ученика, самые вероятные первыми.
+
+    Кандидаты выбираются по индексам: совпадение нормализованного ФИО или
+    последних цифр телефона (формат номера не важен). Очки: ФИО — 4,
+    телефон — 2, имя родителя — 1; дубликатом считается кандидат с ФИО
+    или с телефоном и родителем (не меньше 3 очков). У каждого
+    возвращённого ученика есть duplicate_score и duplicate_reasons.
+    """
+    from .models import Student
+
+    name = normalize_name(full_name)
+    parent = normalize_name(parent_name)
+    digits = phone_digits(phone)
+    phone_key = digits[-PHONE_KEY_DIGITS:][::-1]
+
+    has_phone = len(digits) >= PHONE_MIN_DIGITS
+    matches = []
+    if name:
+        matches.append(("ФИО", Q(search_name=name)))
+    if has_phone:
+        matches.append(("телефон", _prefix("phone_digits_rev", phone_key)))
+    conditions = Q()
+    for _, condition in matches:
+        conditions |= condition
+    if not conditions:
+        return []
+    if parent:
+        matches.append(("родитель", Q(parent_search_name=parent)))
+
+    # Очки считаются в запросе, чтобы срез брал самых вероятных кандидатов,
+    # а не первые попавшиеся строки
+    score = sum(
+        Case(
+            When(condition, then=Value(DUPLICATE_WEIGHTS[reason])),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        for reason, condition in matches
+    )
+    candidates = (
+        Student.objects.filter(conditions)
+        .annotate(duplicate_score=score)
+        .filter(duplicate_score__gte=DUPLICATE_MIN_SCORE)
+        .order_by("-duplicate_score", "pk")[:limit]
+    )
+
+    duplicates = []
+    for student in candidates:
+        reasons = []
+        if name and student.search_name == name:
+            reasons.append("ФИО")
+        if has_phone and student.phone_digits_rev.startswith(phone_key):
+            reasons.append("телефон")
+        if parent and student.parent_search_name == parent:
+            reasons.append("родитель")
+        student.duplicate_reasons = reasons
+        duplicates.append(student)
+    return duplicates
+
+
+def duplicates_as_dicts(students):
+    """Кандидаты find_duplicates для JSON-ответа (окно предупреждения в JS)."""
+    return [
+        {
+            "id": student.id,
+            "full_name": student.full_name,
+            "phone": student.phone,
+            "parent_name": student.parent_name,
+            "score": student.duplicate_score,
+            "reasons": student.duplicate_reasons,
+        }
+        for student in students
+    ]
@@ -0,0 +1,14 @@
+# students/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from students.models import Balance, Student
+
+
+@receiver(post_delete, sender=Balance)
+def revert_balance_operation(sender, instance, **kwargs):
+    """
+    Откатывает удалённую операцию из сохранённого баланса ученика.
+    Срабатывает и для удалений через QuerySet.delete() (в той же транзакции).
+    """
+    Student.apply_balance_delta(instance.student_id, -instance.signed_amount)
@@ -1,5 +1,274 @@
+import json
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+import openpyxl
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from branches.models import Branch
+from core.utils import EXPORT_CHUNK_SIZE, XLSX_CONTENT_TYPE
+from schedule.models import Schedule
+from students.models import Balance, Payment, Student, StudentSchedule
+from students.search import find_duplicates, search_students
+
+
+class StudentBalanceTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(full_name="Иванов Иван")
+        branch = Branch.objects.create(name="Main")
+        self.schedule = Schedule.objects.create(
+            name="Summer",
+            branch=branch,
+            start_date="2025-07-01",
+            end_date="2025-07-10",
+            theme="Robotics",
+        )
+
+    def test_balance_follows_operations(self):
+        Balance.objects.create(
+            student=self.student, amount=5000, operation_type="deposit"
+        )
+        payment = Balance.objects.create(
+            student=self.student, amount=2000, operation_type="payment"
+        )
+        self.assertEqual(self.student.current_balance, Decimal("3000"))
+
+        payment.amount = 1000
+        payment.save()
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.current_balance, Decimal("4000"))
+
+        Balance.objects.filter(pk=payment.pk).delete()
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.current_balance, Decimal("5000"))
+
+    def test_save_keeps_concurrent_balance_changes(self):
+        stale = Student.objects.get(pk=self.student.pk)
+        Balance.objects.create(
+            student=self.student, amount=5000, operation_type="deposit"
+        )
+
+        stale.full_name = "Иванов Иван Иванович"
+        stale.save()
+
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.full_name, "Иванов Иван Иванович")
+        self.assertEqual(self.student.current_balance, Decimal("5000"))
+
+    def test_schedule_charge_and_refund(self):
+        StudentSchedule.objects.create(
+            student=self.student, schedule=self.schedule, default_price=7000
+        )
+        self.student.charge_for_schedule(self.schedule, None)
+        self.assertEqual(self.student.current_balance, Decimal("-7000"))
+        self.student.refund_schedule_charge(self.schedule, None)
+        self.assertEqual(self.student.current_balance, Decimal("0"))
+
+    def test_rebuild_command(self):
+        Balance.objects.create(
+            student=self.student, amount=1500, operation_type="deposit"
+        )
+        Student.objects.update(balance=0)
+
+        call_command("rebuild_student_balances", stdout=StringIO())
+
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.current_balance, Decimal("1500"))
+
+
+class StudentFinanceQuerySetTests(TestCase):
+    def setUp(self):
+        branch = Branch.objects.create(name="Main")
+        self.first = Schedule.objects.create(
+            name="First",
+            branch=branch,
+            start_date="2025-07-01",
+            end_date="2025-07-10",
+            theme="Robotics",
+        )
+        self.second = Schedule.objects.create(
+            name="Second",
+            branch=branch,
+            start_date="2025-08-01",
+            end_date="2025-08-10",
+            theme="Chess",
+        )
+        self.student = Student.objects.create(full_name="Петров Пётр")
+        Student.objects.create(full_name="Без смен")
+        for schedule in [self.first, self.second]:
+            StudentSchedule.objects.create(student=self.student, schedule=schedule)
+        Payment.objects.create(student=self.student, schedule=self.first, amount=500)
+        Payment.objects.create(student=self.student, schedule=self.second, amount=700)
+
+    def test_with_finance_annotations(self):
+        with self.assertNumQueries(1):
+            students = {s.full_name: s for s in Student.objects.with_finance()}
+            student = students["Петров Пётр"]
+            self.assertEqual(student.total_paid, Decimal("1200"))
+            self.assertEqual(
+                student.enrolled_schedule_ids, [self.first.id, self.second.id]
+            )
+            self.assertEqual(students["Без смен"].total_paid, 0)
+            self.assertEqual(students["Без смен"].enrolled_schedule_ids, [])
+
+        student = Student.objects.with_finance(self.first).get(pk=self.student.pk)
+        self.assertEqual(student.total_paid, Decimal("500"))
+
+
+class StudentExcelExportTests(TestCase):
+    def setUp(self):
+        branch = Branch.objects.create(name="Main")
+        self.schedule = Schedule.objects.create(
+            name="Summer",
+            branch=branch,
+            start_date="2025-07-01",
+            end_date="2025-07-10",
+            theme="Robotics",
+        )
+        self.count = EXPORT_CHUNK_SIZE + 20
+        Student.objects.bulk_create(
+            Student(full_name=f"Ученик {i:04}", phone=f"8900{i:07}")
+            for i in range(self.count)
+        )
+        # Последний ученик попадает во вторую пачку iterator()
+        self.last = Student.objects.order_by("pk").last()
+        StudentSchedule.objects.create(student=self.last, schedule=self.schedule)
+        self.client.force_login(
+            get_user_model().objects.create_user(
+                username="manager", password="password", role="manager"
+            )
+        )
+
+    def test_streamed_workbook(self):
+        response = self.client.get("/students/export/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], XLSX_CONTENT_TYPE)
+        self.assertIn("students.xlsx", response["Content-Disposition"])
+
+        workbook = openpyxl.load_workbook(
+            BytesIO(b"".join(response.streaming_content)), read_only=True
+        )
+        rows = list(workbook["Ученики"].iter_rows(values_only=True))
+        self.assertEqual(rows[0], ("ФИО", "Телефон", "Родитель", "Смены"))
+        self.assertEqual(len(rows), self.count + 1)
+
+        by_name = {row[0]: row for row in rows[1:]}
+        self.assertEqual(by_name[self.last.full_name][3], str(self.schedule))
+        self.assertIsNone(by_name["Ученик 0000"][3])
+
+
+class StudentSearchTests(TestCase):
+    def setUp(self):
+        self.fedor = Student.objects.create(
+            full_name="Фёдоров  Пётр Ильич", phone="+7 (912) 345-67-89"
+        )
+        self.petrov = Student.objects.create(full_name="Петров Фёдор")
+        self.other = Student.objects.create(
+            full_name="Сидорова Анна", phone="8-900-111-22-33"
+        )
+
+    def names(self, query):
+        return [s.full_name for s in search_students(query)]
+
+    def test_normalized_columns(self):
+        self.assertEqual(self.fedor.search_name, "федоров петр ильич")
+        self.assertEqual(self.fedor.phone_digits_rev, "98765432197")
+
+        self.fedor.full_name = "Фёдоров Павел"
+        self.fedor.save(update_fields=["full_name"])
+        self.fedor.refresh_from_db()
+        self.assertEqual(self.fedor.search_name, "федоров павел")
+        self.assertEqual(
+            set(self.fedor.search_tokens.values_list("token", flat=True)),
+            {"федоров", "павел"},
+        )
+
+    def test_prefix_tokens_and_relevance(self):
+        # «ё» и «е» не различаются; начинающиеся с запроса ФИО — первыми
+        self.assertEqual(self.names("федор"), ["Фёдоров  Пётр Ильич", "Петров Фёдор"])
+        self.assertEqual(self.names("пет фед"), ["Петров Фёдор", "Фёдоров  Пётр Ильич"])
+        self.assertEqual(self.names("петров федор"), ["Петров Фёдор"])
+        self.assertEqual(self.names("ров"), [])
+
+    def test_phone_suffix(self):
+        self.assertEqual(self.names("67-89"), ["Фёдоров  Пётр Ильич"])
+        self.assertEqual(self.names("2233"), ["Сидорова Анна"])
+        self.assertEqual(self.names("сид 2233"), ["Сидорова Анна"])
+        self.assertEqual(self.names("6789 сид"), [])
+
+
+class StudentDuplicateTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(
+            full_name="Фёдоров Пётр",
+            phone="+7 912 345-67-89",
+            parent_name="Фёдорова Ольга",
+        )
+        self.namesake = Student.objects.create(full_name="Федоров Петр")
+        self.client.force_login(
+            get_user_model().objects.create_user(
+                username="manager", password="password", role="manager"
+            )
+        )
+
+    def test_normalized_keys_and_ranking(self):
+        duplicates = find_duplicates("  федоров   ПЁТР ", "8 (912) 345-67-89")
+        self.assertEqual(duplicates, [self.student, self.namesake])
+        self.assertEqual(duplicates[0].duplicate_reasons, ["ФИО", "телефон"])
+
+        # Тот же телефон и родитель при опечатке в ФИО
+        self.assertEqual(
+            find_duplicates("Федоров Пётор", "89123456789", "федорова ольга"),
+            [self.student],
+        )
+        # Одного телефона мало: у братьев и сестёр он общий
+        self.assertEqual(find_duplicates("Федоров Иван", "89123456789"), [])
+
+    def test_best_candidates_survive_limit(self):
+        for _ in range(6):
+            Student.objects.create(phone="+7 912 345-67-89")
+        best = Student.objects.create(
+            full_name="Иванов Иван",
+            phone="+7 912 345-67-89",
+            parent_name="Иванова Анна",
+        )
+        duplicates = find_duplicates(
+            "Иванов Иван", "89123456789", "Иванова Анна", limit=1
+        )
+        self.assertEqual(duplicates, [best])
+        self.assertEqual(duplicates[0].duplicate_score, 7)
+
+    def test_ajax_create(self):
+        data = {"full_name": "Федоров  Пётр", "phone": "", "parent_name": ""}
+        response = self.client.post(
+            "/students/create/ajax/", json.dumps(data), content_type="application/json"
+        )
+        self.assertEqual(
+            [d["id"] for d in response.json()["duplicates"]],
+            [self.student.pk, self.namesake.pk],
+        )
+
+        data["force_create"] = True
+        response = self.client.post(
+            "/students/create/ajax/", json.dumps(data), content_type="application/json"
+        )
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(Student.objects.filter(search_name="федоров петр").count(), 3)
 
+    def test_api_create(self):
+        data = {"full_name": "Фёдоров Пётр", "phone": "89123456789"}
+        response = self.client.post(
+            "/api/students/", json.dumps(data), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["duplicates"][0]["id"], self.student.pk)
 
+        data.update(full_name="Иванов Иван", force_create=False)
+        response = self.client.post(
+            "/api/students/", json.dumps(data), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["phone"], "89123456789")
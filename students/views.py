@@ -1,17 +1,15 @@
 from decimal import Decimal
-import io
 import json
-import openpyxl
 import logging
-from django.http import HttpResponse, JsonResponse
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST, require_http_methods, require_GET
 from django.utils import timezone
 from django.db.models import Q
-from weasyprint import HTML
 
-from core.utils import role_required
+from core.pdf import pdf_response
+from core.utils import EXPORT_CHUNK_SIZE, excel_export_response, role_required
 from schedule.models import Schedule
 from students.forms import (
     BalanceForm,
@@ -20,13 +18,14 @@ from students.forms import (
     StudentForm,
     StudentScheduleForm,
 )
+from students.search import duplicates_as_dicts, find_duplicates
 from .models import Balance, Payment, Student, Squad, StudentSchedule
 
 logger = logging.getLogger(__name__)
 
 
 def student_list(request):
-    students = Student.objects.all()
+    students = Student.objects.with_schedules()
 
     # Фильтрация по доступным сменам
     if request.user.role in ["camp_head", "lab_head"]:
@@ -105,35 +104,21 @@ def student_delete(request, pk):
 @role_required(["manager", "admin", "camp_head", "lab_head"])
 def student_export_excel(request):
     # Экспорт базовых данных + список смен
-    students = Student.objects.all()
+    students = Student.objects.with_schedules()
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Ученики"
-
-    ws.append(["ФИО", "Телефон", "Родитель", "Смены"])
-
-    for student in students:
-        schedules_str = ", ".join(str(s) for s in student.schedules.all())
-        ws.append(
-            [
+    def rows():
+        for student in students.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            schedules_str = ", ".join(str(s) for s in student.schedules.all())
+            yield [
                 student.full_name,
                 student.phone,
                 student.parent_name,
                 schedules_str,
             ]
-        )
 
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
-    response = HttpResponse(
-        buffer,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    return excel_export_response(
+        "students.xlsx", "Ученики", ["ФИО", "Телефон", "Родитель", "Смены"], rows()
     )
-    response["Content-Disposition"] = "attachment; filename=students.xlsx"
-    return response
 
 
 @role_required(["manager", "admin", "camp_head", "lab_head"])
@@ -141,18 +126,12 @@ def student_export_pdf(request):
     """
     Выгрузка списка учеников в формате PDF (базовые данные).
     """
-    students = Student.objects.all()
+    students = Student.objects.with_schedules()
 
     html_string = render_to_string(
         "students/student_pdf_template.html", {"students": students}
     )
-    html = HTML(string=html_string)
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = "inline; filename=students.pdf"
-    html.write_pdf(response)
-
-    return response
+    return pdf_response(html_string, "students.pdf")
 
 
 @require_POST
@@ -168,26 +147,19 @@ def student_create_ajax(request):
 
         # Проверка дубликатов (только если не принудительное создание)
         if not force_create:
-            full_name = data.get("full_name", "").strip()
-            if full_name:
-                duplicates = Student.objects.filter(full_name__iexact=full_name)
-                if duplicates.exists():
-                    dup_list = [
-                        {
-                            "id": d.id,
-                            "full_name": d.full_name,
-                            "phone": d.phone,
-                            "parent_name": d.parent_name,
-                        }
-                        for d in duplicates
-                    ]
-                    return JsonResponse(
-                        {
-                            "success": False,
-                            "duplicates": dup_list,
-                            "message": "Найдены ученики с таким же ФИО, рекомендуется выбрать ученика из списка существующих. Создать нового всё равно?",
-                        }
-                    )
+            duplicates = find_duplicates(
+                data.get("full_name") or "",
+                data.get("phone") or "",
+                data.get("parent_name") or "",
+            )
+            if duplicates:
+                return JsonResponse(
+                    {
+                        "success": False,
+                        "duplicates": duplicates_as_dicts(duplicates),
+                        "message": "Найдены похожие ученики (совпадает ФИО или телефон с именем родителя), рекомендуется выбрать ученика из списка существующих. Создать нового всё равно?",
+                    }
+                )
 
         # Проверка прав на смену, если она указана
         schedule = None
@@ -474,6 +446,7 @@ def delete_payment(request, student_id, payment_id):
     payment.delete()
 
     total_paid = student.get_total_paid_for_schedule(payment.schedule)
+    student.refresh_from_db(fields=["balance"])
     current_balance = student.current_balance
 
     return JsonResponse(